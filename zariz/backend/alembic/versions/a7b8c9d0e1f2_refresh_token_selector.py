@@ -0,0 +1,26 @@
+"""refresh token selector
+
+Revision ID: a7b8c9d0e1f2
+Revises: f6a7b8c9d0e1
+Create Date: 2025-11-06 10:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'a7b8c9d0e1f2'
+down_revision = 'f6a7b8c9d0e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing sessions keep a NULL selector and are matched by the legacy scan until they expire
+    op.add_column('user_sessions', sa.Column('selector', sa.String(length=32), nullable=True))
+    op.create_index('ix_user_sessions_selector', 'user_sessions', ['selector'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_sessions_selector', table_name='user_sessions')
+    op.drop_column('user_sessions', 'selector')
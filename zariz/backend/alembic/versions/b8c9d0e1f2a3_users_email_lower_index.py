@@ -0,0 +1,24 @@
+"""users lower(email) index
+
+Revision ID: b8c9d0e1f2a3
+Revises: a7b8c9d0e1f2
+Create Date: 2025-11-06 15:40:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'b8c9d0e1f2a3'
+down_revision = 'a7b8c9d0e1f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Login matches email case-insensitively in the same query as phone
+    op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_email_lower', table_name='users')
@@ -0,0 +1,36 @@
+"""session and idempotency gc
+
+Revision ID: c9d0e1f2a3b4
+Revises: b8c9d0e1f2a3
+Create Date: 2025-11-07 09:15:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'c9d0e1f2a3b4'
+down_revision = 'b8c9d0e1f2a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The server default backfills existing keys with "now": they are purged one TTL after deploy
+    op.add_column(
+        'idempotency_keys',
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+    op.create_index('ix_idempotency_keys_created_at', 'idempotency_keys', ['created_at'])
+    op.create_index(
+        'ix_user_sessions_active',
+        'user_sessions',
+        ['expires_at'],
+        postgresql_where=sa.text('revoked_at IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_sessions_active', table_name='user_sessions')
+    op.drop_index('ix_idempotency_keys_created_at', table_name='idempotency_keys')
+    op.drop_column('idempotency_keys', 'created_at')
@@ -0,0 +1,52 @@
+"""idempotency reservations
+
+Revision ID: d0e1f2a3b4c5
+Revises: c9d0e1f2a3b4
+Create Date: 2025-11-07 13:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'd0e1f2a3b4c5'
+down_revision = 'c9d0e1f2a3b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'idempotency_keys',
+        sa.Column('state', sa.String(length=16), nullable=False, server_default='completed'),
+    )
+    op.add_column('idempotency_keys', sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True))
+    # Existing responses keep the default replay window from now on
+    op.execute("UPDATE idempotency_keys SET expires_at = now() + interval '24 hours'")
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'])
+    op.alter_column('idempotency_keys', 'status_code', existing_type=sa.Integer(), nullable=True)
+    # Responses are stored as raw bytes (replayed without re-serializing)
+    op.alter_column(
+        'idempotency_keys',
+        'response_body',
+        existing_type=sa.Text(),
+        type_=sa.LargeBinary(),
+        nullable=True,
+        postgresql_using="convert_to(response_body, 'UTF8')",
+    )
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM idempotency_keys WHERE state <> 'completed'")
+    op.alter_column(
+        'idempotency_keys',
+        'response_body',
+        existing_type=sa.LargeBinary(),
+        type_=sa.Text(),
+        nullable=False,
+        postgresql_using="convert_from(response_body, 'UTF8')",
+    )
+    op.alter_column('idempotency_keys', 'status_code', existing_type=sa.Integer(), nullable=False)
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_column('idempotency_keys', 'expires_at')
+    op.drop_column('idempotency_keys', 'state')
@@ -0,0 +1,30 @@
+"""add event outbox
+
+Revision ID: d4e5f6a7b8c9
+Revises: rename_claimed_to_accepted
+Create Date: 2025-11-03 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'd4e5f6a7b8c9'
+down_revision = 'rename_claimed_to_accepted'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'event_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('event', sa.Text(), nullable=False),
+        sa.Column('push', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('event_outbox')
@@ -0,0 +1,34 @@
+"""rate limit buckets
+
+Revision ID: e1f2a3b4c5d6
+Revises: d0e1f2a3b4c5
+Create Date: 2025-11-10 11:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'e1f2a3b4c5d6'
+down_revision = 'd0e1f2a3b4c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'rate_limit_buckets',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('capacity', sa.Float(), nullable=False),
+        sa.Column('rate', sa.Float(), nullable=False),
+        sa.Column('tokens', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.Float(), nullable=False),
+        sa.Column('expires_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index('ix_rate_limit_buckets_expires_at', 'rate_limit_buckets', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_rate_limit_buckets_expires_at', table_name='rate_limit_buckets')
+    op.drop_table('rate_limit_buckets')
@@ -0,0 +1,25 @@
+"""push audience indexes
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2025-11-04 09:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'e5f6a7b8c9d0'
+down_revision = 'd4e5f6a7b8c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_devices_user_platform', 'devices', ['user_id', 'platform'])
+    op.create_index('ix_store_user_memberships_store_id', 'store_user_memberships', ['store_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_store_user_memberships_store_id', table_name='store_user_memberships')
+    op.drop_index('ix_devices_user_platform', table_name='devices')
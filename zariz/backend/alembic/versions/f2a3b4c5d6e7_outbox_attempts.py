@@ -0,0 +1,23 @@
+"""outbox push attempts
+
+Revision ID: f2a3b4c5d6e7
+Revises: e1f2a3b4c5d6
+Create Date: 2025-11-12 09:40:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'f2a3b4c5d6e7'
+down_revision = 'e1f2a3b4c5d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('event_outbox', sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('event_outbox', 'attempts')
@@ -1,17 +1,16 @@
 from __future__ import annotations
 
-import json
 from typing import Callable, Generator
 
 from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPBearer
-from jose import JWTError, jwt
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from ..core.config import settings
-from ..db.models.user_session import UserSession
+from ..core.tokens import TokenError, decode_token
 from ..db.session import get_sessionmaker
+from ..services.idempotency import IdempotentRequest, begin as begin_idempotent
+from ..services.sessions import session_is_valid
 from ..db.models.user import User
 from ..db.models.order import Order
 from ..db.models.store import Store
@@ -29,11 +28,24 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
-def get_current_identity(creds=Depends(bearer), db: Session = Depends(get_db)) -> dict:
+def get_session_factory() -> Callable[[], Session]:
+    """Session factory for streaming endpoints.
+
+    ``get_db`` is only closed after the response body has been sent, so a
+    stream holding it would keep a pooled connection for its whole lifetime.
+    """
+    return get_sessionmaker()
+
+
+def get_current_identity(request: Request, creds=Depends(bearer), db: Session = Depends(get_db)) -> dict:
     if creds is None:
         raise HTTPException(status_code=401, detail="Missing token")
+    # Claims are verified once per request, whichever dependency asks first
+    memo = getattr(request.state, "identity", None)
+    if memo is not None and memo[0] == creds.credentials:
+        return memo[1]
     try:
-        payload = jwt.decode(creds.credentials, settings.jwt_secret, algorithms=[settings.jwt_algo])
+        payload = decode_token(creds.credentials)
         role = payload.get("role")
         sub = payload.get("sub")
         store_ids = payload.get("store_ids")
@@ -43,16 +55,15 @@ def get_current_identity(creds=Depends(bearer), db: Session = Depends(get_db)) -
         # If session_id is present, verify session is active (not revoked, not expired)
         if session_id is not None:
             try:
-                sid = int(session_id)
-                s = db.get(UserSession, sid)
-                from datetime import datetime, timezone
-
-                if s is None or s.revoked_at is not None or (s.expires_at and s.expires_at < datetime.now(timezone.utc)):
-                    raise HTTPException(status_code=401, detail="Session expired")
+                valid = session_is_valid(db, int(session_id))
             except Exception:
                 raise HTTPException(status_code=401, detail="Invalid session")
-        return {"sub": sub, "role": role, "store_ids": store_ids, "session_id": session_id}
-    except JWTError:
+            if not valid:
+                raise HTTPException(status_code=401, detail="Session expired")
+        identity = {"sub": sub, "role": role, "store_ids": store_ids, "session_id": session_id}
+        request.state.identity = (creds.credentials, identity)
+        return identity
+    except TokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
@@ -68,36 +79,34 @@ def maybe_current_identity(creds=Depends(bearer)) -> dict | None:
     if creds is None:
         return None
     try:
-        payload = jwt.decode(creds.credentials, settings.jwt_secret, algorithms=[settings.jwt_algo])
+        payload = decode_token(creds.credentials)
         role = payload.get("role")
         sub = payload.get("sub")
         store_ids = payload.get("store_ids")
         if not role or not sub:
             return None
         return {"sub": sub, "role": role, "store_ids": store_ids}
-    except JWTError:
+    except TokenError:
         return None
 
 
-# Simple idempotency model and helpers (stored per key)
-from ..db.models.idempotency import IdempotencyKey
+def idempotency(request: Request, db: Session = Depends(get_db)) -> Generator[IdempotentRequest | None, None, None]:
+    """Claim the request's ``Idempotency-Key`` (None without one); see ``services.idempotency``.
 
-
-def find_idempotency(db: Session, key: str, method: str, path: str) -> IdempotencyKey | None:
-    """Return idempotency record if key matches same method+path.
-
-    If the key exists but for a different method or path, return an HTTP 409.
-    This prevents cross-endpoint reuse of the same idempotency key.
+    Declare it after the auth dependency so unauthenticated requests never
+    reserve keys.
     """
-    rec = db.get(IdempotencyKey, key)
-    if rec is None:
-        return None
-    if rec.method == method and rec.path == path:
-        return rec
-    raise HTTPException(status_code=409, detail="Idempotency-Key reused for different request")
-
-
-def save_idempotency(db: Session, key: str, method: str, path: str, status_code: int, body: dict) -> None:
-    rec = IdempotencyKey(key=key, method=method, path=path, status_code=status_code, response_body=json.dumps(body))
-    db.merge(rec)
-    db.commit()
+    key = request.headers.get("Idempotency-Key")
+    if not key:
+        yield None
+        return
+    req = begin_idempotent(db, key, request.method, request.url.path)
+    if req.replay is not None:
+        yield req
+        return
+    try:
+        yield req
+    except BaseException:
+        req.release()
+        raise
+    req.finish()
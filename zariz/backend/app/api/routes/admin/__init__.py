@@ -1,7 +1,7 @@
 from fastapi import APIRouter
-from . import stores, couriers
+from . import stores, couriers, debug
 
 admin_router = APIRouter(prefix="/admin", tags=["admin"])
 admin_router.include_router(stores.router, prefix="/stores")
 admin_router.include_router(couriers.router, prefix="/couriers")
-
+admin_router.include_router(debug.router, prefix="/debug")
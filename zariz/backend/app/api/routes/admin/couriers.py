@@ -5,7 +5,7 @@ from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from ...deps import get_db, require_role
-from ....core.security import hash_password
+from ....core.hashing import password_hasher
 from ....db.models.user import User
 from ...schemas import CourierCreate, CourierUpdate, CredentialsChange, StatusChange
 
@@ -49,7 +49,7 @@ def create_courier(payload: CourierCreate, db: Session = Depends(get_db), identi
         phone=payload.phone or "",
         email=payload.email,
         capacity_boxes=payload.capacity_boxes or 8,
-        password_hash=hash_password(payload.password) if hasattr(payload, "password") and getattr(payload, "password") else "!",
+        password_hash=password_hasher.hash_sync(payload.password) if hasattr(payload, "password") and getattr(payload, "password") else "!",
     )
     db.add(u)
     db.commit()
@@ -110,7 +110,7 @@ def set_courier_credentials(user_id: int, payload: CredentialsChange, db: Sessio
                 raise HTTPException(status_code=409, detail="phone already in use")
         u.phone = payload.phone or ""
     if payload.password:
-        u.password_hash = hash_password(payload.password)
+        u.password_hash = password_hasher.hash_sync(payload.password)
     db.commit()
     return {"ok": True}
 
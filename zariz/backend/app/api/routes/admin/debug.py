@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from ...deps import get_current_identity, require_role
+from ....core.config import settings
+from ....core.profiling import ProfilerBusy, SamplingProfiler, memory_tracker, profile_token, request_profiles
+
+
+def _profiling_enabled() -> None:
+    if not settings.profiling_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+# Off unless PROFILING_ENABLED=1, and left out of the OpenAPI schema
+router = APIRouter(include_in_schema=False, dependencies=[Depends(_profiling_enabled), Depends(require_role("admin"))])
+
+
+@router.get("/cpu", response_class=PlainTextResponse)
+async def cpu_profile(
+    seconds: float = Query(default=10, gt=0, le=60),
+    interval_ms: float = Query(default=5, ge=1, le=100),
+):
+    """Sample this worker for ``seconds`` and return collapsed stacks (flamegraph.pl/speedscope)."""
+    try:
+        profiler = SamplingProfiler(interval_ms / 1000).start()
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        collapsed = profiler.stop()
+    return PlainTextResponse(collapsed)
+
+
+@router.post("/profile-token")
+def create_profile_token(ttl: int = Query(default=60, gt=0, le=300), identity: dict = Depends(get_current_identity)):
+    """A single-use ``X-Profile`` header value for requests made with the caller's own token.
+
+    Profiles are read back from ``/profiles/{request_id}``.
+    """
+    return {"header": "X-Profile", "value": profile_token(identity["sub"], ttl), "expires_in": ttl}
+
+
+@router.get("/profiles/{request_id}", response_class=PlainTextResponse)
+def get_request_profile(request_id: str):
+    collapsed = request_profiles.get(request_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="No profile for this request")
+    return PlainTextResponse(collapsed)
+
+
+@router.post("/memory/start")
+def memory_start(frames: int = Query(default=10, ge=1, le=100)):
+    """Start tracemalloc (slows allocations down until stopped)."""
+    memory_tracker.start(frames)
+    return {"tracing": True}
+
+
+@router.get("/memory")
+def memory_snapshot(top: int = Query(default=25, ge=1, le=200)):
+    """Top allocation sites, and the change since the previous snapshot."""
+    if not memory_tracker.tracing:
+        raise HTTPException(status_code=409, detail="tracemalloc is not running; POST /memory/start first")
+    return memory_tracker.snapshot(top)
+
+
+@router.post("/memory/stop")
+def memory_stop():
+    memory_tracker.stop()
+    return {"tracing": False}
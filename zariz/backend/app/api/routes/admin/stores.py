@@ -5,10 +5,11 @@ from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from ...deps import get_db, require_role
-from ....core.security import hash_password
+from ....core.hashing import password_hasher
 from ....db.models.store import Store
 from ....db.models.user import User
 from ....db.models.store_user_membership import StoreUserMembership
+from ....services import memberships
 from ...schemas import StoreCreate, StoreUpdate, CredentialsChange, StatusChange
 
 
@@ -118,7 +119,7 @@ def set_store_credentials(
             if existing:
                 raise HTTPException(status_code=409, detail="phone already in use")
         if payload.password:
-            user.password_hash = hash_password(payload.password)
+            user.password_hash = password_hasher.hash_sync(payload.password)
         db.add(user)
         db.flush()
         db.add(StoreUserMembership(user_id=user.id, store_id=s.id, role_in_store="owner", is_primary=True))
@@ -138,8 +139,9 @@ def set_store_credentials(
                     raise HTTPException(status_code=409, detail="phone already in use")
             user.phone = payload.phone or ""
         if payload.password:
-            user.password_hash = hash_password(payload.password)
+            user.password_hash = password_hasher.hash_sync(payload.password)
     db.commit()
+    memberships.invalidate()
     return {"ok": True}
 
 
@@ -1,73 +1,123 @@
 import logging
 from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy import select
+from sqlalchemy import func, or_, select
 from sqlalchemy.orm import Session
-from ...core.security import create_access_token, generate_refresh_token, hash_password, verify_password
+from starlette.concurrency import run_in_threadpool
+from ...core import metrics
+from ...core.config import settings
+from ...core.hashing import password_hasher
+from ...core.security import (
+    create_access_token,
+    new_refresh_token,
+    split_refresh_token,
+    verify_refresh_verifier,
+)
 from ...core.limits import limiter
 from ..deps import get_db
 from ..schemas import AuthLogin, TokenResponse, AuthLoginRequest, AuthTokenPair, RefreshTokenRequest
 from ...db.models.user import User
 from ...db.models.user_session import UserSession
-from ...db.models.store_user_membership import StoreUserMembership
+from ...services.memberships import store_ids_for
+from ...services.sessions import revoke_session
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 _log = logging.getLogger("app")
 
-try:
-    from prometheus_client import Counter
+LOGIN_SUCCESS = metrics.counter("auth_login_success_total", "Total successful logins")
+LOGIN_FAILURE = metrics.counter("auth_login_failure_total", "Total failed logins")
 
-    LOGIN_SUCCESS = Counter("auth_login_success_total", "Total successful logins")
-    LOGIN_FAILURE = Counter("auth_login_failure_total", "Total failed logins")
-except Exception:
-    class _Noop:
-        def inc(self):
-            pass
 
-    LOGIN_SUCCESS = _Noop()
-    LOGIN_FAILURE = _Noop()
+def _find_session(db: Session, raw: str) -> tuple[UserSession, User] | None:
+    """Non-revoked session (and its user) for a refresh token, via one indexed selector lookup.
+
+    Legacy opaque tokens (issued before selectors) fall back to checking the
+    password hash of selector-less sessions only; that set empties as they
+    rotate or expire, and the fallback can be switched off with
+    ``LEGACY_REFRESH_TOKENS=0``.
+    """
+    parts = split_refresh_token(raw)
+    if parts is not None:
+        selector, verifier = parts
+        row = db.execute(
+            select(UserSession, User)
+            .join(User, User.id == UserSession.user_id)
+            .where(UserSession.selector == selector, UserSession.revoked_at == None)  # noqa: E711
+        ).first()
+        if row is not None and verify_refresh_verifier(verifier, row[0].refresh_token_hash):
+            return row[0], row[1]
+        return None
+    if not raw or not settings.legacy_refresh_tokens:
+        return None
+    legacy = db.execute(
+        select(UserSession, User)
+        .join(User, User.id == UserSession.user_id)
+        .where(
+            UserSession.selector == None,  # noqa: E711
+            UserSession.revoked_at == None,  # noqa: E711
+            UserSession.expires_at > datetime.now(timezone.utc),
+        )
+    ).all()
+    for session, user in legacy:
+        if password_hasher.verify_sync(raw, session.refresh_token_hash):
+            return session, user
+    return None
 
 
 @limiter.limit("5/minute")
 @router.post("/login_password", response_model=AuthTokenPair)
-def login_password(
+async def login_password(
     payload: AuthLoginRequest,
     request: Request,
     db: Session = Depends(get_db),
 ):
+    # Async so the password check waits on the hashing pool, not a Starlette thread;
+    # the (short) DB work still runs in the threadpool.
     identifier = (payload.identifier or "").strip()
     pwd = payload.password or ""
-    user = None
-    # Try email match (lowercased) regardless of '@'
-    if identifier:
-        user = db.execute(select(User).where(User.email == identifier.lower())).scalars().first()
-    if user is None and identifier:
-        # Try phone as-is
-        user = db.execute(select(User).where(User.phone == identifier)).scalars().first()
+    user = await run_in_threadpool(_find_login_user, db, identifier)
     ip = request.client.host if request and request.client else "?"
-    if user is None or user.status != "active" or not verify_password(pwd, user.password_hash or "!"):
+    ok, new_hash = False, None
+    if user is not None and user.status == "active":
+        ok, new_hash = await password_hasher.verify_and_update(pwd, user.password_hash or "!")
+    if not ok:
         _log.info(
             "{\"event\":\"auth.login\",\"result\":\"failure\",\"ip_hash\":\"%s\"}" % (hash(ip) % 100000),
         )
         LOGIN_FAILURE.inc()
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    return await run_in_threadpool(_issue_login_tokens, db, user, new_hash)
+
+
+def _find_login_user(db: Session, identifier: str) -> User | None:
+    if not identifier:
+        return None
+    # Email (case-insensitive, via ix_users_email_lower) or phone as-is, in one query
+    email = identifier.lower()
+    users = db.execute(
+        select(User).where(or_(func.lower(User.email) == email, User.phone == identifier)).limit(2)
+    ).scalars().all()
+    # An email match wins over another account's phone, as before
+    return next((u for u in users if (u.email or "").lower() == email), users[0] if users else None)
+
 
-    # Resolve store_ids via memberships
-    stores = db.execute(select(StoreUserMembership.store_id).where(StoreUserMembership.user_id == user.id)).scalars().all()
-    store_ids = list(stores)
-    if not store_ids and user.default_store_id:
-        store_ids = [int(user.default_store_id)]
+def _issue_login_tokens(db: Session, user: User, new_hash: str | None = None) -> AuthTokenPair:
+    if new_hash:
+        # Outdated scheme or cost: upgrade while we have the plaintext
+        user.password_hash = new_hash
+    store_ids = store_ids_for(db, user)
 
     # Issue refresh session
-    refresh_raw = generate_refresh_token()
+    refresh_raw, selector, verifier_hash = new_refresh_token()
     expires_at = datetime.now(timezone.utc) + timedelta(days=14)
-    session = UserSession(user_id=user.id, refresh_token_hash=hash_password(refresh_raw), expires_at=expires_at)
+    session = UserSession(user_id=user.id, selector=selector, refresh_token_hash=verifier_hash, expires_at=expires_at)
     db.add(session)
     # Update last_login_at
     user.last_login_at = datetime.now(timezone.utc)
-    db.commit()
-    # Create access token
+    # Build the token before commit: reading attributes afterwards would reload them
+    db.flush()
     access = create_access_token(sub=str(user.id), role=user.role, store_ids=store_ids, session_id=str(session.id))
+    db.commit()
     LOGIN_SUCCESS.inc()
     return AuthTokenPair(access_token=access, refresh_token=refresh_raw)
 
@@ -75,17 +125,11 @@ def login_password(
 @router.post("/refresh", response_model=AuthTokenPair)
 def refresh_token(payload: RefreshTokenRequest, db: Session = Depends(get_db)):
     raw = payload.refresh_token or ""
-    # Find session by hash
-    # Caution: without argon2 we cannot verify against all rows efficiently; fetch all non-revoked sessions for simplicity (MVP scale)
-    sessions = db.execute(select(UserSession).where(UserSession.revoked_at == None)).scalars().all()  # noqa: E711
-    matched = None
-    for s in sessions:
-        if verify_password(raw, s.refresh_token_hash):
-            matched = s
-            break
+    found = _find_session(db, raw)
     now_aware = datetime.now(timezone.utc)
-    if matched is None:
+    if found is None:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
+    matched, user = found
     exp = matched.expires_at
     # handle naive datetimes from SQLite vs aware from Postgres
     if exp.tzinfo is None:
@@ -95,32 +139,26 @@ def refresh_token(payload: RefreshTokenRequest, db: Session = Depends(get_db)):
     else:
         if exp < now_aware:
             raise HTTPException(status_code=401, detail="Invalid refresh token")
-    user = db.get(User, matched.user_id)
-    if user is None or user.status != "active":
+    if user.status != "active":
         raise HTTPException(status_code=401, detail="User inactive")
-    # Compute store_ids
-    stores = db.execute(select(StoreUserMembership.store_id).where(StoreUserMembership.user_id == user.id)).scalars().all()
-    store_ids = list(stores)
-    if not store_ids and user.default_store_id:
-        store_ids = [int(user.default_store_id)]
+    store_ids = store_ids_for(db, user)
     # Revoke old and issue new
-    matched.revoked_at = now_aware
-    refresh_raw = generate_refresh_token()
+    revoke_session(db, matched)
+    refresh_raw, selector, verifier_hash = new_refresh_token()
     expires_at = datetime.now(timezone.utc) + timedelta(days=14)
-    new_session = UserSession(user_id=user.id, refresh_token_hash=hash_password(refresh_raw), expires_at=expires_at)
+    new_session = UserSession(user_id=user.id, selector=selector, refresh_token_hash=verifier_hash, expires_at=expires_at)
     db.add(new_session)
-    db.commit()
+    db.flush()
     access = create_access_token(sub=str(user.id), role=user.role, store_ids=store_ids, session_id=str(new_session.id))
+    db.commit()
     return AuthTokenPair(access_token=access, refresh_token=refresh_raw)
 
 
 @router.post("/logout")
 def logout(payload: RefreshTokenRequest, db: Session = Depends(get_db)):
     raw = payload.refresh_token or ""
-    sessions = db.execute(select(UserSession).where(UserSession.revoked_at == None)).scalars().all()  # noqa: E711
-    for s in sessions:
-        if verify_password(raw, s.refresh_token_hash):
-            s.revoked_at = datetime.now(timezone.utc)
-            db.commit()
-            return {"ok": True}
+    found = _find_session(db, raw)
+    if found is not None:
+        revoke_session(db, found[0])
+        db.commit()
     return {"ok": True}
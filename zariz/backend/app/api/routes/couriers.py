@@ -20,17 +20,20 @@ def list_couriers(
     db: Session = Depends(get_db),
     identity: dict = Depends(require_role("admin")),
 ):
-    couriers = db.execute(select(User).where(User.role == "courier")).scalars().all()
+    # Active load of every courier in one grouped query instead of one per courier
+    load_q = (
+        select(Order.courier_id, func.coalesce(func.sum(Order.boxes_count), 0).label("load"))
+        .where(Order.status.in_(["claimed", "picked_up"]))
+        .group_by(Order.courier_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(User, func.coalesce(load_q.c.load, 0))
+        .outerjoin(load_q, load_q.c.courier_id == User.id)
+        .where(User.role == "courier")
+    ).all()
     out: list[dict] = []
-    for u in couriers:
-        load = (
-            db.execute(
-                select(func.coalesce(func.sum(Order.boxes_count), 0)).where(
-                    Order.courier_id == u.id, Order.status.in_(["claimed", "picked_up"])
-                )
-            ).scalar()
-            or 0
-        )
+    for u, load in rows:
         cap = u.capacity_boxes or 8
         avail = max(0, cap - int(load))
         if available_only and avail <= 0:
@@ -1,39 +1,73 @@
 from __future__ import annotations
 
 import asyncio
-from typing import AsyncGenerator, Optional
+import json
+import random
+from typing import Any, AsyncGenerator, Callable, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
-from jose import JWTError, jwt
+from sqlalchemy.orm import Session
 
+from ..deps import get_session_factory
 from ...core.config import settings
-from ...services.events import events_bus
+from ...core.tokens import TokenError, decode_token
+from ...services.events import EventFrame, events_bus, msgpack
+from ...services.snapshots import compute_snapshot, snapshot_cache, snapshot_scope
 
 
 router = APIRouter(prefix="/events", tags=["events"])
 
 
+STREAM_ROLES = ("admin", "store", "courier")
+TOPIC_PREFIXES = ("order:", "store:", "courier:")
+
+
 def get_identity_from_token(token: Optional[str] = Query(None)) -> dict:
     """Extract identity from query parameter token for SSE (EventSource doesn't support headers)."""
     if not token:
         raise HTTPException(status_code=401, detail="Missing token")
     try:
-        payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algo])
+        payload = decode_token(token)
         role = payload.get("role")
         sub = payload.get("sub")
         if not role or not sub:
             raise HTTPException(status_code=401, detail="Invalid token")
         return {"role": role, "sub": sub, "store_ids": payload.get("store_ids")}
-    except JWTError:
+    except TokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
-async def _event_stream(once: bool) -> AsyncGenerator[bytes, None]:
+def _parse_topics(raw: Any) -> set[str]:
+    """Validate client-supplied topics: ``orders`` or ``order:|store:|courier:<id>``."""
+    if isinstance(raw, str):
+        raw = [t for t in raw.split(",") if t]
+    if not isinstance(raw, list):
+        raise ValueError("topics must be a list")
+    topics: set[str] = set()
+    for t in raw:
+        if not isinstance(t, str):
+            raise ValueError("topic must be a string")
+        if t == "orders" or (t.startswith(TOPIC_PREFIXES) and t.split(":", 1)[1].isdigit()):
+            topics.add(t)
+        else:
+            raise ValueError(f"invalid topic: {t}")
+    return topics
+
+
+def _retry_hint() -> bytes:
+    # Spread reconnects (e.g. after a deploy) over a window instead of all at once
+    retry_ms = settings.sse_retry_ms + random.randint(0, max(0, settings.sse_retry_jitter_ms))
+    return f"retry: {retry_ms}\n".encode("utf-8")
+
+
+async def _event_stream(once: bool, snapshot: Optional[str] = None) -> AsyncGenerator[bytes, None]:
     q = events_bus.subscribe()
     try:
-        # Send initial comment to establish the stream
-        yield b":ok\n\n"
+        # Send reconnect hint and initial comment to establish the stream
+        yield _retry_hint() + b":ok\n\n"
+        if snapshot is not None:
+            yield f"event: snapshot\ndata: {snapshot}\n\n".encode("utf-8")
         if once:
             return
         while True:
@@ -50,20 +84,38 @@ async def _event_stream(once: bool) -> AsyncGenerator[bytes, None]:
 @router.get("/sse")
 async def sse(
     once: bool = False,
-    identity: dict = Depends(get_identity_from_token)
+    snapshot: bool = False,
+    identity: dict = Depends(get_identity_from_token),
+    session_factory: Callable[[], Session] = Depends(get_session_factory),
 ) -> StreamingResponse:
     """Server-Sent Events stream for real-time order updates.
     
     Requires authentication via query parameter token (EventSource doesn't support headers).
     Admin users receive all events. Store/courier users receive filtered events (future).
+    With ``snapshot=1`` the first event (``event: snapshot``) lists the caller's active
+    orders, served from a short-TTL cache shared by all connections in the same scope.
     """
     # Verify role
     role = identity.get("role")
-    if role not in ("admin", "store", "courier"):
+    if role not in STREAM_ROLES:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
-    
+
+    snapshot_data = None
+    if snapshot:
+        try:
+            scope = snapshot_scope(identity)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid token subject")
+
+        def compute():
+            # Short-lived session: the connection is back in the pool before streaming starts
+            with session_factory() as db:
+                return compute_snapshot(db, scope)
+
+        snapshot_data = await snapshot_cache.get(scope, compute)
+
     return StreamingResponse(
-        _event_stream(once),
+        _event_stream(once, snapshot_data),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -71,3 +123,116 @@ async def sse(
             "X-Accel-Buffering": "no",  # Disable Nginx buffering
         },
     )
+
+
+class _WSCodec:
+    """Frame codec for the WebSocket stream: JSON text frames or MessagePack binary frames."""
+
+    def __init__(self, encoding: str) -> None:
+        self.binary = encoding == "msgpack"
+
+    async def send_frame(self, ws: WebSocket, frame: EventFrame) -> None:
+        if self.binary:
+            await ws.send_bytes(frame.packed)
+        else:
+            await ws.send_text(frame)
+
+    async def send_control(self, ws: WebSocket, msg: dict) -> None:
+        if self.binary:
+            await ws.send_bytes(msgpack.packb(msg, use_bin_type=True))
+        else:
+            await ws.send_text(json.dumps(msg))
+
+    @staticmethod
+    def decode(message: dict) -> Any:
+        # Clients may send either JSON text or MessagePack binary commands
+        if message.get("bytes") is not None:
+            if msgpack is None:
+                raise ValueError("binary frames require msgpack")
+            return msgpack.unpackb(message["bytes"], raw=False)
+        return json.loads(message.get("text") or "")
+
+
+async def _ws_commands(ws: WebSocket, q: asyncio.Queue, codec: _WSCodec) -> None:
+    """Handle client commands: subscribe/unsubscribe topics and ping."""
+    while True:
+        message = await ws.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        try:
+            cmd = codec.decode(message)
+            if not isinstance(cmd, dict):
+                raise ValueError("command must be an object")
+            op = cmd.get("op")
+            if op == "ping":
+                await codec.send_control(ws, {"op": "pong"})
+                continue
+            if op not in ("subscribe", "unsubscribe"):
+                raise ValueError(f"unknown op: {op}")
+            requested = _parse_topics(cmd.get("topics", []))
+            current = events_bus.topics_of(q) or set()
+            topics = current | requested if op == "subscribe" else current - requested
+            events_bus.set_topics(q, topics)
+            await codec.send_control(ws, {"op": "topics", "topics": sorted(topics)})
+        except ValueError as exc:
+            await codec.send_control(ws, {"op": "error", "detail": str(exc)})
+
+
+async def _ws_forward(ws: WebSocket, q: asyncio.Queue, codec: _WSCodec) -> None:
+    while True:
+        frame: EventFrame = await q.get()
+        await codec.send_frame(ws, frame)
+
+
+@router.websocket("/ws")
+async def ws(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+    encoding: str = Query("json"),
+    topics: Optional[str] = Query(None),
+) -> None:
+    """WebSocket stream over the same event bus as ``/sse``.
+
+    Authenticates via query parameter token. Events are sent as JSON text frames,
+    or MessagePack binary frames with ``encoding=msgpack``. Without ``topics`` the
+    socket receives every event; clients narrow it with ``{"op": "subscribe", "topics": [...]}``
+    / ``{"op": "unsubscribe", ...}`` and may send ``{"op": "ping"}``.
+    """
+    try:
+        identity = get_identity_from_token(token)
+    except HTTPException:
+        await websocket.close(code=4401)
+        return
+    if identity.get("role") not in STREAM_ROLES:
+        await websocket.close(code=4403)
+        return
+    if encoding not in ("json", "msgpack") or (encoding == "msgpack" and msgpack is None):
+        await websocket.close(code=1003)
+        return
+    try:
+        initial = _parse_topics(topics) if topics is not None else None
+    except ValueError:
+        await websocket.close(code=1003)
+        return
+
+    await websocket.accept()
+    codec = _WSCodec(encoding)
+    q = events_bus.subscribe(initial)
+    tasks = [
+        asyncio.create_task(_ws_commands(websocket, q, codec)),
+        asyncio.create_task(_ws_forward(websocket, q, codec)),
+    ]
+    try:
+        await codec.send_control(
+            websocket, {"op": "ready", "topics": sorted(initial) if initial is not None else None}
+        )
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for t in done:
+            if not t.cancelled() and t.exception() and not isinstance(t.exception(), WebSocketDisconnect):
+                raise t.exception()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for t in tasks:
+            t.cancel()
+        events_bus.unsubscribe(q)
@@ -6,15 +6,15 @@ from sqlalchemy import select, text, func
 from sqlalchemy.orm import Session
 
 from ..schemas import OrderCreate, OrderRead, StatusUpdate
-from ..deps import get_db, require_role, find_idempotency, save_idempotency
+from ..deps import get_db, idempotency, require_role
 from ...core.limits import limiter
 from ...db.models.order import Order
 from ...db.models.order_event import OrderEvent
 from ...db.models.user import User
-from ...db.models.device import Device
 from ...db.models.store import Store
-from ...services.events import events_bus
-from ...worker.push import send_silent
+from ...services import outbox
+from ...services.idempotency import IdempotentRequest
+from ...services.outbox import outbox_dispatcher
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
@@ -130,18 +130,11 @@ def create_order(
     payload: OrderCreate,
     db: Session = Depends(get_db),
     identity: dict = Depends(require_role("store", "admin")),
+    idem: IdempotentRequest | None = Depends(idempotency),
     request: Request = None,
 ):
-    # Simple idempotency handling (if key present)
-    idem = request.headers.get("Idempotency-Key") if request else None
-    if idem:
-        existing = find_idempotency(db, idem, request.method, request.url.path)
-        if existing and existing.status_code == 200:
-            # Return cached body
-            from fastapi.responses import JSONResponse
-            import json as _json
-
-            return JSONResponse(status_code=existing.status_code, content=_json.loads(existing.response_body))
+    if idem and idem.replay is not None:
+        return idem.replay
 
     store_id = payload.store_id
     role = identity.get("role")
@@ -187,10 +180,11 @@ def create_order(
     )
     db.add(o)
     db.flush()
+    # created_at is a server default; load it before the event is staged
+    db.refresh(o, ["created_at"])
     ev = OrderEvent(order_id=o.id, type="created")
     db.add(ev)
-    db.commit()
-    # Emit event (SSE) and silent push with order details
+    # Emit event (SSE) and silent push with order details via the outbox
     event_data = {
         "type": "order.created",
         "order_id": o.id,
@@ -201,21 +195,12 @@ def create_order(
         "price_total": o.price_total,
         "created_at": o.created_at.isoformat() if o.created_at else None,
     }
-    events_bus.publish(event_data)
-    # Push to all devices (MVP); refine targeting later
-    try:
-        tokens = (
-            db.query(Device.token)
-            .join(User, Device.user_id == User.id, isouter=True)
-            .filter(Device.platform == "ios")
-            .filter((Device.user_id == None) | (User.role == "courier"))
-            .all()
-        )
-        for (token,) in tokens:
-            send_silent(token, {"type": "order.created", "order_id": o.id})
-    except Exception:
-        # Don't fail API on push errors
-        pass
+    # Push to the store's members and admins
+    outbox.enqueue(
+        db,
+        event_data,
+        push=outbox.order_push(o.id, o.store_id, None, {"type": "order.created", "order_id": o.id}),
+    )
     result = OrderRead(
         id=o.id,
         store_id=o.store_id,
@@ -236,7 +221,10 @@ def create_order(
         created_at=o.created_at.isoformat() if getattr(o, "created_at", None) else None,
     )
     if idem:
-        save_idempotency(db, idem, request.method, request.url.path, 200, result.model_dump())
+        # Stored in the same transaction as the order
+        idem.complete(200, result.model_dump())
+    db.commit()
+    outbox_dispatcher.notify()
     return result
 
 
@@ -310,18 +298,10 @@ def assign_order(
     if o.status in {"new", "assigned"}:
         o.status = "assigned"
     db.add(OrderEvent(order_id=o.id, type="assigned"))
+    event = {"type": "order.assigned", "order_id": o.id, "courier_id": courier_id}
+    outbox.enqueue(db, event, push=outbox.order_push(o.id, o.store_id, courier_id, event))
     db.commit()
-    events_bus.publish({"type": "order.assigned", "order_id": o.id, "courier_id": courier_id})
-    try:
-        tokens = (
-            db.query(Device.token)
-            .filter(Device.user_id == courier_id, Device.platform == "ios")
-            .all()
-        )
-        for (token,) in tokens:
-            send_silent(token, {"type": "order.assigned", "order_id": o.id, "courier_id": courier_id})
-    except Exception:
-        pass
+    outbox_dispatcher.notify()
     return {"ok": True}
 
 
@@ -343,14 +323,10 @@ def cancel_order(
         raise HTTPException(status_code=400, detail="Cannot cancel delivered order")
     o.status = "canceled"
     db.add(OrderEvent(order_id=o.id, type="canceled"))
+    event = {"type": "order.status_changed", "order_id": o.id, "status": "canceled"}
+    outbox.enqueue(db, event, push=outbox.order_push(o.id, o.store_id, o.courier_id, event))
     db.commit()
-    events_bus.publish({"type": "order.status_changed", "order_id": o.id, "status": "canceled"})
-    try:
-        tokens = [t for (t,) in db.query(Device.token).filter(Device.platform == "ios").all()]
-        for t in tokens:
-            send_silent(t, {"type": "order.status_changed", "order_id": o.id, "status": "canceled"})
-    except Exception:
-        pass
+    outbox_dispatcher.notify()
     return {"ok": True}
 
 
@@ -367,16 +343,11 @@ def accept_order(
     order_id: int,
     db: Session = Depends(get_db),
     identity: dict = Depends(require_role("courier")),
+    idem: IdempotentRequest | None = Depends(idempotency),
     request: Request = None,
 ):
-    idem = request.headers.get("Idempotency-Key") if request else None
-    if idem:
-        existing = find_idempotency(db, idem, request.method, request.url.path)
-        if existing and existing.status_code == 200:
-            from fastapi.responses import JSONResponse
-            import json as _json
-
-            return JSONResponse(status_code=existing.status_code, content=_json.loads(existing.response_body))
+    if idem and idem.replay is not None:
+        return idem.replay
 
     courier_id = _parse_int(identity["sub"])
     if courier_id is None:
@@ -413,17 +384,18 @@ def accept_order(
         db.rollback()
         raise HTTPException(status_code=409, detail="Order not assigned to you or already accepted")
     db.add(OrderEvent(order_id=order_id, type="accepted"))
-    db.commit()
-    events_bus.publish({"type": "order.accepted", "order_id": order_id, "courier_id": courier_id})
-    try:
-        tokens = [t for (t,) in db.query(Device.token).filter(Device.platform == "ios").all()]
-        for t in tokens:
-            send_silent(t, {"type": "order.accepted", "order_id": order_id})
-    except Exception:
-        pass
+    outbox.enqueue(
+        db,
+        {"type": "order.accepted", "order_id": order_id, "courier_id": courier_id},
+        push=outbox.order_push(
+            order_id, o_target.store_id, courier_id, {"type": "order.accepted", "order_id": order_id}
+        ),
+    )
     out = {"ok": True}
     if idem:
-        save_idempotency(db, idem, request.method, request.url.path, 200, out)
+        idem.complete(200, out)
+    db.commit()
+    outbox_dispatcher.notify()
     return out
 
 
@@ -434,16 +406,11 @@ def update_status(
     payload: StatusUpdate,
     db: Session = Depends(get_db),
     identity: dict = Depends(require_role("courier")),
+    idem: IdempotentRequest | None = Depends(idempotency),
     request: Request = None,
 ):
-    idem = request.headers.get("Idempotency-Key") if request else None
-    if idem:
-        existing = find_idempotency(db, idem, request.method, request.url.path)
-        if existing and existing.status_code == 200:
-            from fastapi.responses import JSONResponse
-            import json as _json
-
-            return JSONResponse(status_code=existing.status_code, content=_json.loads(existing.response_body))
+    if idem and idem.replay is not None:
+        return idem.replay
 
     courier_id = _parse_int(identity["sub"])
     if courier_id is None:
@@ -470,18 +437,13 @@ def update_status(
     if o.courier_id is None:
         o.courier_id = courier_id
     db.add(OrderEvent(order_id=o.id, type=next_status))
-    db.commit()
-    events_bus.publish({"type": "order.status_changed", "order_id": o.id, "status": o.status})
-    try:
-        tokens = [t for (t,) in db.query(Device.token).filter(Device.platform == "ios").all()]
-        for t in tokens:
-            send_silent(t, {"type": "order.status_changed", "order_id": o.id, "status": o.status})
-    except Exception:
-        pass
-
-    out = {"ok": True, "status": o.status}
+    event = {"type": "order.status_changed", "order_id": o.id, "status": next_status}
+    outbox.enqueue(db, event, push=outbox.order_push(o.id, o.store_id, o.courier_id, event))
+    out = {"ok": True, "status": next_status}
     if idem:
-        save_idempotency(db, idem, request.method, request.url.path, 200, out)
+        idem.complete(200, out)
+    db.commit()
+    outbox_dispatcher.notify()
     return out
 
 
@@ -497,15 +459,11 @@ def delete_order(
     # Delete related order events first to satisfy FKs
     db.query(OrderEvent).filter(OrderEvent.order_id == order_id).delete()
     db.delete(o)
-    db.commit()
     # Emit event for realtime UIs
-    events_bus.publish({"type": "order.deleted", "order_id": order_id})
-    try:
-        tokens = [t for (t,) in db.query(Device.token).filter(Device.platform == "ios").all()]
-        for t in tokens:
-            send_silent(t, {"type": "order.deleted", "order_id": order_id})
-    except Exception:
-        pass
+    event = {"type": "order.deleted", "order_id": order_id}
+    outbox.enqueue(db, event, push=outbox.order_push(order_id, o.store_id, o.courier_id, event))
+    db.commit()
+    outbox_dispatcher.notify()
     return {"ok": True}
 
 
@@ -543,9 +501,9 @@ def update_order(
     o.price_total = price
     
     db.add(OrderEvent(order_id=o.id, type="updated"))
+    outbox.enqueue(db, {"type": "order.updated", "order_id": o.id})
     db.commit()
-    
-    events_bus.publish({"type": "order.updated", "order_id": o.id})
+    outbox_dispatcher.notify()
     
     return OrderRead(
         id=o.id,
@@ -587,12 +545,12 @@ def decline_order(
     o.status = "new"
     o.courier_id = None
     db.add(OrderEvent(order_id=o.id, type="assigned_declined"))
+    outbox.enqueue(
+        db,
+        {"type": "order.assigned_declined", "order_id": o.id, "courier_id": courier_id},
+        # The declining courier is no longer involved
+        push=outbox.order_push(o.id, o.store_id, None, {"type": "order.assigned_declined", "order_id": o.id}),
+    )
     db.commit()
-    events_bus.publish({"type": "order.assigned_declined", "order_id": o.id, "courier_id": courier_id})
-    try:
-        tokens = [t for (t,) in db.query(Device.token).all()]
-        for t in tokens:
-            send_silent(t, {"type": "order.assigned_declined", "order_id": o.id})
-    except Exception:
-        pass
+    outbox_dispatcher.notify()
     return {"ok": True}
@@ -10,6 +10,106 @@ class Settings(BaseModel):
     )
     jwt_secret: str = os.getenv("API_JWT_SECRET", "dev_secret_change_me")
     jwt_algo: str = "HS256"
+    # "native" (built-in HS256) or "jose"; non-HS256 algorithms always use jose
+    token_backend: str = os.getenv("TOKEN_BACKEND", "native")
+    # Verified access tokens kept until their exp (0 disables)
+    token_cache_size: int = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+    # HMAC key for refresh-token verifiers (defaults to the JWT secret)
+    refresh_token_key: str = os.getenv("REFRESH_TOKEN_KEY") or os.getenv("API_JWT_SECRET", "dev_secret_change_me")
+    # Accept pre-selector refresh tokens via the legacy hash scan until they expire
+    legacy_refresh_tokens: bool = os.getenv("LEGACY_REFRESH_TOKENS", "1").lower() not in {"0", "false", "no"}
+    # argon2 cost for new hashes (library defaults when unset; pick them once per host class with
+    # scripts/calibrate_password_hash.py). Stored hashes are only upgraded on login when weaker
+    # than the ARGON2_MIN_* floor (defaults: the cost for new hashes), not merely different
+    argon2_time_cost: int | None = int(os.getenv("ARGON2_TIME_COST", "0")) or None
+    argon2_memory_cost: int | None = int(os.getenv("ARGON2_MEMORY_COST", "0")) or None
+    argon2_parallelism: int | None = int(os.getenv("ARGON2_PARALLELISM", "0")) or None
+    argon2_min_time_cost: int | None = int(os.getenv("ARGON2_MIN_TIME_COST", "0")) or None
+    argon2_min_memory_cost: int | None = int(os.getenv("ARGON2_MIN_MEMORY_COST", "0")) or None
+    # Password hashing pool ("thread" or "process") and how many calls it admits before 503
+    hash_executor: str = os.getenv("HASH_EXECUTOR", "thread")
+    hash_workers: int = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+    hash_max_pending: int = int(os.getenv("HASH_MAX_PENDING", "32"))
+    # Periodic purge of dead sessions and stale idempotency keys (seconds between runs; 0 disables)
+    maintenance_interval: float = float(os.getenv("MAINTENANCE_INTERVAL", "3600"))
+    maintenance_batch_size: int = int(os.getenv("MAINTENANCE_BATCH_SIZE", "1000"))
+    # Expired/revoked sessions are kept this long (e.g. for audit) before deletion
+    session_retention_hours: float = float(os.getenv("SESSION_RETENTION_HOURS", "24"))
+    idempotency_ttl_hours: float = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+    # How long a reservation protects an in-flight request, how long a duplicate waits for it,
+    # and how many completed responses each worker keeps in memory
+    idempotency_lease_seconds: float = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "30"))
+    idempotency_wait_seconds: float = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "5"))
+    idempotency_cache_size: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "1000"))
+    # Per-worker cache of store memberships used when issuing tokens (seconds; 0 disables)
+    membership_cache_ttl: float = float(os.getenv("MEMBERSHIP_CACHE_TTL", "60"))
+    membership_cache_size: int = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "10000"))
+    # Per-worker cache of session validity for bearer tokens (seconds; 0 disables)
+    session_cache_ttl: float = float(os.getenv("SESSION_CACHE_TTL", "30"))
+    session_cache_size: int = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+    # Log records are written by a background thread from a queue of this size (0: write inline);
+    # records beyond it are dropped. Share of successful (<400) access-log lines to keep.
+    log_queue_size: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    log_access_sample_rate: float = float(os.getenv("LOG_ACCESS_SAMPLE_RATE", "1.0"))
+    # N+1 guards: max SQL statements per request and max executions of one statement
+    # shape (0 disables each); overruns are logged, or raised with SQL_STRICT=1 (tests)
+    sql_statement_budget: int = int(os.getenv("SQL_STATEMENT_BUDGET", "0"))
+    sql_repeat_budget: int = int(os.getenv("SQL_REPEAT_BUDGET", "0"))
+    sql_strict: bool = os.getenv("SQL_STRICT", "0").lower() in {"1", "true", "yes"}
+    # Log statements slower than this (ms; 0 disables) and capture the plan of each new
+    # fingerprint at most once per SLOW_QUERY_EXPLAIN_INTERVAL seconds
+    slow_query_ms: float = float(os.getenv("SLOW_QUERY_MS", "200"))
+    slow_query_explain: bool = os.getenv("SLOW_QUERY_EXPLAIN", "1").lower() not in {"0", "false", "no"}
+    slow_query_explain_interval: float = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "3600"))
+    # Send Server-Timing (DB time and statement count) with every response
+    server_timing: bool = os.getenv("SERVER_TIMING", "1").lower() not in {"0", "false", "no"}
+    # Admin profiling endpoints and the signed X-Profile request header (off by default);
+    # the header is signed with PROFILING_KEY (defaults to the JWT secret)
+    profiling_enabled: bool = os.getenv("PROFILING_ENABLED", "0").lower() in {"1", "true", "yes"}
+    profiling_key: str | None = os.getenv("PROFILING_KEY") or None
+    profiling_interval_ms: float = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+    # Longest an X-Profile request is sampled (sampling also stops when its response starts)
+    profiling_request_max_seconds: float = float(os.getenv("PROFILING_REQUEST_MAX_SECONDS", "30"))
+    # Tracing (needs the OpenTelemetry SDK): all spans are recorded, then whole traces are
+    # kept if slow (>= OTEL_SLOW_MS) or failed, else with probability OTEL_SAMPLE_RATE.
+    # Exporter: otlp, file (JSON lines at OTEL_FILE_PATH), console or memory
+    otel_enabled: bool = os.getenv("OTEL_ENABLED", "0").lower() in {"1", "true", "yes"}
+    otel_exporter: str = os.getenv("OTEL_EXPORTER", "otlp")
+    otel_file_path: str = os.getenv("OTEL_FILE_PATH", "traces.jsonl")
+    otel_slow_ms: float = float(os.getenv("OTEL_SLOW_MS", "500"))
+    otel_sample_rate: float = float(os.getenv("OTEL_SAMPLE_RATE", "0.01"))
+    # Rate-limit counters (a limits storage URI): zariz-db:// shares token buckets between workers
+    # through the database, pushing consumption in one upsert per RATE_LIMIT_SYNC_INTERVAL seconds;
+    # zariz-local:// keeps them per worker; memory://, redis://... use the limits backends
+    rate_limit_storage: str = os.getenv("RATE_LIMIT_STORAGE", "zariz-db://")
+    rate_limit_sync_interval: float = float(os.getenv("RATE_LIMIT_SYNC_INTERVAL", "0.5"))
+    rate_limit_max_keys: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+    # With PROMETHEUS_MULTIPROC_DIR, seconds between writes of each worker's state gauges
+    metrics_gauge_interval: float = float(os.getenv("METRICS_GAUGE_INTERVAL", "5"))
+    # Bearer token required to scrape /metrics (unset: open, restrict at the ingress)
+    metrics_token: str | None = os.getenv("METRICS_TOKEN") or None
+    # Background tasks (outbox dispatcher, ...) started with the app
+    background_tasks: bool = os.getenv("BACKGROUND_TASKS", "1").lower() not in {"0", "false", "no"}
+    outbox_batch_size: int = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+    outbox_poll_interval: float = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+    # Runs an outbox row's push hand-off is retried for (queue full, audience lookup failed) before it is dropped
+    outbox_max_attempts: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "30"))
+    # In-process push dispatcher (bounded queue + worker threads)
+    push_queue_size: int = int(os.getenv("PUSH_QUEUE_SIZE", "10000"))
+    push_workers: int = int(os.getenv("PUSH_WORKERS", "4"))
+    push_batch_size: int = int(os.getenv("PUSH_BATCH_SIZE", "500"))
+    # Seconds a worker waits to collect (and coalesce per device/order) pushes before sending
+    push_coalesce_window: float = float(os.getenv("PUSH_COALESCE_WINDOW", "0.5"))
+    push_drain_timeout: float = float(os.getenv("PUSH_DRAIN_TIMEOUT", "10"))
+    # "memory": in-process dispatcher; "db": durable push_jobs table drained by `python -m app.worker`
+    push_queue_backend: str = os.getenv("PUSH_QUEUE_BACKEND", "memory")
+    push_max_attempts: int = int(os.getenv("PUSH_MAX_ATTEMPTS", "8"))
+    push_retry_base: float = float(os.getenv("PUSH_RETRY_BASE", "2"))
+    push_retry_max: float = float(os.getenv("PUSH_RETRY_MAX", "900"))
+    # SSE reconnect hints (retry: base + random jitter, ms) and connect-time snapshot cache TTL
+    sse_retry_ms: int = int(os.getenv("SSE_RETRY_MS", "3000"))
+    sse_retry_jitter_ms: int = int(os.getenv("SSE_RETRY_JITTER_MS", "7000"))
+    sse_snapshot_ttl: float = float(os.getenv("SSE_SNAPSHOT_TTL", "2.0"))
 
 
 settings = Settings()
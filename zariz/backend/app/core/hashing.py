@@ -0,0 +1,114 @@
+"""Bounded executor for password hashing.
+
+argon2/bcrypt cost tens of milliseconds of CPU per call. Running them on
+Starlette's threadpool lets a login burst occupy every thread and stall
+unrelated endpoints, so hashing goes through a dedicated pool of
+``hash_workers`` (threads by default, processes with ``HASH_EXECUTOR=process``)
+with at most ``hash_max_pending`` calls admitted at once. Callers beyond that
+get ``HashingBusy`` (served as 503) instead of queueing.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from . import metrics, tracing
+from .config import settings
+from .security import hash_password, verify_and_update, verify_password
+
+HASH_SECONDS = metrics.histogram(
+    "password_hash_seconds",
+    "Password hash/verify latency including time queued for the hashing pool",
+    ["op"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+HASH_PENDING = metrics.gauge(
+    "password_hash_pending", "Password hash/verify calls admitted and not yet finished", multiprocess_mode="livesum"
+)
+HASH_REJECTED = metrics.counter("password_hash_rejected_total", "Password hash/verify calls rejected because the pool was full")
+
+
+class HashingBusy(Exception):
+    """The hashing pool is at capacity; the client should retry shortly."""
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_pending: int, kind: str = "thread") -> None:
+        self._workers = max(1, workers)
+        self._max_pending = max(1, max_pending)
+        self._kind = kind
+        self._executor: Executor | None = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        metrics.track(HASH_PENDING, lambda: self._pending)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self._kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self._workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="hasher")
+        return self._executor
+
+    def _submit(self, op: str, fn: Callable[..., Any], *args: Any) -> Future:
+        with self._lock:
+            if self._pending >= self._max_pending:
+                HASH_REJECTED.inc()
+                raise HashingBusy(f"password hashing pool is full ({self._pending} pending)")
+            self._pending += 1
+            executor = self._get_executor()
+        start = time.perf_counter()
+
+        def done(_: Future) -> None:
+            with self._lock:
+                self._pending -= 1
+            HASH_SECONDS.labels(op).observe(time.perf_counter() - start)
+
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            done(Future())
+            raise
+        future.add_done_callback(done)
+        return future
+
+    async def hash(self, password: str) -> str:
+        with tracing.span("password.hash"):
+            return await asyncio.wrap_future(self._submit("hash", hash_password, password))
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        with tracing.span("password.verify"):
+            return await asyncio.wrap_future(self._submit("verify", verify_password, password, password_hash))
+
+    async def verify_and_update(self, password: str, password_hash: str) -> tuple[bool, str | None]:
+        with tracing.span("password.verify"):
+            return await asyncio.wrap_future(self._submit("verify", verify_and_update, password, password_hash))
+
+    def hash_sync(self, password: str) -> str:
+        """For sync endpoints: same admission control, waits on the calling thread."""
+        with tracing.span("password.hash"):
+            return self._submit("hash", hash_password, password).result()
+
+    def verify_sync(self, password: str, password_hash: str) -> bool:
+        with tracing.span("password.verify"):
+            return self._submit("verify", verify_password, password, password_hash).result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(
+    workers=settings.hash_workers,
+    max_pending=settings.hash_max_pending,
+    kind=settings.hash_executor,
+)
@@ -1,5 +1,302 @@
+"""Rate limiting: slowapi with token-bucket storages.
+
+Limits are keyed by the authenticated user (the ``sub`` of a valid bearer
+token) and fall back to the client address, so users behind one NAT do not
+share a budget. Counters live in ``RATE_LIMIT_STORAGE``, a ``limits``
+storage URI:
+
+- ``zariz-local://``: a token bucket per key in this worker. A ``10/minute``
+  limit admits a burst of 10 and refills one token every 6 seconds.
+- ``zariz-db://``: the same buckets, shared by every worker through the
+  ``rate_limit_buckets`` table. Requests only touch the local bucket; a
+  background thread pushes the tokens consumed since the last sync in one
+  upsert per ``RATE_LIMIT_SYNC_INTERVAL`` and adopts the shared levels it
+  returns. Workers can together overshoot by what they admit within one
+  interval; the shared bucket then goes into debt, which is paid back before
+  the key admits again. A key seen for the first time triggers a sync right
+  away. If the database is unreachable each worker keeps enforcing locally.
+- Any other ``limits`` backend (``memory://`` fixed windows, ``redis://``...).
+"""
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from limits.storage import Storage
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from sqlalchemy import func
+
+from . import metrics
+from .config import settings
+from .tokens import TokenError, decode_token
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_SYNCS = metrics.histogram("rate_limit_sync_seconds", "Duration of one shared rate-limit sync")
+RATE_LIMIT_SYNC_ERRORS = metrics.counter("rate_limit_sync_errors_total", "Shared rate-limit syncs that failed")
+
+
+def identity_key(request) -> str:
+    """``user:<sub>`` for a request with a valid bearer token, else ``ip:<address>``."""
+    auth = request.headers.get("authorization", "")
+    if auth[:7].lower() == "bearer ":
+        try:
+            sub = decode_token(auth[7:].strip()).get("sub")
+        except TokenError:
+            sub = None
+        if sub is not None:
+            return f"user:{sub}"
+    return f"ip:{get_remote_address(request)}"
+
+
+class _Bucket:
+    __slots__ = ("capacity", "rate", "tokens", "stamp")
+
+    def __init__(self, capacity: float, rate: float, now: float) -> None:
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.stamp = now
+
+    def refill(self, now: float) -> None:
+        if now > self.stamp:
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def used(self) -> int:
+        return max(0, math.ceil(self.capacity - self.tokens))
+
+
+class TokenBucketStorage(Storage):
+    """``limits`` storage whose counters are token buckets (``zariz-local://``).
+
+    The strategies call ``incr`` and compare the result with the limit, so
+    ``incr`` returns the tokens in use: at most the capacity when the hit
+    was admitted (and consumed), capacity + 1 when it was refused (nothing
+    is consumed). Capacity and refill rate come from the key, which ends
+    with ``/<amount>/<multiples>/<granularity>``, and the window length.
+    """
+
+    STORAGE_SCHEME = ["zariz-local"]
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, max_keys: Optional[int] = None, **options) -> None:
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._max_keys = max_keys or settings.rate_limit_max_keys
+        self._buckets: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def base_exceptions(self):
+        return ValueError
+
+    def _bucket(self, key: str, expiry: float, now: float) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            capacity = float(key.rsplit("/", 3)[1])
+            bucket = self._buckets[key] = _Bucket(capacity, capacity / max(expiry, 1e-9), now)
+            self._created(key)
+            while len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.refill(now)
+        return bucket
+
+    def _created(self, key: str) -> None:
+        pass
+
+    def _consumed(self, key: str, amount: float) -> None:
+        pass
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        with self._lock:
+            bucket = self._bucket(key, expiry, time.time())
+            if bucket.tokens < amount:
+                self._consumed(key, 0)
+                return int(bucket.capacity) + 1
+            bucket.tokens -= amount
+            self._consumed(key, amount)
+            return bucket.used()
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return 0
+            bucket.refill(time.time())
+            return bucket.used()
+
+    def get_expiry(self, key: str) -> float:
+        """When the bucket is full again (epoch seconds)."""
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return now
+            bucket.refill(now)
+            return now + (bucket.capacity - bucket.tokens) / bucket.rate
+
+    def check(self) -> bool:
+        return True
+
+    def reset(self) -> int:
+        with self._lock:
+            n = len(self._buckets)
+            self._buckets.clear()
+            return n
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+class SharedTokenBucketStorage(TokenBucketStorage):
+    """Token buckets shared through ``rate_limit_buckets`` (``zariz-db://``), synced in batches."""
+
+    STORAGE_SCHEME = ["zariz-db"]
+
+    def __init__(
+        self,
+        uri: Optional[str] = None,
+        wrap_exceptions: bool = False,
+        sync_interval: Optional[float] = None,
+        engine=None,
+        **options,
+    ) -> None:
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.sync_interval = settings.rate_limit_sync_interval if sync_interval is None else sync_interval
+        self._engine = engine
+        # Tokens consumed per key since the last sync (0 for keys never synced or only refused);
+        # sync_interval=0 leaves syncing to explicit sync() calls
+        self._pending: Dict[str, float] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _created(self, key: str) -> None:
+        self._pending.setdefault(key, 0.0)
+        self._wake.set()
+        if self._thread is None and self.sync_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="rate-limit-sync", daemon=True)
+            self._thread.start()
+
+    def _consumed(self, key: str, amount: float) -> None:
+        self._pending[key] = self._pending.get(key, 0.0) + amount
+
+    def reset(self) -> int:
+        with self._lock:
+            self._pending.clear()
+        return super().reset()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.sync_interval)
+            self._wake.clear()
+            self.sync()
+
+    def stop(self) -> None:
+        """Stop the sync thread after pushing what is still pending."""
+        thread = self._thread
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join()
+            self._thread = None
+            self._stop.clear()
+        self.sync()
+
+    def _get_engine(self):
+        if self._engine is None:
+            from ..db.session import get_engine
+
+            self._engine = get_engine()
+        return self._engine
+
+    def sync(self) -> int:
+        """Push pending consumption and adopt the shared levels; returns the keys synced."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            batch: Dict[str, Tuple[float, float, float]] = {}
+            for key, used in pending.items():
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    batch[key] = (bucket.capacity, bucket.rate, used)
+        if not batch:
+            return 0
+        start = time.perf_counter()
+        try:
+            rows = self._upsert(batch, time.time())
+        except Exception:
+            RATE_LIMIT_SYNC_ERRORS.inc()
+            logger.warning("rate limit sync failed; enforcing per worker until it recovers", exc_info=True)
+            with self._lock:
+                for key, (_, _, used) in batch.items():
+                    self._pending[key] = self._pending.get(key, 0.0) + used
+            return 0
+        finally:
+            RATE_LIMIT_SYNCS.observe(time.perf_counter() - start)
+        with self._lock:
+            for key, tokens, updated_at in rows:
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    # Consumption since the batch was taken is still pending locally
+                    bucket.tokens = tokens - self._pending.get(key, 0.0)
+                    bucket.stamp = updated_at
+        return len(rows)
+
+    def _upsert(self, batch: Dict[str, Tuple[float, float, float]], now: float):
+        from ..db.models.rate_limit import RateLimitBucket as B
+
+        engine = self._get_engine()
+        if engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+
+            least, greatest = func.least, func.greatest
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+            least, greatest = func.min, func.max
+        stmt = insert(B).values(
+            [
+                {
+                    "key": key,
+                    "capacity": capacity,
+                    "rate": rate,
+                    "tokens": capacity - used,
+                    "updated_at": now,
+                    "expires_at": now + used / rate,
+                }
+                for key, (capacity, rate, used) in batch.items()
+            ]
+        )
+        new = stmt.excluded
+        # Refill the shared bucket up to now, then take this worker's consumption (debt capped at one capacity)
+        refilled = least(new.capacity, B.tokens + greatest(new.updated_at - B.updated_at, 0) * new.rate)
+        tokens = greatest(refilled - (new.capacity - new.tokens), -new.capacity)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[B.key],
+            set_={
+                "capacity": new.capacity,
+                "rate": new.rate,
+                "tokens": tokens,
+                "updated_at": greatest(new.updated_at, B.updated_at),
+                "expires_at": greatest(new.updated_at, B.updated_at) + (new.capacity - tokens) / new.rate,
+            },
+        ).returning(B.key, B.tokens, B.updated_at)
+        with engine.begin() as conn:
+            return conn.execute(stmt).all()
+
+
+limiter = Limiter(key_func=identity_key, storage_uri=settings.rate_limit_storage)
 
-limiter = Limiter(key_func=get_remote_address)
 
+def stop_rate_limits() -> None:
+    """Flush shared counters on shutdown (no-op for per-worker storages)."""
+    storage = limiter._storage
+    if isinstance(storage, SharedTokenBucketStorage):
+        storage.stop()
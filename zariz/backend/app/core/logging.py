@@ -1,6 +1,37 @@
+"""JSON logging that never blocks the caller.
+
+Records go onto a bounded queue (``LOG_QUEUE_SIZE``) and a background
+``QueueListener`` thread formats and writes them to stdout, so a slow log
+sink (container log driver under pressure) cannot stall requests. When the
+queue is full the record is dropped and counted. Structured fields passed as
+``extra={"fields": {...}}`` are merged into the JSON object; successful
+access-log records can be sampled with ``LOG_ACCESS_SAMPLE_RATE``.
+``LOG_QUEUE_SIZE=0`` writes synchronously from the caller, as before.
+"""
+import atexit
 import json
 import logging
+import logging.handlers
+import queue
+import random
 import sys
+from typing import Optional
+
+from . import metrics
+from .config import settings
+
+try:  # optional: faster JSON encoding
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    orjson = None  # type: ignore
+
+LOG_RECORDS_DROPPED = metrics.counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+
+def _dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, default=str)
 
 
 class JSONFormatter(logging.Formatter):
@@ -10,15 +41,80 @@ class JSONFormatter(logging.Formatter):
             "msg": record.getMessage(),
             "logger": record.name,
         }
+        fields = getattr(record, "fields", None)
+        if fields:
+            base.update(fields)
         if record.exc_info:
             base["exc_info"] = self.formatException(record.exc_info)
-        return json.dumps(base, ensure_ascii=False)
+        elif record.exc_text:
+            base["exc_info"] = record.exc_text
+        return _dumps(base)
+
+
+class AccessLogSampler(logging.Filter):
+    """Keep a ``rate`` fraction of access-log records with status < 400 (errors always pass)."""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        fields = getattr(record, "fields", None)
+        if not fields or fields.get("status_code", 500) >= 400:
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """``QueueHandler`` that drops (and counts) records instead of blocking when full.
+
+    Only message interpolation and traceback rendering happen in the caller;
+    JSON encoding is left to the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def shutdown_logging() -> None:
+    """Stop the writer thread after flushing everything already queued."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 
 def setup_logging():
+    shutdown_logging()
     handler = logging.StreamHandler(sys.stdout)
     handler.setFormatter(JSONFormatter())
     root = logging.getLogger()
-    root.handlers = [handler]
+    if settings.log_queue_size > 0:
+        global _listener
+        front: logging.Handler = DroppingQueueHandler(queue.Queue(settings.log_queue_size))
+        _listener = logging.handlers.QueueListener(front.queue, handler)
+        _listener.start()
+    else:
+        front = handler
+    if settings.log_access_sample_rate < 1:
+        front.addFilter(AccessLogSampler(settings.log_access_sample_rate))
+    root.handlers = [front]
     root.setLevel(logging.INFO)
 
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,141 @@
+"""Prometheus metric factories and the ``/metrics`` exposition.
+
+prometheus_client is optional; without it every metric is a no-op so call
+sites never need to check. Under a multi-process server set
+``PROMETHEUS_MULTIPROC_DIR`` and ``render`` aggregates all workers.
+
+Gauges that mirror some live state (pool occupancy, queue depths) are
+registered with ``track``. In one process the callback runs at scrape time.
+Multi-process mode cannot call into other workers, so each worker instead
+writes its tracked gauges every ``METRICS_GAUGE_INTERVAL`` seconds (see
+``GaugeRefresher``). The gauge's ``multiprocess_mode`` (e.g. ``livesum``)
+then says how the workers' values are combined.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+
+    ENABLED = True
+except Exception:  # pragma: no cover - optional dependency
+    ENABLED = False
+
+
+class _Noop:
+    def inc(self, *args, **kwargs) -> None:
+        pass
+
+    def dec(self, *args, **kwargs) -> None:
+        pass
+
+    def set(self, *args, **kwargs) -> None:
+        pass
+
+    def observe(self, *args, **kwargs) -> None:
+        pass
+
+    def set_function(self, *args, **kwargs) -> None:
+        pass
+
+    def labels(self, *args, **kwargs) -> "_Noop":
+        return self
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        yield
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()):
+    return Counter(name, documentation, labelnames) if ENABLED else _Noop()
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess_mode: str = "all"):
+    return Gauge(name, documentation, labelnames, multiprocess_mode=multiprocess_mode) if ENABLED else _Noop()
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] | None = None):
+    if not ENABLED:
+        return _Noop()
+    if buckets is None:
+        return Histogram(name, documentation, labelnames)
+    return Histogram(name, documentation, labelnames, buckets=buckets)
+
+
+logger = logging.getLogger(__name__)
+
+_tracked: Dict[object, Callable[[], float]] = {}
+
+
+def multiprocess() -> bool:
+    return ENABLED and bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def track(gauge_, fn: Callable[[], float]) -> None:
+    """Keep ``gauge_`` equal to ``fn()``: read at scrape time, or written periodically when multi-process.
+
+    Like ``set_function``, a later call for the same gauge replaces the callback.
+    """
+    if multiprocess():
+        _tracked[gauge_] = fn
+    else:
+        gauge_.set_function(fn)
+
+
+def refresh() -> None:
+    """Write every tracked gauge of this process (multi-process mode)."""
+    for gauge_, fn in list(_tracked.items()):
+        try:
+            gauge_.set(fn())
+        except Exception:
+            logger.debug("gauge refresh failed", exc_info=True)
+
+
+class GaugeRefresher:
+    """Per-worker thread running ``refresh`` every ``interval`` seconds (multi-process mode only)."""
+
+    def __init__(self) -> None:
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, interval: float) -> None:
+        if not multiprocess() or interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="metrics-gauges", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            refresh()
+
+
+gauge_refresher = GaugeRefresher()
+
+
+def render() -> Tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, and its content type."""
+    if not ENABLED:
+        return b"# prometheus_client is not installed\n", "text/plain; charset=utf-8"
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+    if multiprocess():
+        from prometheus_client import multiprocess as mp
+
+        # The scraped worker's own gauges are current; the others are at most one interval old
+        refresh()
+        registry = CollectorRegistry()
+        mp.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,168 @@
+"""Request ID and access logging as a pure ASGI middleware.
+
+Unlike ``@app.middleware("http")`` (BaseHTTPMiddleware) this neither wraps
+the response in a new streaming object nor buffers the request body: it tees
+at most ``max_body`` bytes of POST/PUT/PATCH bodies as the app reads them
+(logged only for error responses) and adds ``X-Request-ID`` to the response
+start message. Streaming responses (SSE) pass through untouched and are
+logged when they end.
+
+It also records per-route metrics, labelled by the matched route template
+(``/v1/orders/{order_id}``, never the raw path): latency until the response
+headers are sent, so long-lived streams do not skew it, and the number of
+SQL statements the request executed. Statement count and DB time so far are
+sent as ``Server-Timing`` and logged; SQL budget overruns are logged as
+warnings. A signed ``X-Profile`` header, sent with the bearer token of the
+admin it was issued to, samples the request with the CPU profiler until
+the response starts (see ``core.profiling``). With tracing on, it also opens the
+request's server span (see ``core.tracing``).
+"""
+from __future__ import annotations
+
+import logging
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import metrics, tracing
+from .config import settings
+from .profiling import request_profiles, start_request_profile
+from .tokens import TokenError, decode_token
+from ..db.instrumentation import QueryStats, request_query_stats
+
+_BODY_METHODS = {"POST", "PUT", "PATCH"}
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds",
+    "Time until response headers, by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HTTP_REQUEST_SQL_STATEMENTS = metrics.histogram(
+    "http_request_sql_statements",
+    "SQL statements executed per request, by route template",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+
+
+def route_template(scope: Scope) -> str:
+    """Path template of the route that handled the request ("unmatched" if none)."""
+    # Newer FastAPI resolves included routers lazily: the route object only knows its
+    # own path and the prefixed template lives on the effective route context
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    path = getattr(context, "path_format", None) or getattr(scope.get("route"), "path_format", None)
+    return path or "unmatched"
+
+
+def _bearer_subject(authorization: str) -> Optional[str]:
+    if authorization[:7].lower() != "bearer ":
+        return None
+    try:
+        sub = decode_token(authorization[7:].strip()).get("sub")
+    except TokenError:
+        return None
+    return None if sub is None else str(sub)
+
+
+class RequestLogMiddleware:
+    def __init__(self, app: ASGIApp, logger: str = "app", max_body: int = 500) -> None:
+        self.app = app
+        self.logger = logging.getLogger(logger)
+        self.max_body = max_body
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        req_id = None
+        profile_token = None
+        authorization = ""
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                req_id = value.decode("latin-1")
+            elif name == b"x-profile":
+                profile_token = value.decode("latin-1")
+            elif name == b"authorization":
+                authorization = value.decode("latin-1")
+        req_id = req_id or str(uuid.uuid4())
+        # Visible to handlers as request.state.request_id
+        scope.setdefault("state", {})["request_id"] = req_id
+        start = time.perf_counter()
+        status_code = 500
+        started = False
+        stats = QueryStats(scope)
+        stats_token = request_query_stats.set(stats)
+        head = bytearray()
+        max_body = self.max_body
+
+        async def tee_receive() -> Message:
+            message = await receive()
+            if message["type"] == "http.request" and len(head) < max_body:
+                head.extend(message.get("body", b"")[: max_body - len(head)])
+            return message
+
+        async def send_with_id(message: Message) -> None:
+            nonlocal status_code, started, profiler
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                started = True
+                if profiler is not None:
+                    # Profile up to the response start: a stream must not hold the sampler
+                    request_profiles.put(req_id, profiler.stop())
+                    profiler = None
+                HTTP_REQUEST_SECONDS.labels(scope["method"], route_template(scope), str(status_code)).observe(
+                    time.perf_counter() - start
+                )
+                message = dict(message)
+                headers = [*message.get("headers", ()), (b"x-request-id", req_id.encode("latin-1"))]
+                if settings.server_timing:
+                    timing = 'db;dur=%.2f;desc="%d statements", app;dur=%.2f' % (
+                        stats.seconds * 1000,
+                        stats.statements,
+                        (time.perf_counter() - start) * 1000,
+                    )
+                    headers.append((b"server-timing", timing.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        capture = scope["method"] in _BODY_METHODS
+        profiler = start_request_profile(profile_token, _bearer_subject(authorization)) if profile_token else None
+        server_span = tracing.start_server_span(scope)
+        error = None
+        try:
+            await self.app(scope, tee_receive if capture else receive, send_with_id)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            if server_span is not None:
+                tracing.end_server_span(server_span, route_template(scope), status_code, req_id, error)
+            if profiler is not None:
+                request_profiles.put(req_id, profiler.stop())
+            request_query_stats.reset(stats_token)
+            if not started:  # the app raised before responding
+                HTTP_REQUEST_SECONDS.labels(scope["method"], route_template(scope), "500").observe(time.perf_counter() - start)
+            HTTP_REQUEST_SQL_STATEMENTS.labels(scope["method"], route_template(scope)).observe(stats.statements)
+            log_data: Dict[str, Any] = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status_code": status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                "request_id": req_id,
+                "db_statements": stats.statements,
+                "db_ms": round(stats.seconds * 1000, 2),
+            }
+            if status_code >= 400 and head:
+                log_data["request_body"] = head.decode("utf-8", errors="replace")
+            problems = stats.violations()
+            if problems:
+                self.logger.warning(
+                    "sql budget exceeded",
+                    extra={"fields": {"route": route_template(scope), "request_id": req_id, "problems": problems}},
+                )
+            # Encoded to JSON by the log writer thread, not here
+            self.logger.info("request", extra={"fields": log_data})
@@ -0,0 +1,245 @@
+"""On-demand CPU and memory profiling of a live worker.
+
+Nothing here runs unless asked (and ``PROFILING_ENABLED=1``):
+
+- ``SamplingProfiler`` snapshots every thread's Python stack with
+  ``sys._current_frames()`` at a fixed interval from a helper thread and
+  aggregates them as collapsed stacks (``thread;outer;...;leaf count``), the
+  input format of flamegraph.pl and speedscope. Idle threads are skipped.
+- ``MemoryTracker`` starts/stops ``tracemalloc`` and returns the top
+  allocation sites plus the diff against the previous snapshot.
+- A request carrying a valid ``X-Profile`` header is sampled until its
+  response starts (streams are not followed) and at most
+  ``PROFILING_REQUEST_MAX_SECONDS``; the result is kept under its request
+  id. The header (``profile_token()``) is signed with ``PROFILING_KEY``,
+  names the admin it was issued to (the request must carry that user's
+  bearer token), expires quickly and is accepted once per worker. The
+  sampler sees the whole process, so concurrent requests on the same worker
+  show up too.
+
+Only one sampler runs at a time per worker.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+
+# Leaf frames of threads that are just waiting (thread pools, the event loop's selector)
+_IDLE = {
+    ("threading", "Condition.wait"),
+    ("threading", "Event.wait"),
+    ("concurrent.futures.thread", "_worker"),
+    ("selectors", "EpollSelector.select"),
+    ("selectors", "PollSelector.select"),
+    ("selectors", "KqueueSelector.select"),
+    ("selectors", "SelectSelector.select"),
+}
+_MAX_DEPTH = 128
+
+
+class ProfilerBusy(Exception):
+    """Another profile is already running in this worker."""
+
+
+_active = threading.Lock()
+
+
+def _label(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, max_seconds: Optional[float] = None) -> None:
+        self.interval = interval
+        # Sampling ends by itself after this long even if stop() is never called
+        self.max_seconds = max_seconds
+        self.samples = 0
+        self._counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        if not _active.acquire(blocking=False):
+            raise ProfilerBusy("a profile is already running")
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        """Stop sampling and return the collapsed stacks."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self.collapsed()
+
+    def _run(self) -> None:
+        try:
+            self._sample()
+        finally:
+            _active.release()
+
+    def _sample(self) -> None:
+        me = threading.get_ident()
+        deadline = None if self.max_seconds is None else time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval):
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if (frame.f_globals.get("__name__"), code.co_qualname) in _IDLE:
+                    continue
+                stack: List[str] = []
+                while frame is not None and len(stack) < _MAX_DEPTH:
+                    stack.append(_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(" ", "_"))
+                self._counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self._counts.most_common())
+
+
+class MemoryTracker:
+    """tracemalloc snapshots; each snapshot is diffed against the previous one."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._last: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10) -> None:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self._last = None
+
+    def stop(self) -> None:
+        with self._lock:
+            tracemalloc.stop()
+            self._last = None
+
+    def snapshot(self, top: int = 25) -> Dict[str, Any]:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc is not tracing")
+            snap = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"))
+            )
+            current, peak = tracemalloc.get_traced_memory()
+            out: Dict[str, Any] = {
+                "traced_bytes": current,
+                "peak_bytes": peak,
+                "top": [
+                    {"where": str(s.traceback[0]), "size": s.size, "count": s.count}
+                    for s in snap.statistics("lineno")[:top]
+                ],
+                "diff": None,
+            }
+            if self._last is not None:
+                out["diff"] = [
+                    {"where": str(s.traceback[0]), "size_diff": s.size_diff, "count_diff": s.count_diff, "size": s.size}
+                    for s in snap.compare_to(self._last, "lineno")[:top]
+                ]
+            self._last = snap
+            return out
+
+
+memory_tracker = MemoryTracker()
+
+
+def _key() -> bytes:
+    return (settings.profiling_key or settings.jwt_secret).encode("utf-8")
+
+
+def _sign(payload: str) -> str:
+    return hmac.new(_key(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def profile_token(sub: str, ttl: float = 60) -> str:
+    """Value for the ``X-Profile`` header: usable once, by user ``sub``, within ``ttl`` seconds."""
+    payload = f"{int(time.time() + ttl)}.{sub}.{secrets.token_hex(8)}"
+    return f"{payload}.{_sign(payload)}"
+
+
+class _UsedTokens:
+    """Nonces of profile tokens already accepted by this worker (until they expire)."""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, nonce: str, expires: int) -> bool:
+        now = time.time()
+        with self._lock:
+            if nonce in self._entries:
+                return False
+            self._entries[nonce] = expires
+            while self._entries and (len(self._entries) > self._maxsize or next(iter(self._entries.values())) < now):
+                self._entries.popitem(last=False)
+            return True
+
+
+_used_tokens = _UsedTokens()
+
+
+def verify_profile_token(token: str, sub: Optional[str], consume: bool = True) -> bool:
+    """True if ``token`` is validly signed, unexpired, issued to ``sub`` and (if ``consume``) unused."""
+    parts = token.split(".")
+    if len(parts) != 4 or sub is None:
+        return False
+    expires, token_sub, nonce, signature = parts
+    if not expires.isdigit() or int(expires) < time.time() or token_sub != str(sub):
+        return False
+    if not hmac.compare_digest(signature, _sign(f"{expires}.{token_sub}.{nonce}")):
+        return False
+    return not consume or _used_tokens.claim(nonce, int(expires))
+
+
+class ProfileStore:
+    """The last few per-request profiles, by request id."""
+
+    def __init__(self, maxsize: int = 20) -> None:
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, request_id: str, collapsed: str) -> None:
+        with self._lock:
+            self._entries[request_id] = collapsed
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, request_id: str) -> Optional[str]:
+        with self._lock:
+            return self._entries.get(request_id)
+
+
+request_profiles = ProfileStore()
+
+
+def start_request_profile(token: str, sub: Optional[str]) -> Optional[SamplingProfiler]:
+    """Sampler for a request by user ``sub`` if profiling is enabled and ``token`` is valid (else None)."""
+    if not settings.profiling_enabled or not verify_profile_token(token, sub):
+        return None
+    try:
+        return SamplingProfiler(settings.profiling_interval_ms / 1000, settings.profiling_request_max_seconds).start()
+    except ProfilerBusy:
+        return None
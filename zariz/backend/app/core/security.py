@@ -1,12 +1,13 @@
 from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
 import secrets
-
-from jose import jwt
+import time
 
 from .config import settings
+from .tokens import encode_token
 
 import hashlib
+import hmac
 try:
     from passlib.handlers.argon2 import argon2 as _argon2handler
     _HAS_ARGON2 = _argon2handler.has_backend()
@@ -18,6 +19,71 @@ except Exception:
     _HAS_ARGON2 = False
     _argon2 = None  # type: ignore
 
+# Library defaults; configure_argon2() derives the handler actually used
+_argon2_default = _argon2
+
+
+def configure_argon2(
+    time_cost: Optional[int] = None,
+    memory_cost: Optional[int] = None,
+    parallelism: Optional[int] = None,
+) -> None:
+    """Set argon2 cost for new hashes; unset values keep the library default.
+
+    Existing hashes with other parameters still verify; weaker ones are
+    upgraded on the next successful login (see ``needs_rehash``).
+    """
+    global _argon2
+    if _argon2_default is None:
+        return
+    params = {k: v for k, v in (("time_cost", time_cost), ("memory_cost", memory_cost), ("parallelism", parallelism)) if v}
+    _argon2 = _argon2_default.using(**params) if params else _argon2_default
+
+
+def argon2_params() -> dict[str, int]:
+    if _argon2 is None:
+        return {}
+    return {"time_cost": _argon2.default_rounds, "memory_cost": _argon2.memory_cost, "parallelism": _argon2.parallelism}
+
+
+configure_argon2(settings.argon2_time_cost, settings.argon2_memory_cost, settings.argon2_parallelism)
+
+
+def calibrate_argon2(
+    target_ms: float,
+    memory_cost: Optional[int] = None,
+    parallelism: Optional[int] = None,
+    max_time_cost: int = 20,
+    min_memory_cost: int = 8192,
+) -> dict[str, int]:
+    """Pick argon2 parameters whose hash takes about ``target_ms`` on this machine.
+
+    Raises time_cost at the given memory (default: current) until a hash
+    reaches the target; if even one pass is too slow, halves memory instead.
+    Returns the parameters without applying them.
+    """
+    if _argon2_default is None:
+        return {}
+    current = argon2_params()
+    memory = memory_cost or current["memory_cost"]
+    lanes = parallelism or current["parallelism"]
+
+    def measure(t: int, m: int) -> float:
+        handler = _argon2_default.using(time_cost=t, memory_cost=m, parallelism=lanes)
+        samples = []
+        for _ in range(3):
+            start = time.perf_counter()
+            handler.hash("calibration")
+            samples.append((time.perf_counter() - start) * 1000)
+        return sorted(samples)[1]
+
+    while memory > min_memory_cost and measure(1, memory) > target_ms:
+        memory //= 2
+    time_cost = 1
+    while time_cost < max_time_cost and measure(time_cost, memory) < target_ms:
+        time_cost += 1
+    return {"time_cost": time_cost, "memory_cost": memory, "parallelism": lanes}
+
 
 def hash_password(password: str) -> str:
     if _HAS_ARGON2 and _argon2 is not None:
@@ -51,6 +117,44 @@ def verify_password(password: str, password_hash: str) -> bool:
         return False
 
 
+def _below_argon2_floor(password_hash: str) -> bool:
+    parsed = _argon2.from_string(password_hash)
+    current = argon2_params()
+    min_time = settings.argon2_min_time_cost or current["time_cost"]
+    min_memory = settings.argon2_min_memory_cost or current["memory_cost"]
+    return parsed.rounds < min_time or parsed.memory_cost < min_memory
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """True if the hash uses an older scheme, or argon2 weaker than the configured floor.
+
+    Hashes at least as strong as the floor are kept even if their parameters
+    differ from the ones new hashes use, so hosts with different settings do
+    not keep rewriting each other's hashes.
+    """
+    try:
+        if _HAS_ARGON2 and _argon2 is not None:
+            return not password_hash.startswith("$argon2") or _below_argon2_floor(password_hash)
+        from passlib.hash import bcrypt as _bcrypt  # type: ignore
+
+        return not _bcrypt.identify(password_hash) or _bcrypt.needs_update(password_hash)
+    except Exception:
+        return False
+
+
+def verify_and_update(password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+    """Verify, and return a replacement hash when the stored one is outdated."""
+    if not verify_password(password, password_hash):
+        return False, None
+    if not needs_rehash(password_hash):
+        return True, None
+    new_hash = hash_password(password)
+    # No better scheme available (e.g. only the sha256 test fallback works)
+    if needs_rehash(new_hash):
+        return True, None
+    return True, new_hash
+
+
 def create_access_token(
     sub: str,
     role: str,
@@ -69,8 +173,36 @@ def create_access_token(
     if session_id:
         to_encode["session_id"] = session_id
     to_encode["exp"] = int((now + timedelta(seconds=expires_in)).timestamp())
-    return jwt.encode(to_encode, settings.jwt_secret, algorithm=settings.jwt_algo)
+    return encode_token(to_encode)
 
 
 def generate_refresh_token() -> str:
     return secrets.token_urlsafe(48)
+
+
+def hash_refresh_verifier(verifier: str) -> str:
+    """Keyed hash of a refresh-token verifier; the token is random, so no slow KDF is needed."""
+    return hmac.new(settings.refresh_token_key.encode("utf-8"), verifier.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def new_refresh_token() -> tuple[str, str, str]:
+    """Return ``(token, selector, verifier_hash)`` for a ``selector.verifier`` refresh token.
+
+    The selector is stored in clear for an indexed lookup; only the HMAC of
+    the verifier is stored.
+    """
+    selector = secrets.token_urlsafe(12)
+    verifier = secrets.token_urlsafe(32)
+    return f"{selector}.{verifier}", selector, hash_refresh_verifier(verifier)
+
+
+def split_refresh_token(token: str) -> Optional[tuple[str, str]]:
+    """``(selector, verifier)`` of a new-format token, or None for legacy/opaque tokens."""
+    selector, sep, verifier = token.partition(".")
+    if not sep or not selector or not verifier:
+        return None
+    return selector, verifier
+
+
+def verify_refresh_verifier(verifier: str, verifier_hash: str) -> bool:
+    return hmac.compare_digest(hash_refresh_verifier(verifier), verifier_hash)
@@ -0,0 +1,162 @@
+"""Access-token (JWT) encoding and verification.
+
+Every authenticated request and stream connect verifies a token, so the
+codec is pluggable (``TOKEN_BACKEND``): ``native`` is a minimal HS256-only
+HMAC implementation, ``jose`` is python-jose (used for any other algorithm).
+Verified claims are kept in a small LRU keyed by the raw token until the
+token's ``exp``; a hit costs a dict lookup instead of an HMAC and JSON parse.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from . import metrics
+from .config import settings
+
+TOKEN_CACHE_HITS = metrics.counter("token_cache_hits_total", "Access tokens served from the verified-claims cache")
+TOKEN_CACHE_MISSES = metrics.counter("token_cache_misses_total", "Access tokens verified from scratch")
+
+
+class TokenError(Exception):
+    """The token is malformed, has a bad signature, or has expired."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+class HS256Codec:
+    """JWS compact serialization restricted to HS256 (interoperable with python-jose)."""
+
+    _HEADER = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode())
+
+    def __init__(self, secret: str) -> None:
+        self._key = secret.encode("utf-8")
+
+    def _sign(self, signing_input: bytes) -> bytes:
+        return hmac.new(self._key, signing_input, hashlib.sha256).digest()
+
+    def encode(self, claims: Dict[str, Any]) -> str:
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        signing_input = f"{self._HEADER}.{payload}"
+        return f"{signing_input}.{_b64encode(self._sign(signing_input.encode('ascii')))}"
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        try:
+            header_b64, payload_b64, signature_b64 = token.split(".")
+            signature = _b64decode(signature_b64)
+            expected = self._sign(f"{header_b64}.{payload_b64}".encode("ascii"))
+        except (ValueError, UnicodeEncodeError):
+            raise TokenError("malformed token")
+        if not hmac.compare_digest(signature, expected):
+            raise TokenError("signature verification failed")
+        try:
+            header = json.loads(_b64decode(header_b64))
+            claims = json.loads(_b64decode(payload_b64))
+        except ValueError:
+            raise TokenError("malformed token")
+        # Pinned algorithm: never trust the header to pick one
+        if not isinstance(header, dict) or header.get("alg") != "HS256" or not isinstance(claims, dict):
+            raise TokenError("unsupported token")
+        now = time.time()
+        for name in ("exp", "nbf", "iat"):
+            if name in claims and not isinstance(claims[name], (int, float)):
+                raise TokenError(f"invalid {name} claim")
+        if "exp" in claims and claims["exp"] <= now:
+            raise TokenError("token expired")
+        if "nbf" in claims and claims["nbf"] > now:
+            raise TokenError("token not yet valid")
+        return claims
+
+
+class JoseCodec:
+    def __init__(self, secret: str, algorithm: str) -> None:
+        from jose import jwt
+
+        self._jwt = jwt
+        self._secret = secret
+        self._algorithm = algorithm
+
+    def encode(self, claims: Dict[str, Any]) -> str:
+        return self._jwt.encode(claims, self._secret, algorithm=self._algorithm)
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        from jose import JWTError
+
+        try:
+            return self._jwt.decode(token, self._secret, algorithms=[self._algorithm])
+        except JWTError as exc:
+            raise TokenError(str(exc)) from exc
+
+
+def make_codec(backend: str | None = None):
+    backend = backend or settings.token_backend
+    if backend == "native" and settings.jwt_algo == "HS256":
+        return HS256Codec(settings.jwt_secret)
+    return JoseCodec(settings.jwt_secret, settings.jwt_algo)
+
+
+class VerifiedTokenCache:
+    """Thread-safe LRU of ``raw token -> claims``, each entry valid until the token's ``exp``."""
+
+    def __init__(self, maxsize: int) -> None:
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Dict[str, Any] | None:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        exp = claims.get("exp")
+        # Tokens without exp are never cached: nothing bounds how long they stay valid
+        if self._maxsize <= 0 or not isinstance(exp, (int, float)):
+            return
+        with self._lock:
+            self._entries[token] = (float(exp), claims)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+codec = make_codec()
+token_cache = VerifiedTokenCache(settings.token_cache_size)
+
+
+def encode_token(claims: Dict[str, Any]) -> str:
+    return codec.encode(claims)
+
+
+def decode_token(token: str) -> Dict[str, Any]:
+    """Verified claims of ``token`` (treat as read-only; the dict is shared); raises ``TokenError``."""
+    claims = token_cache.get(token)
+    if claims is not None:
+        TOKEN_CACHE_HITS.inc()
+        return claims
+    TOKEN_CACHE_MISSES.inc()
+    claims = codec.decode(token)
+    token_cache.put(token, claims)
+    return claims
@@ -0,0 +1,207 @@
+"""OpenTelemetry tracing with tail-based sampling.
+
+Off unless ``OTEL_ENABLED`` is set and the OpenTelemetry SDK is installed;
+``span()`` is then a shared no-op context manager, so instrumented code
+costs one attribute check. When on, every span is recorded, and
+``TailSamplingProcessor`` buffers each trace's spans in this process until
+its local root ends, then keeps the whole trace if any span failed or the
+root took at least ``OTEL_SLOW_MS``, and otherwise only an
+``OTEL_SAMPLE_RATE`` fraction of them. The request middleware opens the
+server span (continuing an incoming ``traceparent``); DB statements, event
+publishing, push batches and password hashing are child spans. Kept spans
+go to ``OTEL_EXPORTER``: ``otlp`` (collector at
+``OTEL_EXPORTER_OTLP_ENDPOINT``), ``file`` (JSON lines at
+``OTEL_FILE_PATH``), ``console`` or ``memory`` (tests; see
+``memory_exporter``).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.trace import Status, StatusCode
+
+    HAVE_OTEL = True
+except Exception:  # pragma: no cover - optional dependency
+    HAVE_OTEL = False
+
+_noop = nullcontext()
+_tracer = None
+# The exporter behind OTEL_EXPORTER=memory (tests read finished spans from it)
+memory_exporter = None
+
+
+def span(name: str, attributes: Optional[Dict[str, Any]] = None):
+    """Context manager for a child span of the current one (no-op when tracing is off)."""
+    if _tracer is None:
+        return _noop
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None):
+    """A span the caller must ``end()`` (for begin/end hooks such as DB events); None when off."""
+    if _tracer is None:
+        return None
+    return _tracer.start_span(name, attributes=attributes)
+
+
+def end_span(span_, error: Optional[BaseException] = None) -> None:
+    if error is not None:
+        span_.record_exception(error)
+        span_.set_status(Status(StatusCode.ERROR, str(error)))
+    span_.end()
+
+
+class TailSamplingProcessor:
+    """Span processor that decides per trace, after its local root span ends.
+
+    Spans are held in memory per trace id (at most ``max_traces`` traces;
+    the oldest are dropped) and passed to ``delegate`` (typically a
+    ``BatchSpanProcessor``) only if the trace is kept.
+    """
+
+    def __init__(self, delegate, slow_ms: float, sample_rate: float, max_traces: int = 2048) -> None:
+        self._delegate = delegate
+        self._slow_ns = slow_ms * 1_000_000
+        self._sample_rate = sample_rate
+        self._max_traces = max_traces
+        self._traces: "OrderedDict[int, List[Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None) -> None:
+        pass
+
+    def _keep(self, root, spans: List[Any]) -> bool:
+        if any(s.status.status_code is StatusCode.ERROR for s in spans):
+            return True
+        if root.end_time - root.start_time >= self._slow_ns:
+            return True
+        return random.random() < self._sample_rate
+
+    def on_end(self, span) -> None:
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            spans = self._traces.pop(trace_id, [])
+            spans.append(span)
+            if not is_root:
+                self._traces[trace_id] = spans
+                while len(self._traces) > self._max_traces:
+                    self._traces.popitem(last=False)
+                return
+        if self._keep(span, spans):
+            for s in spans:
+                self._delegate.on_end(s)
+
+    def shutdown(self) -> None:
+        self._delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._delegate.force_flush(timeout_millis)
+
+
+class FileSpanExporter:
+    """Appends finished spans to a file, one JSON object per line."""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        from opentelemetry.sdk.trace.export import SpanExportResult
+
+        lines = "".join(json.dumps(json.loads(s.to_json()), separators=(",", ":")) + "\n" for s in spans)
+        with self._lock, open(self._path, "a", encoding="utf-8") as fh:
+            fh.write(lines)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+
+def _exporter(kind: str):
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        return OTLPSpanExporter()  # endpoint/headers from OTEL_EXPORTER_OTLP_* env vars
+    if kind == "file":
+        return FileSpanExporter(settings.otel_file_path)
+    if kind == "memory":
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+        return InMemorySpanExporter()
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+    return ConsoleSpanExporter()
+
+
+def setup_tracing() -> bool:
+    """Install the tracer provider; returns False if tracing is off or unavailable."""
+    global _tracer, memory_exporter
+    if not settings.otel_enabled or not HAVE_OTEL:
+        return False
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+
+        exporter = _exporter(settings.otel_exporter)
+    except ImportError:
+        logger.warning("OTEL_ENABLED is set but the OpenTelemetry SDK/exporter is not installed", exc_info=True)
+        return False
+    if settings.otel_exporter == "memory":
+        memory_exporter = exporter
+        delegate = SimpleSpanProcessor(exporter)
+    else:
+        delegate = BatchSpanProcessor(exporter)
+    provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "zariz-api")}))
+    provider.add_span_processor(TailSamplingProcessor(delegate, settings.otel_slow_ms, settings.otel_sample_rate))
+    trace.set_tracer_provider(provider)
+    _tracer = provider.get_tracer("zariz")
+    return True
+
+
+def start_server_span(scope) -> Any:
+    """(span, context token) for an HTTP request, or None when tracing is off."""
+    if _tracer is None:
+        return None
+    from opentelemetry import context as otel_context
+    from opentelemetry.propagate import extract
+
+    carrier = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+    span_ = _tracer.start_span(
+        f"{scope['method']} {scope['path']}",
+        context=extract(carrier),
+        kind=trace.SpanKind.SERVER,
+        attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+    )
+    return span_, otel_context.attach(trace.set_span_in_context(span_))
+
+
+def end_server_span(server, route: str, status_code: int, request_id: str, error: Optional[BaseException] = None) -> None:
+    from opentelemetry import context as otel_context
+
+    span_, token = server
+    otel_context.detach(token)
+    span_.update_name(f"{span_.attributes.get('http.request.method')} {route}")
+    span_.set_attribute("http.route", route)
+    span_.set_attribute("http.response.status_code", status_code)
+    span_.set_attribute("request.id", request_id)
+    if error is None and status_code >= 500:
+        span_.set_status(Status(StatusCode.ERROR))
+    end_span(span_, error)
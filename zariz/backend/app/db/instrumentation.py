@@ -0,0 +1,146 @@
+"""Database metrics: connection pool usage and SQL statements per request.
+
+``TimedQueuePool`` records how long callers wait for a pooled connection.
+``instrument_engine`` exports the pool's occupancy as gauges. Every
+engine's statements are counted and timed into the ``QueryStats`` of the
+current request (a contextvar set by the request middleware; threadpool
+endpoints inherit it), so the middleware can report them per route, in
+``Server-Timing`` and in the access log.
+
+Budgets catch N+1 patterns: ``SQL_STATEMENT_BUDGET`` caps statements per
+request and ``SQL_REPEAT_BUDGET`` caps executions of one statement shape
+(the same SQL text, i.e. a query issued in a loop). Normally an overrun is
+only logged; with ``SQL_STRICT=1`` (the test suite) the offending statement
+raises ``QueryBudgetExceeded``, so the traceback points at the loop.
+"""
+from __future__ import annotations
+
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+from ..core import metrics, tracing
+from ..core.config import settings
+
+DB_POOL_WAIT = metrics.histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting to check a connection out of the pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_TIMEOUTS = metrics.counter("db_pool_timeouts_total", "Connection checkouts that timed out waiting for the pool")
+DB_POOL_CHECKED_OUT = metrics.gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool", multiprocess_mode="livesum"
+)
+DB_POOL_IDLE = metrics.gauge("db_pool_idle", "Idle connections held by the pool", multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = metrics.gauge("db_pool_overflow", "Connections open beyond pool_size", multiprocess_mode="livesum")
+
+
+class TimedQueuePool(QueuePool):
+    """``QueuePool`` that observes checkout wait time."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def instrument_engine(engine: Engine) -> Engine:
+    """Export ``engine``'s pool occupancy (one instrumented engine per process)."""
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        metrics.track(DB_POOL_CHECKED_OUT, pool.checkedout)
+        metrics.track(DB_POOL_IDLE, pool.checkedin)
+        metrics.track(DB_POOL_OVERFLOW, lambda: max(0, pool.overflow()))
+    return engine
+
+
+class QueryBudgetExceeded(Exception):
+    """A request executed more statements (or repeated one more often) than allowed."""
+
+
+# Expanded IN lists differ only in their number of placeholders
+_IN_LIST = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|:\w+)\s*\)")
+
+
+def statement_shape(statement: str) -> str:
+    return _IN_LIST.sub("(...)", statement)
+
+
+class QueryStats:
+    """SQL statements executed on behalf of one request."""
+
+    __slots__ = ("statements", "seconds", "shapes", "scope")
+
+    def __init__(self, scope: Optional[dict] = None) -> None:
+        self.statements = 0
+        self.seconds = 0.0
+        self.shapes: Counter = Counter()
+        # The ASGI scope of the request (for its route template)
+        self.scope = scope
+
+    def violations(self) -> List[str]:
+        """Budget overruns so far (empty when within budget or budgets are off)."""
+        found = []
+        if 0 < settings.sql_statement_budget < self.statements:
+            found.append(f"{self.statements} statements (budget {settings.sql_statement_budget})")
+        if settings.sql_repeat_budget > 0 and self.shapes:
+            shape, n = self.shapes.most_common(1)[0]
+            if n > settings.sql_repeat_budget:
+                found.append(f"{n}x the same statement (budget {settings.sql_repeat_budget}): {shape[:200]}")
+        return found
+
+
+request_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("request_query_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = tracing.start_span("db.query", {"db.system": conn.dialect.name, "db.statement": statement[:2000]})
+    if span is not None:
+        context._zariz_span = span
+    context._zariz_start = time.perf_counter()
+    stats = request_query_stats.get()
+    if stats is None:
+        return
+    stats.statements += 1
+    if settings.sql_repeat_budget > 0:
+        stats.shapes[statement_shape(statement)] += 1
+    if settings.sql_strict:
+        problems = stats.violations()
+        if problems:
+            raise QueryBudgetExceeded("; ".join(problems))
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = getattr(context, "_zariz_span", None)
+    if span is not None:
+        span.set_attribute("db.rowcount", cursor.rowcount)
+        tracing.end_span(span)
+    stats = request_query_stats.get()
+    if stats is not None:
+        stats.seconds += time.perf_counter() - context._zariz_start
+
+
+@event.listens_for(Engine, "handle_error")
+def _statement_failed(exception_context):
+    context = exception_context.execution_context
+    span = getattr(context, "_zariz_span", None)
+    if span is not None:
+        tracing.end_span(span, exception_context.original_exception)
+    start = getattr(context, "_zariz_start", None)
+    stats = request_query_stats.get()
+    if stats is not None and start is not None:
+        stats.seconds += time.perf_counter() - start
@@ -1,10 +1,14 @@
-from sqlalchemy import Integer, String, ForeignKey
+from sqlalchemy import Integer, String, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from ..base import Base
 
 
 class Device(Base):
     __tablename__ = "devices"
+    __table_args__ = (
+        # Push audience lookups: tokens of given users on a platform
+        Index("ix_devices_user_platform", "user_id", "platform"),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int | None] = mapped_column(ForeignKey("users.id"), nullable=True)
     platform: Mapped[str] = mapped_column(String(16))  # ios
@@ -1,14 +1,20 @@
-from sqlalchemy import String, Integer, Text
+from sqlalchemy import DateTime, Index, LargeBinary, String, Integer
 from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
 
 from ..base import Base
 
 
 class IdempotencyKey(Base):
     __tablename__ = "idempotency_keys"
+    __table_args__ = (Index("ix_idempotency_keys_expires_at", "expires_at"),)
     key: Mapped[str] = mapped_column(String, primary_key=True)
     method: Mapped[str] = mapped_column(String)
     path: Mapped[str] = mapped_column(String)
-    status_code: Mapped[int] = mapped_column(Integer)
-    response_body: Mapped[str] = mapped_column(Text)
-
+    # in_progress: reserved by a running request; completed: response stored
+    state: Mapped[str] = mapped_column(String(16), default="completed", server_default="completed")
+    status_code: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    response_body: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+    # Lease end while in progress, replay window end once completed; purged after
+    expires_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,19 @@
+from sqlalchemy import Integer, Text, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+from ..base import Base
+
+
+class OutboxEvent(Base):
+    """Order event pending delivery to the event bus and push subsystem.
+
+    Written in the same transaction as the state change; removed by the
+    outbox dispatcher once delivered (at-least-once).
+    """
+
+    __tablename__ = "event_outbox"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    event: Mapped[str] = mapped_column(Text)  # JSON published on the event bus
+    push: Mapped[str | None] = mapped_column(Text, nullable=True)  # JSON push spec (audience + data)
+    # Failed push hand-offs; the event itself was published on the first attempt
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
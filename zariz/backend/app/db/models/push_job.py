@@ -0,0 +1,23 @@
+from sqlalchemy import Integer, String, Text, DateTime, Index, func
+from sqlalchemy.orm import Mapped, mapped_column
+from ..base import Base
+
+
+class PushJob(Base):
+    """One silent push to one device, processed by ``python -m app.worker``.
+
+    Delivered jobs are deleted; failed ones are rescheduled with backoff and
+    end up ``dead`` after ``push_max_attempts``.
+    """
+
+    __tablename__ = "push_jobs"
+    __table_args__ = (Index("ix_push_jobs_status_next_attempt", "status", "next_attempt_at"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    token: Mapped[str] = mapped_column(String(256))
+    payload: Mapped[str] = mapped_column(Text)  # JSON custom data
+    status: Mapped[str] = mapped_column(String(16), default="pending")  # pending/dead
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,24 @@
+from sqlalchemy import Float, Index, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..base import Base
+
+
+class RateLimitBucket(Base):
+    """Shared token bucket of one rate limit key (``RATE_LIMIT_STORAGE=zariz-db://``).
+
+    Times are epoch seconds so the refill arithmetic is plain SQL on every
+    dialect. ``tokens`` may go below zero when workers together overshoot
+    between syncs; the debt is paid back before the key admits again.
+    """
+
+    __tablename__ = "rate_limit_buckets"
+    __table_args__ = (Index("ix_rate_limit_buckets_expires_at", "expires_at"),)
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    capacity: Mapped[float] = mapped_column(Float)
+    rate: Mapped[float] = mapped_column(Float)  # tokens per second
+    tokens: Mapped[float] = mapped_column(Float)
+    updated_at: Mapped[float] = mapped_column(Float)
+    # When the bucket is full again (the row is then equivalent to no row and is purged)
+    expires_at: Mapped[float] = mapped_column(Float)
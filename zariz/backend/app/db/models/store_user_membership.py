@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, Boolean, String, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy import Integer, Boolean, String, ForeignKey, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import func
 from ..base import Base
@@ -8,6 +8,7 @@ class StoreUserMembership(Base):
     __tablename__ = "store_user_memberships"
     __table_args__ = (
         UniqueConstraint("user_id", "store_id", name="uq_store_user_membership_user_store"),
+        Index("ix_store_user_memberships_store_id", "store_id"),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import String, Integer, DateTime, ForeignKey
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import func
 from ..base import Base
@@ -19,3 +19,7 @@ class User(Base):
     updated_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     store_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
     capacity_boxes: Mapped[int] = mapped_column(Integer, default=8)
+
+
+# Case-insensitive email lookup for login
+Index("ix_users_email_lower", func.lower(User.email))
@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, ForeignKey, String, DateTime
+from sqlalchemy import Index, Integer, ForeignKey, String, DateTime, text
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import func
 from ..base import Base
@@ -6,9 +6,20 @@ from ..base import Base
 
 class UserSession(Base):
     __tablename__ = "user_sessions"
+    __table_args__ = (
+        # Live sessions only: revoked rows (most of the table between purges) stay out of the index
+        Index(
+            "ix_user_sessions_active",
+            "expires_at",
+            postgresql_where=text("revoked_at IS NULL"),
+            sqlite_where=text("revoked_at IS NULL"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    # Lookup half of a "selector.verifier" refresh token; NULL for legacy sessions
+    selector: Mapped[str | None] = mapped_column(String(32), unique=True, index=True, nullable=True)
     refresh_token_hash: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
     issued_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     expires_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False)
@@ -1,14 +1,21 @@
+from functools import lru_cache
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from .base import Base
+from . import slow_queries  # noqa: F401  (registers the slow-query hook)
+from .instrumentation import TimedQueuePool, instrument_engine
 from ..core.config import settings
 
 
+@lru_cache(maxsize=1)
 def get_engine():
-    return create_engine(settings.db_url, pool_pre_ping=True)
+    # One engine (and connection pool) per process
+    return instrument_engine(create_engine(settings.db_url, pool_pre_ping=True, poolclass=TimedQueuePool))
 
 
+@lru_cache(maxsize=1)
 def get_sessionmaker():
     return sessionmaker(bind=get_engine(), autoflush=False, autocommit=False)
 
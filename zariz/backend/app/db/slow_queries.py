@@ -0,0 +1,171 @@
+"""Slow-query log with plan capture.
+
+Statements slower than ``SLOW_QUERY_MS`` are logged (logger
+``app.slow_query``) with a fingerprint, the normalized SQL, the shape of
+the bound parameters (types only, never values) and the route of the
+request that ran them. The first time a fingerprint is seen (again after
+``SLOW_QUERY_EXPLAIN_INTERVAL`` seconds) its plan is captured by a
+background thread on a separate pooled connection (``EXPLAIN (FORMAT
+JSON)`` on Postgres, ``EXPLAIN QUERY PLAN`` on SQLite) and logged once,
+so repeated slow statements add one short line each. The driver inlines
+the bound values into the explained statement, so literals are scrubbed
+from the plan's conditions (``Index Cond``, ``Filter``...) before logging.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ..core import metrics
+from ..core.config import settings
+from .instrumentation import request_query_stats, statement_shape
+
+logger = logging.getLogger("app.slow_query")
+
+SLOW_QUERIES = metrics.counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS")
+
+_EXPLAIN = {"postgresql": "EXPLAIN (FORMAT JSON) ", "sqlite": "EXPLAIN QUERY PLAN "}
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    """SQL with literals replaced by ``?``, IN lists collapsed and whitespace squeezed."""
+    sql = _STRING.sub("?", statement_shape(statement))
+    return _SPACE.sub(" ", _NUMBER.sub("?", sql)).strip()
+
+
+def scrub_plan(plan: Any) -> Any:
+    """``plan`` with string and number literals inside its text fields replaced by ``?``."""
+    if isinstance(plan, dict):
+        return {k: scrub_plan(v) for k, v in plan.items()}
+    if isinstance(plan, list):
+        return [scrub_plan(v) for v in plan]
+    if isinstance(plan, str):
+        return _NUMBER.sub("?", _STRING.sub("?", plan))
+    return plan
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def parameter_shape(parameters: Any, executemany: bool) -> Any:
+    """Types of the bound parameters (values are never logged)."""
+    if executemany and isinstance(parameters, (list, tuple)) and parameters:
+        return {"rows": len(parameters), "row": parameter_shape(parameters[0], False)}
+    if isinstance(parameters, dict):
+        return {k: type(v).__name__ for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(v).__name__ for v in parameters]
+    return type(parameters).__name__
+
+
+class PlanCapture:
+    """Background thread running EXPLAIN for new slow fingerprints."""
+
+    def __init__(self, maxsize: int = 100, remember: int = 1000) -> None:
+        self._queue: "queue.Queue" = queue.Queue(maxsize)
+        self._remember = remember
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _is_due(self, fp: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            last = self._seen.get(fp)
+            if last is not None and now - last < settings.slow_query_explain_interval:
+                return False
+            self._seen[fp] = now
+            self._seen.move_to_end(fp)
+            while len(self._seen) > self._remember:
+                self._seen.popitem(last=False)
+            return True
+
+    def submit(self, engine: Engine, fp: str, statement: str, parameters: Any) -> bool:
+        """Queue a plan capture unless this fingerprint was explained recently."""
+        if engine.dialect.name not in _EXPLAIN or not self._is_due(fp):
+            return False
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="slow-query-explain", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((engine, fp, statement, parameters))
+            return True
+        except queue.Full:
+            return False
+
+    def join(self) -> None:
+        """Wait until queued captures are done (tests)."""
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            engine, fp, statement, parameters = self._queue.get()
+            try:
+                plan = scrub_plan(self.explain(engine, statement, parameters))
+                logger.info("slow query plan", extra={"fields": {"fingerprint": fp, "plan": plan}})
+            except Exception as exc:
+                # Not str(exc): SQLAlchemy errors include the bound parameters
+                error = f"{type(exc).__name__}: {scrub_plan(str(getattr(exc, 'orig', exc)))}"
+                logger.info("slow query plan unavailable", extra={"fields": {"fingerprint": fp, "error": error[:500]}})
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def explain(engine: Engine, statement: str, parameters: Any) -> Any:
+        prefix = _EXPLAIN[engine.dialect.name]
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql(prefix + statement, parameters).all()
+            conn.rollback()
+        if engine.dialect.name == "postgresql":
+            return rows[0][0]
+        return [row[-1] for row in rows]
+
+
+plan_capture = PlanCapture()
+
+
+def _route() -> Optional[str]:
+    stats = request_query_stats.get()
+    if stats is None or stats.scope is None:
+        return None
+    from ..core.middleware import route_template
+
+    return route_template(stats.scope)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _log_slow_statement(conn, cursor, statement, parameters, context, executemany):
+    threshold = settings.slow_query_ms
+    start = getattr(context, "_zariz_start", None)
+    if threshold <= 0 or start is None:
+        return
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if elapsed_ms < threshold or statement.lstrip()[:7].upper() == "EXPLAIN":
+        return
+    SLOW_QUERIES.inc()
+    normalized = normalize(statement)
+    fp = fingerprint(normalized)
+    fields: Dict[str, Any] = {
+        "fingerprint": fp,
+        "duration_ms": round(elapsed_ms, 2),
+        "route": _route(),
+        "sql": normalized[:2000],
+        "params": parameter_shape(parameters, executemany),
+    }
+    if settings.slow_query_explain and not executemany and normalized.split(" ", 1)[0].upper() in {"SELECT", "WITH"}:
+        fields["plan_queued"] = plan_capture.submit(conn.engine, fp, statement, parameters)
+    logger.warning("slow query", extra={"fields": fields})
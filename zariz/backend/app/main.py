@@ -1,15 +1,56 @@
+import asyncio
+import hmac
 import os
-import time
-import uuid
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from starlette.middleware.cors import CORSMiddleware
 from .api import api_router
-from .core.limits import limiter
+from .core import metrics
+from .core.config import settings
+from .core.hashing import HashingBusy, password_hasher
+from .core.limits import limiter, stop_rate_limits
 from .core.logging import setup_logging
+from .core.middleware import RequestLogMiddleware
+from .core.tracing import setup_tracing
+from .services.outbox import outbox_dispatcher
+from .services.sessions import revocation_listener
+from .worker import push
+from .worker.dispatcher import push_dispatcher
+from .worker.maintenance import maintenance_task
 from slowapi.middleware import SlowAPIMiddleware
 
 setup_logging()
-app = FastAPI(title="Zariz API", version="0.1.0")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics.gauge_refresher.start(settings.metrics_gauge_interval)
+    warm_up = None
+    if settings.background_tasks:
+        # Push client setup (key material, apns2 import) must not delay startup
+        warm_up = asyncio.create_task(asyncio.to_thread(push.warm_up))
+        if settings.push_queue_backend != "db":
+            push_dispatcher.start()
+        outbox_dispatcher.start()
+        revocation_listener.start()
+        maintenance_task.start()
+    try:
+        yield
+    finally:
+        if settings.background_tasks:
+            # Outbox first: its final drain may still hand pushes to the dispatcher
+            await maintenance_task.stop()
+            await outbox_dispatcher.stop()
+            await asyncio.to_thread(push_dispatcher.stop)
+            await warm_up
+            await asyncio.to_thread(revocation_listener.stop)
+        await asyncio.to_thread(password_hasher.shutdown)
+        await asyncio.to_thread(stop_rate_limits)
+        await asyncio.to_thread(metrics.gauge_refresher.stop)
+
+
+app = FastAPI(title="Zariz API", version="0.1.0", lifespan=lifespan)
 
 # Rate limiting (add first, executes last)
 app.state.limiter = limiter
@@ -25,60 +66,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request ID and latency logging (outermost: times everything below it)
+app.add_middleware(RequestLogMiddleware)
+
 app.include_router(api_router, prefix="/v1")
 
-# Request ID and latency logging
-@app.middleware("http")
-async def add_request_id_and_log(request: Request, call_next):
-    req_id = request.headers.get("X-Request-ID") or str(uuid.uuid4())
-    start = time.perf_counter()
-    
-    # Read request body for logging errors
-    body = None
-    if request.method in ["POST", "PUT", "PATCH"]:
-        body = await request.body()
-        # Re-create request with body for downstream handlers
-        async def receive():
-            return {"type": "http.request", "body": body}
-        request._receive = receive
-    
-    response = await call_next(request)
-    duration_ms = (time.perf_counter() - start) * 1000
-    response.headers["X-Request-ID"] = req_id
-    import logging as _logging
-
-    log_data = {
-        "method": request.method,
-        "path": request.url.path,
-        "status_code": response.status_code,
-        "duration_ms": round(duration_ms, 2),
-        "request_id": req_id,
-    }
-    
-    # Add request body for error responses
-    if response.status_code >= 400 and body:
-        try:
-            log_data["request_body"] = body.decode("utf-8")[:500]  # Limit to 500 chars
-        except:
-            pass
-    
-    _logging.getLogger("app").info(json_log(**log_data))
-    return response
-
-
-def json_log(**kwargs):
-    import json as _json
-
-    return _json.dumps(kwargs, ensure_ascii=False)
-
-# Optional OpenTelemetry instrumentation
-if os.getenv("OTEL_ENABLED"):
-    try:
-        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 
-        FastAPIInstrumentor.instrument_app(app)
-    except Exception:
-        pass
+@app.exception_handler(HashingBusy)
+async def hashing_busy_handler(request: Request, exc: HashingBusy):
+    # Shed login storms instead of queueing them behind the hashing pool
+    return JSONResponse(status_code=503, content={"detail": "Server busy, retry shortly"}, headers={"Retry-After": "1"})
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint(request: Request):
+    expected = f"Bearer {settings.metrics_token}".encode()
+    if settings.metrics_token and not hmac.compare_digest(request.headers.get("Authorization", "").encode(), expected):
+        return JSONResponse(status_code=401, content={"detail": "Unauthorized"})
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+# Optional OpenTelemetry tracing (request spans come from RequestLogMiddleware)
+setup_tracing()
 
 # Optional Sentry
 dsn = os.getenv("SENTRY_DSN")
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from ..db.models.device import Device
+from ..db.models.store_user_membership import StoreUserMembership
+from ..db.models.user import User
+
+
+def audience_tokens(
+    db: Session,
+    *,
+    store_id: Optional[int] = None,
+    courier_id: Optional[int] = None,
+    include_admins: bool = True,
+    platform: str = "ios",
+) -> list[str]:
+    """Device tokens of the users involved in an order.
+
+    Recipients are the assigned courier, the store's members (via
+    store_user_memberships) and admins. Resolved in one query that hits the
+    ``(user_id, platform)`` device index, so cost follows involvement rather
+    than the size of the device fleet.
+    """
+    recipients = []
+    if courier_id is not None:
+        recipients.append(Device.user_id == courier_id)
+    if store_id is not None:
+        recipients.append(
+            Device.user_id.in_(
+                select(StoreUserMembership.user_id).where(StoreUserMembership.store_id == store_id)
+            )
+        )
+    if include_admins:
+        recipients.append(Device.user_id.in_(select(User.id).where(User.role == "admin")))
+    if not recipients:
+        return []
+    q = select(Device.token).where(Device.platform == platform, or_(*recipients))
+    return list(db.execute(q).scalars().all())
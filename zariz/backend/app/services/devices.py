@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import logging
+from typing import Iterable
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from ..core import metrics
+from ..db.models.device import Device
+
+logger = logging.getLogger(__name__)
+
+PUSH_TOKENS_PRUNED = metrics.counter("push_tokens_pruned_total", "Device tokens deleted after the provider rejected them")
+
+_PRUNE_CHUNK = 500
+
+
+def prune_tokens(db: Session, tokens: Iterable[str]) -> int:
+    """Delete devices whose tokens the push provider reported as invalid (caller commits)."""
+    tokens = sorted(set(tokens))
+    removed = 0
+    for i in range(0, len(tokens), _PRUNE_CHUNK):
+        res = db.execute(delete(Device).where(Device.token.in_(tokens[i : i + _PRUNE_CHUNK])))
+        removed += res.rowcount or 0
+    if removed:
+        PUSH_TOKENS_PRUNED.inc(removed)
+        logger.info("pruned %s invalid device tokens", removed)
+    return removed
+
+
+def prune_tokens_now(tokens: Iterable[str]) -> int:
+    """``prune_tokens`` in its own session, for callers outside a request (push workers)."""
+    from ..db.session import get_sessionmaker
+
+    with get_sessionmaker()() as db:
+        removed = prune_tokens(db, tokens)
+        db.commit()
+        return removed
@@ -1,64 +1,157 @@
 import asyncio
 import json
-from typing import Any, Dict, Set
+from typing import Any, Dict, Iterable, Optional, Set
+
+try:
+    import msgpack  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    msgpack = None  # type: ignore
+
+from ..core import metrics, tracing
+
+EVENT_SUBSCRIBERS = metrics.gauge("events_subscribers", "Connected SSE/WebSocket subscribers", multiprocess_mode="livesum")
+EVENT_QUEUE_DEPTH = metrics.gauge(
+    "events_queued_frames", "Frames published but not yet written, summed over subscribers", multiprocess_mode="livesum"
+)
+EVENT_QUEUE_MAX = metrics.gauge("events_queued_frames_max", "Largest backlog of any single subscriber", multiprocess_mode="livemax")
+
+
+class EventFrame(str):
+    """A published event, pre-encoded once and shared by every subscriber.
+
+    The string value is the JSON text (what SSE writes verbatim); the original
+    dict and a lazily built MessagePack encoding are attached for binary
+    WebSocket clients so each format is encoded at most once per event.
+    """
+
+    event: Dict[str, Any]
+    _packed: Optional[bytes]
+
+    def __new__(cls, event: Dict[str, Any]) -> "EventFrame":
+        frame = super().__new__(cls, json.dumps(event))
+        frame.event = event
+        frame._packed = None
+        return frame
+
+    @property
+    def packed(self) -> bytes:
+        if self._packed is None:
+            if msgpack is None:
+                raise RuntimeError("msgpack is not installed")
+            self._packed = msgpack.packb(self.event, use_bin_type=True)
+        return self._packed
+
+
+def event_topics(event: Dict[str, Any]) -> Set[str]:
+    """Topics an event is routed to: ``orders`` plus order/store/courier scoped ones."""
+    topics = {"orders"}
+    if event.get("order_id") is not None:
+        topics.add(f"order:{event['order_id']}")
+    if event.get("store_id") is not None:
+        topics.add(f"store:{event['store_id']}")
+    if event.get("courier_id") is not None:
+        topics.add(f"courier:{event['courier_id']}")
+    return topics
+
+
+class _Subscriber:
+    __slots__ = ("loop", "topics")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None, topics: Set[str] | None) -> None:
+        self.loop = loop
+        # None means "everything" (SSE default)
+        self.topics = topics
 
 
 class EventBus:
-    """A simple in-memory pub/sub for server-sent events.
+    """A simple in-memory pub/sub for server-sent events and WebSockets.
 
-    - Subscribers receive dictionaries; SSE route formats as JSON lines.
-    - Thread-safe publish via loop.call_soon_threadsafe to support sync endpoints.
+    - Subscribers receive ``EventFrame`` strings (JSON text); SSE writes them as-is.
+    - Each subscriber remembers the loop it was created on, so publishing from
+      sync endpoints (threadpool) hands off via ``call_soon_threadsafe``.
+    - Subscribers may narrow delivery to a set of topics (see ``event_topics``).
     """
 
     def __init__(self) -> None:
-        self._subscribers: Set[asyncio.Queue] = set()
-        self._loop: asyncio.AbstractEventLoop | None = None
+        self._subscribers: Dict[asyncio.Queue, _Subscriber] = {}
 
-    def _ensure_loop(self) -> asyncio.AbstractEventLoop | None:
-        if self._loop is None:
-            try:
-                self._loop = asyncio.get_running_loop()
-            except RuntimeError:
-                # No running loop in this thread; will try again on publish from within ASGI context.
-                self._loop = None
-        return self._loop
+    @staticmethod
+    def _running_loop() -> asyncio.AbstractEventLoop | None:
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
 
-    def subscribe(self) -> asyncio.Queue:
+    def subscribe(self, topics: Iterable[str] | None = None) -> asyncio.Queue:
         q: asyncio.Queue = asyncio.Queue()
-        self._subscribers.add(q)
-        # Try to capture loop in case it's available now
-        self._ensure_loop()
+        self._subscribers[q] = _Subscriber(self._running_loop(), set(topics) if topics is not None else None)
         return q
 
     def unsubscribe(self, q: asyncio.Queue) -> None:
-        self._subscribers.discard(q)
+        self._subscribers.pop(q, None)
+
+    def set_topics(self, q: asyncio.Queue, topics: Iterable[str] | None) -> None:
+        sub = self._subscribers.get(q)
+        if sub is not None:
+            sub.topics = set(topics) if topics is not None else None
+
+    def topics_of(self, q: asyncio.Queue) -> Set[str] | None:
+        sub = self._subscribers.get(q)
+        return None if sub is None or sub.topics is None else set(sub.topics)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def queue_depths(self) -> list[int]:
+        """Undelivered frames per subscriber (safe to call from any thread)."""
+        return [q.qsize() for q in list(self._subscribers)]
 
     def publish(self, event: Dict[str, Any]) -> None:
-        """Publish an event to all subscribers.
+        """Publish an event to all matching subscribers.
 
-        Can be called from sync code. Uses call_soon_threadsafe to put_nowait into queues.
+        Can be called from sync code. Queues owned by another loop are fed via
+        call_soon_threadsafe (one callback per loop); queues without a loop
+        (e.g. created outside ASGI in tests) are fed synchronously.
         """
-        loop = self._ensure_loop()
+        with tracing.span("events.publish", {"event.type": str(event.get("type")), "events.subscribers": self.subscriber_count}):
+            self._publish(event)
+
+    def _publish(self, event: Dict[str, Any]) -> None:
         # Format once to avoid repeating work
-        data = json.dumps(event)
-
-        def _deliver() -> None:
-            # Remove any closed/garbage queues opportunistically if they raise
-            dead: list[asyncio.Queue] = []
-            for q in list(self._subscribers):
-                try:
-                    q.put_nowait(data)
-                except Exception:
-                    dead.append(q)
-            for q in dead:
-                self._subscribers.discard(q)
-
-        if loop is not None:
-            loop.call_soon_threadsafe(_deliver)
-        else:
-            # If no loop known, attempt best-effort synchronous delivery (for tests)
-            _deliver()
+        frame = EventFrame(event)
+        topics = event_topics(event)
+        current = self._running_loop()
 
+        by_loop: Dict[asyncio.AbstractEventLoop, list[asyncio.Queue]] = {}
+        dead: list[asyncio.Queue] = []
+        for q, sub in list(self._subscribers.items()):
+            if sub.topics is not None and sub.topics.isdisjoint(topics):
+                continue
+            loop = sub.loop
+            if loop is None or loop is current:
+                q.put_nowait(frame)
+            elif loop.is_closed():
+                dead.append(q)
+            else:
+                by_loop.setdefault(loop, []).append(q)
+        for q in dead:
+            self._subscribers.pop(q, None)
 
-events_bus = EventBus()
+        for loop, queues in by_loop.items():
+            def _deliver(queues: list[asyncio.Queue] = queues) -> None:
+                for q in queues:
+                    q.put_nowait(frame)
 
+            try:
+                loop.call_soon_threadsafe(_deliver)
+            except RuntimeError:
+                # Loop closed between the check and the call
+                for q in queues:
+                    self._subscribers.pop(q, None)
+
+
+events_bus = EventBus()
+metrics.track(EVENT_SUBSCRIBERS, lambda: events_bus.subscriber_count)
+metrics.track(EVENT_QUEUE_DEPTH, lambda: sum(events_bus.queue_depths()))
+metrics.track(EVENT_QUEUE_MAX, lambda: max(events_bus.queue_depths(), default=0))
@@ -0,0 +1,199 @@
+"""Idempotency-Key handling: reserve, then complete.
+
+The first request with a key inserts it as ``in_progress`` (committed before
+the handler runs, so the primary key makes the reservation atomic). A
+concurrent duplicate sees the reservation and waits up to
+``idempotency_wait_seconds`` for the result, then replays it; if the first
+request is still running it gets 409. The handler stages ``complete()`` in
+its own transaction, so the stored response commits atomically with the
+change it describes. Responses are stored as raw bytes and recent ones are
+kept in a per-worker LRU so replays skip the database. A reservation whose
+handler failed is released; one left by a crashed worker lapses after
+``idempotency_lease_seconds``.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..core import metrics
+from ..core.config import settings
+from ..db.models.idempotency import IdempotencyKey
+
+IDEMPOTENCY_REPLAYS = metrics.counter("idempotency_replays_total", "Requests answered from a stored response", ["source"])
+IDEMPOTENCY_CONFLICTS = metrics.counter("idempotency_conflicts_total", "Duplicate requests rejected while the original was in flight")
+
+_POLL_SECONDS = 0.05
+
+# key -> (method, path, status_code, body, expires_at epoch)
+_Entry = Tuple[str, str, int, bytes, float]
+
+
+class ResponseCache:
+    """Thread-safe LRU of completed responses."""
+
+    def __init__(self, maxsize: int) -> None:
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[4] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: _Entry) -> None:
+        if self._maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache(settings.idempotency_cache_size)
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite returns naive datetimes (stored as UTC)
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _replay(status_code: int, body: bytes) -> Response:
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+
+class IdempotentRequest:
+    """One request's claim on an ``Idempotency-Key``.
+
+    ``replay`` is set when an earlier request already produced the response;
+    the handler should return it unchanged. Otherwise the handler calls
+    ``complete()`` before its commit.
+    """
+
+    def __init__(self, db: Session, key: str, method: str, path: str) -> None:
+        self.db = db
+        self.key = key
+        self.method = method
+        self.path = path
+        self.replay: Optional[Response] = None
+        self._completed: Optional[_Entry] = None
+
+    def complete(self, status_code: int, body: Any) -> None:
+        """Stage the response in the handler's transaction (committed with it)."""
+        raw = body if isinstance(body, bytes) else json.dumps(body, separators=(",", ":")).encode("utf-8")
+        expires_at = datetime.now(timezone.utc) + timedelta(hours=settings.idempotency_ttl_hours)
+        rec = self.db.get(IdempotencyKey, self.key)
+        if rec is None:  # reservation lapsed and was purged mid-request
+            rec = IdempotencyKey(key=self.key, method=self.method, path=self.path)
+            self.db.add(rec)
+        rec.state = "completed"
+        rec.status_code = status_code
+        rec.response_body = raw
+        rec.expires_at = expires_at
+        self._completed = (self.method, self.path, status_code, raw, expires_at.timestamp())
+
+    def finish(self) -> None:
+        """After a successful handler: make sure the response is stored and cache it."""
+        if self._completed is None:
+            self.release()
+            return
+        self.db.commit()
+        response_cache.put(self.key, self._completed)
+
+    def release(self) -> None:
+        """Drop our reservation so the client can retry (the handler failed)."""
+        self.db.rollback()
+        self.db.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.key == self.key, IdempotencyKey.state == "in_progress")
+        )
+        self.db.commit()
+
+
+def _check_target(method: str, path: str, rec_method: str, rec_path: str) -> None:
+    if rec_method != method or rec_path != path:
+        raise HTTPException(status_code=409, detail="Idempotency-Key reused for different request")
+
+
+def begin(db: Session, key: str, method: str, path: str) -> IdempotentRequest:
+    """Reserve ``key`` for this request, or resolve it to a stored response.
+
+    Raises 409 if the key belongs to a different endpoint, or if the request
+    holding it is still running after ``idempotency_wait_seconds``.
+    """
+    req = IdempotentRequest(db, key, method, path)
+    cached = response_cache.get(key)
+    if cached is not None:
+        _check_target(method, path, cached[0], cached[1])
+        IDEMPOTENCY_REPLAYS.labels("cache").inc()
+        req.replay = _replay(cached[2], cached[3])
+        return req
+
+    deadline = time.monotonic() + settings.idempotency_wait_seconds
+    while True:
+        now = datetime.now(timezone.utc)
+        try:
+            db.execute(
+                insert(IdempotencyKey).values(
+                    key=key,
+                    method=method,
+                    path=path,
+                    state="in_progress",
+                    expires_at=now + timedelta(seconds=settings.idempotency_lease_seconds),
+                )
+            )
+            db.commit()
+            return req
+        except IntegrityError:
+            db.rollback()
+
+        rec = db.get(IdempotencyKey, key, populate_existing=True)
+        if rec is None:
+            continue  # released or purged meanwhile; try to reserve again
+        _check_target(method, path, rec.method, rec.path)
+        expires_at = _aware(rec.expires_at)
+        if expires_at is not None and expires_at <= now:
+            # Lapsed lease or expired response: take the key over
+            db.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.expires_at <= now),
+                execution_options={"synchronize_session": False},
+            )
+            db.commit()
+            continue
+        if rec.state == "completed":
+            body = rec.response_body if isinstance(rec.response_body, bytes) else str(rec.response_body).encode("utf-8")
+            expires = expires_at.timestamp() if expires_at else time.time() + settings.idempotency_ttl_hours * 3600
+            response_cache.put(key, (rec.method, rec.path, rec.status_code, body, expires))
+            IDEMPOTENCY_REPLAYS.labels("db").inc()
+            req.replay = _replay(rec.status_code, body)
+            db.rollback()
+            return req
+        if time.monotonic() >= deadline:
+            db.rollback()
+            IDEMPOTENCY_CONFLICTS.inc()
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+        db.rollback()
+        time.sleep(_POLL_SECONDS)
@@ -0,0 +1,68 @@
+"""Cached store memberships for token issuance.
+
+Login and refresh both need a user's store ids for the access token. They
+are cached per user for ``membership_cache_ttl`` seconds. Memberships change
+rarely (admin actions), so ``invalidate`` simply bumps the cache version,
+which also discards reads that were in flight; call it wherever memberships
+change. Other workers converge within the TTL.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..core import metrics
+from ..core.config import settings
+from ..db.models.store_user_membership import StoreUserMembership
+from ..db.models.user import User
+
+MEMBERSHIP_CACHE_HITS = metrics.counter("membership_cache_hits_total", "Store membership lookups served from cache")
+MEMBERSHIP_CACHE_MISSES = metrics.counter("membership_cache_misses_total", "Store membership lookups that hit the database")
+
+_lock = threading.Lock()
+_version = 0
+# user_id -> (version, cached_until, store_ids)
+_entries: Dict[int, Tuple[int, float, List[int]]] = {}
+
+
+def _load(db: Session, user_id: int) -> List[int]:
+    return list(db.execute(select(StoreUserMembership.store_id).where(StoreUserMembership.user_id == user_id)).scalars())
+
+
+def store_ids_for(db: Session, user: User) -> List[int]:
+    """Store ids for the access token (memberships, else the user's default store)."""
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(user.id)
+        if entry is not None and entry[0] == _version and entry[1] > now:
+            store_ids: Optional[List[int]] = entry[2]
+        else:
+            store_ids = None
+        version = _version
+    if store_ids is not None:
+        MEMBERSHIP_CACHE_HITS.inc()
+    else:
+        MEMBERSHIP_CACHE_MISSES.inc()
+        store_ids = _load(db, user.id)
+        if settings.membership_cache_ttl > 0:
+            with _lock:
+                # A concurrent invalidate() wins over this (possibly stale) read
+                if version == _version:
+                    _entries[user.id] = (version, now + settings.membership_cache_ttl, store_ids)
+                    if len(_entries) > settings.membership_cache_size:
+                        _entries.pop(next(iter(_entries)))
+    if not store_ids and user.default_store_id:
+        return [int(user.default_store_id)]
+    return list(store_ids)
+
+
+def invalidate() -> None:
+    """Forget all cached memberships in this worker."""
+    global _version
+    with _lock:
+        _version += 1
+        _entries.clear()
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..db.models.outbox import OutboxEvent
+from ..worker import jobs
+from ..worker.dispatcher import push_dispatcher
+from .audience import audience_tokens
+from .events import events_bus
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(db: Session, event: Dict[str, Any], push: Optional[Dict[str, Any]] = None) -> None:
+    """Stage an event (and optional push) in the caller's transaction.
+
+    ``push`` is ``{"store_id": ..., "courier_id": ..., "data": {...}}``; the
+    audience (courier, store members, admins) is resolved at dispatch time,
+    see ``audience_tokens``.
+    """
+    db.add(OutboxEvent(event=json.dumps(event), push=json.dumps(push) if push else None))
+
+
+def order_push(order_id: int, store_id: Optional[int], courier_id: Optional[int], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Push spec for the users involved in an order."""
+    return {"order_id": order_id, "store_id": store_id, "courier_id": courier_id, "data": data}
+
+
+def dispatch_batch(db: Session, limit: Optional[int] = None) -> int:
+    """Deliver up to ``limit`` pending outbox rows; returns how many were delivered.
+
+    Rows are locked with SKIP LOCKED so concurrent dispatchers split the work,
+    delivered to the event bus and handed to the push dispatcher (or staged as
+    push jobs), then deleted in one statement. A crash before the commit
+    redelivers the batch (at-least-once). A row whose push could not be handed
+    off (audience lookup failed, dispatcher queue full) is kept and retried on
+    the next run, without publishing its event again, until
+    ``outbox_max_attempts``.
+    """
+    rows = (
+        db.execute(
+            select(OutboxEvent)
+            .order_by(OutboxEvent.id)
+            .limit(limit or settings.outbox_batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        .scalars()
+        .all()
+    )
+    if not rows:
+        db.rollback()
+        return 0
+    delivered: list[int] = []
+    # Without dispatcher threads submit() sends inline: do that after the commit, not under the row locks
+    inline: list[tuple[str, Dict[str, Any]]] = []
+    for row in rows:
+        if not row.attempts:
+            events_bus.publish(json.loads(row.event))
+        if not row.push:
+            delivered.append(row.id)
+            continue
+        spec = json.loads(row.push)
+        data = spec.get("data") or {}
+        try:
+            # A failed lookup must not abort the batch's transaction
+            with db.begin_nested():
+                tokens = audience_tokens(db, store_id=spec.get("store_id"), courier_id=spec.get("courier_id"))
+            if settings.push_queue_backend == "db":
+                # Handed off atomically with the outbox delete below
+                jobs.enqueue_jobs(db, [(data, tokens)])
+                handed_off = True
+            elif push_dispatcher.running:
+                handed_off = all([push_dispatcher.submit(token, data) for token in tokens])
+            else:
+                inline.extend((token, data) for token in tokens)
+                handed_off = True
+        except Exception:
+            logger.warning("outbox push failed for row %s", row.id, exc_info=True)
+            handed_off = False
+        if handed_off:
+            delivered.append(row.id)
+            continue
+        row.attempts += 1
+        if row.attempts >= settings.outbox_max_attempts:
+            logger.error("outbox push for row %s dropped after %s attempts", row.id, row.attempts)
+            delivered.append(row.id)
+    if delivered:
+        db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(delivered)))
+    db.commit()
+    for token, data in inline:
+        push_dispatcher.submit(token, data)
+    return len(delivered)
+
+
+class OutboxDispatcher:
+    """Background task that drains the outbox.
+
+    Polls every ``outbox_poll_interval`` seconds and is woken early by
+    ``notify()`` (safe to call from sync endpoints running in the threadpool).
+    """
+
+    def __init__(self, session_factory: Optional[Callable[[], Session]] = None) -> None:
+        self._session_factory = session_factory
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+    def _sessions(self) -> Callable[[], Session]:
+        if self._session_factory is None:
+            from ..db.session import get_sessionmaker
+
+            self._session_factory = get_sessionmaker()
+        return self._session_factory
+
+    def _drain_once(self) -> int:
+        with self._sessions()() as db:
+            return dispatch_batch(db)
+
+    def notify(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._wake is not None:
+            self._wake.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        self._loop = None
+
+    async def _run(self) -> None:
+        assert self._wake is not None
+        while True:
+            try:
+                handled = await asyncio.to_thread(self._drain_once)
+            except Exception:
+                logger.warning("outbox dispatch failed", exc_info=True)
+                handled = 0
+            if self._stopping:
+                return
+            if handled >= settings.outbox_batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.outbox_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,176 @@
+"""Session-validity cache for bearer-token checks.
+
+``get_current_identity`` used to load the ``UserSession`` row on every
+request. Validity is cached per ``session_id`` for ``session_cache_ttl``
+seconds (LRU-bounded); revoking a session drops it locally and, on Postgres,
+sends ``NOTIFY`` so every other worker drops it too. The TTL bounds how stale
+a worker can be if it misses a notification.
+"""
+from __future__ import annotations
+
+import logging
+import select as _select
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..core import metrics
+from ..core.config import settings
+from ..db.models.user_session import UserSession
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_HITS = metrics.counter("session_cache_hits_total", "Session validity checks served from cache")
+SESSION_CACHE_MISSES = metrics.counter("session_cache_misses_total", "Session validity checks that hit the database")
+
+REVOKE_CHANNEL = "zariz_session_revoked"
+
+
+def _epoch(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    # SQLite hands back naive datetimes; they are stored as UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class SessionCache:
+    """Thread-safe TTL + LRU map of ``session_id -> (valid, expires_at)``."""
+
+    def __init__(self, ttl: float, maxsize: int) -> None:
+        self._ttl = ttl
+        self._maxsize = max(1, maxsize)
+        self._entries: "OrderedDict[int, Tuple[float, bool, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid: int) -> Optional[bool]:
+        """Cached validity, or None when unknown or stale."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            cached_until, valid, expires_at = entry
+            if now >= cached_until:
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+        return valid and (expires_at is None or now < expires_at)
+
+    def put(self, sid: int, valid: bool, expires_at: Optional[float]) -> None:
+        if self._ttl <= 0:
+            return
+        with self._lock:
+            self._entries[sid] = (time.time() + self._ttl, valid, expires_at)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, sid: int) -> None:
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+session_cache = SessionCache(ttl=settings.session_cache_ttl, maxsize=settings.session_cache_size)
+
+
+def session_is_valid(db: Session, sid: int) -> bool:
+    """True if the session exists, is not revoked and has not expired."""
+    cached = session_cache.get(sid)
+    if cached is not None:
+        SESSION_CACHE_HITS.inc()
+        return cached
+    SESSION_CACHE_MISSES.inc()
+    s = db.get(UserSession, sid)
+    if s is None:
+        session_cache.put(sid, False, None)
+        return False
+    expires_at = _epoch(s.expires_at)
+    valid = s.revoked_at is None
+    session_cache.put(sid, valid, expires_at)
+    return valid and (expires_at is None or time.time() < expires_at)
+
+
+def revoke_session(db: Session, session: UserSession) -> None:
+    """Mark ``session`` revoked (caller commits) and drop it from every worker's cache.
+
+    On Postgres the ``NOTIFY`` is transactional, so other workers only hear
+    about it once the revocation is committed.
+    """
+    session.revoked_at = datetime.now(timezone.utc)
+    session_cache.invalidate(session.id)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_notify(:channel, :sid)"), {"channel": REVOKE_CHANNEL, "sid": str(session.id)})
+
+
+class RevocationListener:
+    """Background thread that ``LISTEN``s for revocations from other workers."""
+
+    def __init__(self, engine=None, reconnect_delay: float = 5.0) -> None:
+        self._engine = engine
+        self._reconnect_delay = reconnect_delay
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._engine is None:
+            from ..db.session import get_engine
+
+            self._engine = get_engine()
+        if self._engine.dialect.name != "postgresql" or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="session-revocations", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.warning("session revocation listener failed; reconnecting", exc_info=True)
+            # Notifications may have been missed while disconnected
+            session_cache.clear()
+            self._stop.wait(self._reconnect_delay)
+
+    def _listen(self) -> None:
+        raw = self._engine.raw_connection()
+        try:
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {REVOKE_CHANNEL}")
+            while not self._stop.is_set():
+                if _select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    note = conn.notifies.pop(0)
+                    try:
+                        session_cache.invalidate(int(note.payload))
+                    except ValueError:
+                        pass
+        finally:
+            raw.invalidate()
+
+
+revocation_listener = RevocationListener()
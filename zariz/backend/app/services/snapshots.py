@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from ..core.config import settings
+from ..db.models.order import Order
+
+ACTIVE_STATUSES = ("new", "assigned", "accepted", "picked_up")
+
+
+def snapshot_scope(identity: dict) -> Tuple[Hashable, ...]:
+    """Cache key for the orders an identity may see (mirrors list_orders scoping)."""
+    role = identity.get("role")
+    if role == "admin":
+        return ("admin",)
+    if role == "store":
+        sids = identity.get("store_ids") or []
+        if sids:
+            return ("store", tuple(sorted(int(s) for s in sids)))
+        return ("store", (int(identity["sub"]),))
+    return ("courier", int(identity["sub"]))
+
+
+def compute_snapshot(db: Session, scope: Tuple[Hashable, ...]) -> Dict[str, Any]:
+    """Compact list of active orders for a scope, in a single query."""
+    q = select(
+        Order.id,
+        Order.store_id,
+        Order.courier_id,
+        Order.status,
+        Order.boxes_count,
+        Order.price_total,
+        Order.updated_at,
+    ).where(Order.status.in_(ACTIVE_STATUSES))
+    if scope[0] == "store":
+        q = q.where(Order.store_id.in_(scope[1]))
+    elif scope[0] == "courier":
+        q = q.where(Order.courier_id == scope[1])
+    orders = [
+        {
+            "id": r.id,
+            "store_id": r.store_id,
+            "courier_id": r.courier_id,
+            "status": r.status,
+            "boxes_count": r.boxes_count,
+            "price_total": r.price_total,
+            "updated_at": r.updated_at.isoformat() if r.updated_at else None,
+        }
+        for r in db.execute(q.order_by(Order.id))
+    ]
+    return {"type": "snapshot", "orders": orders}
+
+
+class SnapshotCache:
+    """Short-TTL cache of encoded snapshots, computed once per scope.
+
+    Concurrent misses for the same scope share one in-flight computation, so a
+    reconnect storm costs one query per scope per TTL window instead of one
+    per client.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._entries: Dict[Hashable, Tuple[float, str]] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get(self, scope: Hashable, compute: Callable[[], Dict[str, Any]]) -> str:
+        entry = self._entries.get(scope)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        pending = self._inflight.get(scope)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[scope] = fut
+        try:
+            data = json.dumps(await run_in_threadpool(compute))
+            self._entries[scope] = (time.monotonic() + self.ttl, data)
+            fut.set_result(data)
+            return data
+        except BaseException as exc:
+            fut.set_exception(exc)
+            # Mark retrieved so waiter-less failures don't log "never retrieved"
+            fut.exception()
+            raise
+        finally:
+            self._inflight.pop(scope, None)
+
+
+snapshot_cache = SnapshotCache(ttl=settings.sse_snapshot_ttl)
@@ -0,0 +1,39 @@
+"""Standalone push worker: ``python -m app.worker``.
+
+Drains the durable ``push_jobs`` queue (PUSH_QUEUE_BACKEND=db) so push
+throughput scales independently of API workers.
+"""
+import argparse
+import logging
+import signal
+import threading
+
+from ..core.logging import setup_logging
+from ..db.session import get_sessionmaker
+from . import jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.worker", description="Process queued push jobs")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--once", action="store_true", help="process a single batch and exit")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    SessionLocal = get_sessionmaker()
+    if args.once:
+        with SessionLocal() as db:
+            n = jobs.process_batch(db, limit=args.batch_size)
+        logging.getLogger(__name__).info("processed %s push jobs", n)
+        return
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    logging.getLogger(__name__).info("push worker started")
+    jobs.run(SessionLocal, stop, batch_size=args.batch_size, poll_interval=args.poll_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..core import metrics, tracing
+from ..core.config import settings
+from . import push
+
+logger = logging.getLogger(__name__)
+
+PUSH_QUEUE_DEPTH = metrics.gauge("push_queue_depth", "Pushes waiting in the in-process dispatcher queue", multiprocess_mode="livesum")
+PUSH_SEND_SECONDS = metrics.histogram("push_send_seconds", "Latency of one batched push provider call")
+PUSH_DROPPED = metrics.counter("push_dropped_total", "Pushes dropped because the dispatcher queue was full")
+PUSH_COALESCED = metrics.counter("push_coalesced_total", "Pushes skipped because a later push superseded them")
+
+_STOP = object()
+
+
+class PushDispatcher:
+    """Bounded in-process push queue drained by a pool of worker threads.
+
+    Callers only ``submit``; provider calls (blocking HTTP to gorush/APNs)
+    happen on the workers. Each worker collects up to ``batch_size`` queued
+    pushes for at most ``linger`` seconds, keeps only the latest push per
+    device and order (a lifecycle burst wakes a phone once), and groups
+    identical payloads so one provider request carries many tokens. Tokens
+    the provider reports as invalid are handed to ``on_invalid`` for pruning.
+    When the queue is full the push is dropped and counted rather than
+    blocking the caller. Before ``start`` (or after ``stop``) pushes are sent
+    inline so nothing is silently lost in scripts.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        workers: int,
+        batch_size: int = 500,
+        linger: float = 0.0,
+        send_batch: Optional[Callable[[List[push.PushGroup]], List[str]]] = None,
+        on_invalid: Optional[Callable[[List[str]], Any]] = None,
+    ) -> None:
+        self._queue: "queue.Queue[Tuple[str, Dict[str, Any]] | object]" = queue.Queue(maxsize=maxsize)
+        self._workers = max(1, workers)
+        self._batch_size = max(1, batch_size)
+        self._linger = max(0.0, linger)
+        self._send_batch = send_batch
+        self._on_invalid = on_invalid
+        self._threads: list[threading.Thread] = []
+        self._running = False
+        metrics.track(PUSH_QUEUE_DEPTH, self._queue.qsize)
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _deliver(self, items: List[Tuple[str, Dict[str, Any]]]) -> None:
+        latest: Dict[Tuple[str, str], Tuple[str, Dict[str, Any]]] = {}
+        for token, data in items:
+            latest[push.coalesce_key(token, data)] = (token, data)
+        if len(latest) < len(items):
+            PUSH_COALESCED.inc(len(items) - len(latest))
+
+        groups: Dict[str, push.PushGroup] = {}
+        for token, data in latest.values():
+            key = json.dumps(data, sort_keys=True)
+            groups.setdefault(key, (data, []))[1].append(token)
+        send_batch = self._send_batch or push.send_silent_batch
+        invalid: List[str] = []
+        start = time.perf_counter()
+        try:
+            with tracing.span("push.send_batch", {"push.groups": len(groups), "push.tokens": len(latest)}):
+                invalid = send_batch(list(groups.values())) or []
+        except push.PushDeliveryError as exc:
+            logger.warning("push send failed: %s", exc)
+            invalid = exc.invalid_tokens
+        except Exception:
+            logger.warning("push send failed", exc_info=True)
+        finally:
+            PUSH_SEND_SECONDS.observe(time.perf_counter() - start)
+        if invalid:
+            self._prune(invalid)
+
+    def _prune(self, tokens: List[str]) -> None:
+        if self._on_invalid is None:
+            from ..services.devices import prune_tokens_now
+
+            self._on_invalid = prune_tokens_now
+        try:
+            self._on_invalid(tokens)
+        except Exception:
+            logger.warning("failed to prune %s invalid push tokens", len(tokens), exc_info=True)
+
+    def submit(self, token: str, data: Dict[str, Any]) -> bool:
+        """Queue a silent push; returns False if it was dropped."""
+        if not self._running:
+            self._deliver([(token, data)])
+            return True
+        try:
+            self._queue.put_nowait((token, data))
+            return True
+        except queue.Full:
+            PUSH_DROPPED.inc()
+            logger.warning("push queue full; dropping push to %s…", token[:8])
+            return False
+
+    def _work(self) -> None:
+        stop = False
+        while not stop:
+            items: List[Tuple[str, Dict[str, Any]]] = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self._linger
+            while True:
+                if item is _STOP:
+                    stop = True
+                else:
+                    items.append(item)  # type: ignore[arg-type]
+                if stop or len(items) >= self._batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                if items:
+                    self._deliver(items)
+            finally:
+                for _ in range(len(items) + (1 if stop else 0)):
+                    self._queue.task_done()
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._work, name=f"push-worker-{i}", daemon=True) for i in range(self._workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop accepting work and drain what is queued, waiting up to ``timeout`` seconds."""
+        if not self._running:
+            return
+        self._running = False
+        deadline = time.monotonic() + (settings.push_drain_timeout if timeout is None else timeout)
+        # Sentinels queue behind pending pushes, so workers finish the backlog first
+        for _ in self._threads:
+            try:
+                self._queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        alive = [t for t in self._threads if t.is_alive()]
+        if alive:
+            logger.warning("push dispatcher drain timed out with %s pushes pending", self._queue.qsize())
+        self._threads = []
+
+
+push_dispatcher = PushDispatcher(
+    maxsize=settings.push_queue_size,
+    workers=settings.push_workers,
+    batch_size=settings.push_batch_size,
+    linger=settings.push_coalesce_window,
+)
@@ -0,0 +1,142 @@
+"""Durable push job queue (``push_jobs``).
+
+Producers insert one row per device token; workers claim due rows with
+``FOR UPDATE SKIP LOCKED`` so any number of them can run side by side, send
+them grouped by payload, delete what was delivered and reschedule the rest
+with exponential backoff until ``push_max_attempts`` marks them dead. Older
+jobs for the same device and order are superseded by the newest one, and
+tokens the provider rejects as invalid are pruned from ``devices``.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from tenacity import RetryCallState, wait_exponential, wait_random
+
+from ..core import metrics, tracing
+from ..core.config import settings
+from ..db.models.push_job import PushJob
+from ..services.devices import prune_tokens
+from . import push
+
+logger = logging.getLogger(__name__)
+
+PUSH_JOBS_SENT = metrics.counter("push_jobs_sent_total", "Push jobs delivered")
+PUSH_JOBS_RETRIED = metrics.counter("push_jobs_retried_total", "Push jobs rescheduled after a failed send")
+PUSH_JOBS_DEAD = metrics.counter("push_jobs_dead_total", "Push jobs dead-lettered after max attempts")
+PUSH_JOBS_COALESCED = metrics.counter("push_jobs_coalesced_total", "Push jobs superseded by a later job")
+
+_backoff = wait_exponential(multiplier=settings.push_retry_base, max=settings.push_retry_max) + wait_random(0, 1)
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait before attempt ``attempts + 1``."""
+    state = RetryCallState(None, None, (), {})
+    state.attempt_number = attempts
+    return _backoff(state)
+
+
+def enqueue_jobs(db: Session, groups: Iterable[push.PushGroup]) -> int:
+    """Stage push jobs in the caller's transaction; returns how many were added."""
+    jobs = [
+        PushJob(token=token, payload=json.dumps(data), status="pending", attempts=0)
+        for data, tokens in groups
+        for token in tokens
+    ]
+    db.add_all(jobs)
+    return len(jobs)
+
+
+def process_batch(
+    db: Session,
+    limit: Optional[int] = None,
+    send_batch: Optional[Callable[[List[push.PushGroup]], List[str]]] = None,
+) -> int:
+    """Claim and send up to ``limit`` due jobs; returns how many were claimed."""
+    jobs = (
+        db.execute(
+            select(PushJob)
+            .where(PushJob.status == "pending", PushJob.next_attempt_at <= func.now())
+            .order_by(PushJob.id)
+            .limit(limit or settings.push_batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        .scalars()
+        .all()
+    )
+    if not jobs:
+        db.rollback()
+        return 0
+
+    # Latest job per device/order wins; superseded ones are dropped unsent
+    latest: Dict[tuple, PushJob] = {}
+    for job in jobs:
+        latest[push.coalesce_key(job.token, json.loads(job.payload))] = job
+    live = list(latest.values())
+    superseded = [job.id for job in jobs if job not in live]
+    if superseded:
+        db.execute(delete(PushJob).where(PushJob.id.in_(superseded)))
+        PUSH_JOBS_COALESCED.inc(len(superseded))
+
+    groups: Dict[str, push.PushGroup] = {}
+    for job in live:
+        groups.setdefault(job.payload, (json.loads(job.payload), []))[1].append(job.token)
+    failed: set[str] = set()
+    invalid: List[str] = []
+    error: Optional[str] = None
+    try:
+        with tracing.span("push.send_batch", {"push.groups": len(groups), "push.tokens": len(live)}):
+            invalid = (send_batch or push.send_silent_batch)(list(groups.values())) or []
+    except push.PushDeliveryError as exc:
+        failed, invalid, error = set(exc.tokens), exc.invalid_tokens, str(exc)
+    except Exception as exc:
+        failed, error = {job.token for job in live}, f"{type(exc).__name__}: {exc}"
+
+    if invalid:
+        # Never retry dead tokens: drop the devices and any jobs still queued for them
+        prune_tokens(db, invalid)
+        db.execute(delete(PushJob).where(PushJob.token.in_(invalid), PushJob.status == "pending"))
+    delivered = [job.id for job in live if job.token not in failed]
+    if delivered:
+        db.execute(delete(PushJob).where(PushJob.id.in_(delivered)))
+        PUSH_JOBS_SENT.inc(len(delivered))
+    now = datetime.now(timezone.utc)
+    for job in live:
+        if job.token not in failed or job.token in invalid:
+            continue
+        job.attempts += 1
+        job.last_error = (error or "")[:1000]
+        if job.attempts >= settings.push_max_attempts:
+            job.status = "dead"
+            PUSH_JOBS_DEAD.inc()
+            logger.warning("push job %s dead after %s attempts: %s", job.id, job.attempts, error)
+        else:
+            job.next_attempt_at = now + timedelta(seconds=retry_delay(job.attempts))
+            PUSH_JOBS_RETRIED.inc()
+    db.commit()
+    return len(jobs)
+
+
+def run(
+    session_factory: Callable[[], Session],
+    stop: threading.Event,
+    batch_size: Optional[int] = None,
+    poll_interval: float = 1.0,
+) -> None:
+    """Process jobs until ``stop`` is set, sleeping only when the queue is drained."""
+    batch_size = batch_size or settings.push_batch_size
+    while not stop.is_set():
+        try:
+            with session_factory() as db:
+                claimed = process_batch(db, limit=batch_size)
+        except Exception:
+            logger.warning("push job batch failed", exc_info=True)
+            claimed = 0
+        if claimed < batch_size:
+            stop.wait(poll_interval)
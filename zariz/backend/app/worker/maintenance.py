@@ -0,0 +1,147 @@
+"""Garbage collection for tables that only grow.
+
+Every refresh leaves a revoked ``user_sessions`` row behind and
+``idempotency_keys`` had no TTL. ``purge`` deletes expired/revoked sessions
+older than ``session_retention_hours``, idempotency keys past their
+``expires_at`` and shared rate-limit buckets that have refilled in small batches (one short transaction each, rows
+claimed with SKIP LOCKED so concurrent workers split the work). The app runs
+it every ``maintenance_interval`` seconds; it can also be run by hand:
+
+    python -m app.worker.maintenance --dry-run
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.orm import Session
+
+from ..core import metrics
+from ..core.config import settings
+from ..db.models.idempotency import IdempotencyKey
+from ..db.models.rate_limit import RateLimitBucket
+from ..db.models.user_session import UserSession
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_DELETED = metrics.counter("maintenance_deleted_rows_total", "Rows deleted by maintenance", ["table"])
+MAINTENANCE_SECONDS = metrics.histogram("maintenance_run_seconds", "Duration of one maintenance run")
+
+
+def _purge(db: Session, column, condition, batch_size: int, dry_run: bool) -> int:
+    if dry_run:
+        n = db.execute(select(func.count()).select_from(column.table).where(condition)).scalar_one()
+        db.rollback()
+        return n
+    total = 0
+    while True:
+        ids = db.execute(select(column).where(condition).limit(batch_size).with_for_update(skip_locked=True)).scalars().all()
+        if not ids:
+            db.rollback()
+            return total
+        db.execute(delete(column.table).where(column.in_(ids)))
+        db.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
+
+
+def purge_sessions(db: Session, batch_size: Optional[int] = None, dry_run: bool = False) -> int:
+    """Delete sessions that expired or were revoked more than the retention period ago."""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.session_retention_hours)
+    condition = or_(UserSession.expires_at < cutoff, UserSession.revoked_at < cutoff)
+    return _purge(db, UserSession.id, condition, batch_size or settings.maintenance_batch_size, dry_run)
+
+
+def purge_idempotency_keys(db: Session, batch_size: Optional[int] = None, dry_run: bool = False) -> int:
+    """Delete idempotency keys whose replay window (or in-flight lease) has ended."""
+    condition = IdempotencyKey.expires_at < datetime.now(timezone.utc)
+    return _purge(db, IdempotencyKey.key, condition, batch_size or settings.maintenance_batch_size, dry_run)
+
+
+def purge_rate_limit_buckets(db: Session, batch_size: Optional[int] = None, dry_run: bool = False) -> int:
+    """Delete rate-limit buckets that are full again (no row means a full bucket)."""
+    condition = RateLimitBucket.expires_at < time.time()
+    return _purge(db, RateLimitBucket.key, condition, batch_size or settings.maintenance_batch_size, dry_run)
+
+
+def purge(db: Session, batch_size: Optional[int] = None, dry_run: bool = False) -> Dict[str, int]:
+    """Run every purge; returns rows deleted (or that would be, with ``dry_run``) per table."""
+    start = time.perf_counter()
+    counts = {
+        "user_sessions": purge_sessions(db, batch_size, dry_run),
+        "idempotency_keys": purge_idempotency_keys(db, batch_size, dry_run),
+        "rate_limit_buckets": purge_rate_limit_buckets(db, batch_size, dry_run),
+    }
+    if not dry_run:
+        for table, n in counts.items():
+            MAINTENANCE_DELETED.labels(table).inc(n)
+        MAINTENANCE_SECONDS.observe(time.perf_counter() - start)
+    return counts
+
+
+class MaintenanceTask:
+    """Background task running ``purge`` every ``maintenance_interval`` seconds."""
+
+    def __init__(self, session_factory: Optional[Callable[[], Session]] = None) -> None:
+        self._session_factory = session_factory
+        self._task: asyncio.Task | None = None
+
+    def _run_once(self) -> Dict[str, int]:
+        if self._session_factory is None:
+            from ..db.session import get_sessionmaker
+
+            self._session_factory = get_sessionmaker()
+        with self._session_factory() as db:
+            return purge(db)
+
+    def start(self) -> None:
+        if settings.maintenance_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.maintenance_interval)
+            try:
+                counts = await asyncio.to_thread(self._run_once)
+                logger.info("maintenance purged %s", counts)
+            except Exception:
+                logger.warning("maintenance run failed", exc_info=True)
+
+
+maintenance_task = MaintenanceTask()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.worker.maintenance", description="Purge dead sessions, stale idempotency keys and refilled rate-limit buckets")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be deleted")
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from ..core.logging import setup_logging
+    from ..db.session import get_sessionmaker
+
+    setup_logging()
+    with get_sessionmaker()() as db:
+        counts = purge(db, batch_size=args.batch_size, dry_run=args.dry_run)
+    verb = "would delete" if args.dry_run else "deleted"
+    for table, n in counts.items():
+        print(f"{table}: {verb} {n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,130 @@
 from __future__ import annotations
 
 import base64
+import http.client
 import json
 import logging
 import os
+import queue
 import tempfile
-import urllib.error
-import urllib.request
-from typing import Any, Dict
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from ..core import metrics
 
 logger = logging.getLogger(__name__)
 
+# One silent-push payload and the device tokens it goes to
+PushGroup = Tuple[Dict[str, Any], List[str]]
+
+
+# APNs reasons meaning the token will never work again (device should be pruned)
+INVALID_TOKEN_REASONS = ("BadDeviceToken", "Unregistered", "DeviceTokenNotForTopic")
+
+
+def is_invalid_token_reason(reason: str | None) -> bool:
+    return bool(reason) and any(r in reason for r in INVALID_TOKEN_REASONS)
+
+
+def collapse_id(data: Dict[str, Any]) -> str | None:
+    """APNs collapse id: later pushes about the same order replace earlier undelivered ones."""
+    order_id = data.get("order_id")
+    return f"order-{order_id}" if order_id is not None else None
+
+
+def coalesce_key(token: str, data: Dict[str, Any]) -> Tuple[str, str]:
+    """Pushes sharing this key are redundant; only the latest needs to be sent."""
+    order_id = data.get("order_id")
+    if order_id is not None:
+        return token, f"order-{order_id}"
+    return token, json.dumps(data, sort_keys=True)
+
+
+class PushDeliveryError(Exception):
+    """Raised when some tokens of a send could not be delivered (retryable).
+
+    ``invalid_tokens`` lists tokens the provider rejected permanently in the
+    same send; those should be pruned rather than retried.
+    """
+
+    def __init__(self, message: str, tokens: Sequence[str], invalid_tokens: Sequence[str] = ()) -> None:
+        super().__init__(message)
+        self.tokens = list(tokens)
+        self.invalid_tokens = list(invalid_tokens)
+
+
+def _chunks(seq: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    for i in range(0, len(seq), size):
+        yield seq[i : i + size]
+
+
+# Errors showing a reused connection was already closed by the peer, before any response byte
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class _HTTPPool:
+    """Small pool of persistent (keep-alive) HTTP/1.1 connections to one endpoint."""
+
+    def __init__(self, url: str, size: int, timeout: float) -> None:
+        parts = urlsplit(url)
+        self._https = parts.scheme == "https"
+        self._host = parts.hostname or "localhost"
+        self._port = parts.port
+        self._path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self._timeout = timeout
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=size)
+
+    def _connect(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+        return cls(self._host, self._port, timeout=self._timeout)
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def post_json(self, body: bytes) -> Tuple[int, bytes]:
+        try:
+            conn = self._idle.get_nowait()
+            fresh = False
+        except queue.Empty:
+            conn, fresh = self._connect(), True
+        while True:
+            try:
+                conn.request("POST", self._path, body=body, headers={"Content-Type": "application/json"})
+                resp = conn.getresponse()
+            except _STALE_CONNECTION_ERRORS:
+                conn.close()
+                if fresh:
+                    raise
+                # Idle keep-alive connection was closed by the server before answering; retry once on a new one
+                conn, fresh = self._connect(), True
+                continue
+            except BaseException:
+                # Timeouts and the like: the request may have been delivered, never resend it
+                conn.close()
+                raise
+            try:
+                data = resp.read()
+            except BaseException:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return resp.status, data
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
 
 class _APNsClientWrapper:
     def __init__(self) -> None:
@@ -52,23 +166,35 @@ class _APNsClientWrapper:
         else:
             logger.info("APNs credentials not configured; push is a no-op")
 
-    def send_silent(self, token: str, data: Dict[str, Any]) -> None:
+    def send_silent(self, token: str, data: Dict[str, Any]) -> List[str]:
+        return self.send_silent_many([token], data)
+
+    def send_silent_many(self, tokens: Sequence[str], data: Dict[str, Any]) -> List[str]:
+        """Send to many tokens; returns tokens APNs reported as invalid."""
         if not self._client or not self._topic:
-            logger.debug("No-op APNs send_silent to %s: %s", token[:8] + "…", data)
-            return
+            logger.debug("No-op APNs send_silent to %s tokens: %s", len(tokens), data)
+            return []
         try:
             from apns2.payload import Payload  # type: ignore
 
+            from apns2.client import Notification  # type: ignore
+
             payload = Payload(content_available=True, custom=data)
-            self._client.send_notification(
-                token,
-                payload,
+            # Multiplexed over the client's single HTTP/2 connection
+            results = self._client.send_notification_batch(
+                [Notification(token=t, payload=payload) for t in tokens],
                 topic=self._topic,
                 push_type="background",
                 priority=5,
+                collapse_id=collapse_id(data),
             )
         except Exception as exc:  # pragma: no cover
-            logger.warning("APNs send failed: %s", exc)
+            raise PushDeliveryError(f"APNs send failed: {exc}", tokens) from exc
+        invalid = [t for t, result in results.items() if is_invalid_token_reason(str(result))]
+        failed = [t for t, result in results.items() if result != "Success" and t not in invalid]
+        if failed:  # pragma: no cover
+            raise PushDeliveryError(f"APNs rejected {len(failed)} tokens", failed, invalid)
+        return invalid
 
 
 class _PushClient:
@@ -78,57 +204,158 @@ class _PushClient:
         self._gorush_platform = int(os.getenv("GORUSH_PLATFORM", "1"))
         self._gorush_timeout = float(os.getenv("GORUSH_TIMEOUT", "5"))
         self._gorush_production = os.getenv("GORUSH_SANDBOX", "true").lower() in {"0", "false", "no"}
+        # gorush limits: tokens per notification and notifications per request (its max_notification)
+        self._gorush_max_tokens = int(os.getenv("GORUSH_MAX_TOKENS", "1000"))
+        self._gorush_max_notifications = int(os.getenv("GORUSH_MAX_NOTIFICATIONS", "100"))
 
         if self._gorush_url:
             logger.info("Push client configured to use gorush at %s", self._gorush_url)
             self._apns: _APNsClientWrapper | None = None
+            self._gorush_pool = _HTTPPool(
+                self._gorush_url,
+                size=int(os.getenv("GORUSH_POOL_SIZE", "8")),
+                timeout=self._gorush_timeout,
+            )
         else:
             self._apns = _APNsClientWrapper()
 
-    def send_silent(self, token: str, data: Dict[str, Any]) -> None:
+    def send_silent(self, token: str, data: Dict[str, Any]) -> List[str]:
+        return self.send_batch([(data, [token])])
+
+    def send_batch(self, groups: Iterable[PushGroup]) -> List[str]:
+        """Send silent pushes; each group is one payload fanned out to many tokens.
+
+        Returns tokens the provider reported as permanently invalid. Raises
+        ``PushDeliveryError`` listing the tokens that were not delivered.
+        """
+        groups = [(data, tokens) for data, tokens in groups if tokens]
         if self._gorush_url:
-            self._send_gorush(token, data)
-            return
-        if not self._apns:
-            self._apns = _APNsClientWrapper()
+            return self._send_gorush(groups)
+        failed: List[str] = []
+        invalid: List[str] = []
         if self._apns:
-            self._apns.send_silent(token, data)
-
-    def _send_gorush(self, token: str, data: Dict[str, Any]) -> None:
-        payload = {
-            "notifications": [
-                {
-                    "platform": self._gorush_platform,
-                    "tokens": [token],
-                    "topic": self._gorush_topic,
-                    "production": self._gorush_production,
-                    "message": "",
-                    "sound": "",
-                    "push_type": "background",
-                    "content_available": True,
-                    "badge": 0,
-                    "custom": data,
-                }
-            ]
+            for data, tokens in groups:
+                try:
+                    invalid.extend(self._apns.send_silent_many(tokens, data))
+                except PushDeliveryError as exc:
+                    failed.extend(exc.tokens)
+                    invalid.extend(exc.invalid_tokens)
+        if failed:
+            raise PushDeliveryError(f"APNs failed for {len(failed)} tokens", failed, invalid)
+        return invalid
+
+    def _gorush_notification(self, tokens: Sequence[str], data: Dict[str, Any]) -> Dict[str, Any]:
+        notification = {
+            "platform": self._gorush_platform,
+            "tokens": list(tokens),
+            "topic": self._gorush_topic,
+            "production": self._gorush_production,
+            "message": "",
+            "sound": "",
+            "push_type": "background",
+            "content_available": True,
+            "badge": 0,
+            "custom": data,
         }
-        body = json.dumps(payload).encode("utf-8")
-        req = urllib.request.Request(
-            self._gorush_url,
-            data=body,
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
+        cid = collapse_id(data)
+        if cid:
+            notification["collapse_id"] = cid
+        return notification
+
+    @staticmethod
+    def _gorush_invalid_tokens(body: bytes) -> List[str]:
+        # gorush (sync mode) reports per-token failures in "logs"
         try:
-            with urllib.request.urlopen(req, timeout=self._gorush_timeout) as resp:
-                if resp.status >= 400:
-                    logger.warning("gorush responded with status %s", resp.status)
-        except urllib.error.URLError as exc:
-            logger.warning("gorush send failed: %s", exc)
+            logs = json.loads(body or b"{}").get("logs") or []
+        except (ValueError, AttributeError):
+            return []
+        return [
+            entry["token"]
+            for entry in logs
+            if isinstance(entry, dict) and entry.get("token") and is_invalid_token_reason(entry.get("error"))
+        ]
 
+    def _send_gorush(self, groups: Sequence[PushGroup]) -> List[str]:
+        notifications = [
+            self._gorush_notification(chunk, data)
+            for data, tokens in groups
+            for chunk in _chunks(tokens, self._gorush_max_tokens)
+        ]
+        failed: List[str] = []
+        invalid: List[str] = []
+        for batch in _chunks(notifications, self._gorush_max_notifications):
+            body = json.dumps({"notifications": batch}).encode("utf-8")
+            try:
+                status, resp_body = self._gorush_pool.post_json(body)
+                if status >= 400:
+                    logger.warning("gorush responded with status %s", status)
+                    failed.extend(t for n in batch for t in n["tokens"])
+                else:
+                    invalid.extend(self._gorush_invalid_tokens(resp_body))
+            except (http.client.HTTPException, OSError) as exc:
+                logger.warning("gorush send failed: %s", exc)
+                failed.extend(t for n in batch for t in n["tokens"])
+        if failed:
+            raise PushDeliveryError(f"gorush failed for {len(failed)} tokens", failed, invalid)
+        return invalid
+
+
+PUSH_CLIENT_READY = metrics.gauge(
+    "push_client_ready", "1 once the push client is initialized (configured or a cached no-op)", multiprocess_mode="livemin"
+)
+
+_client: _PushClient | None = None
+_client_lock = threading.Lock()
+# Set once the shared client exists (configured or a cached no-op)
+ready = threading.Event()
+# A failed construction is not retried before this many seconds
+INIT_RETRY_SECONDS = float(os.getenv("PUSH_INIT_RETRY_SECONDS", "60"))
+_init_error: Exception | None = None
+_init_retry_at = 0.0
 
-client = _PushClient()
+metrics.track(PUSH_CLIENT_READY, lambda: 1 if ready.is_set() else 0)
 
 
-def send_silent(token: str, data: Dict[str, Any]) -> None:
+def get_client() -> _PushClient:
+    """The shared push client, built on first use and cached.
+
+    Construction may decode key material, write a temp ``.p8`` and import
+    ``apns2``, so it is kept off the import path; an unconfigured client is
+    cached too and simply no-ops. A construction error is cached as well and
+    re-raised until ``INIT_RETRY_SECONDS`` have passed.
+    """
+    global _client, _init_error, _init_retry_at
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if _init_error is not None and time.monotonic() < _init_retry_at:
+                    raise _init_error
+                try:
+                    _client = _PushClient()
+                except Exception as exc:
+                    _init_error, _init_retry_at = exc, time.monotonic() + INIT_RETRY_SECONDS
+                    raise
+                _init_error = None
+                ready.set()
+    return _client
+
+
+def warm_up() -> None:
+    """Build the client ahead of the first send (run off the event loop at startup)."""
+    try:
+        get_client()
+    except Exception:
+        logger.warning("push client initialization failed; retrying in %ss", INIT_RETRY_SECONDS, exc_info=True)
+
+
+def send_silent(token: str, data: Dict[str, Any]) -> List[str]:
     """Send a background (content-available) push."""
-    client.send_silent(token, data)
+    return get_client().send_silent(token, data)
+
+
+def send_silent_batch(groups: Iterable[PushGroup]) -> List[str]:
+    """Send background pushes, one request per chunk of tokens sharing a payload.
+
+    Returns the tokens the provider reported as invalid.
+    """
+    return get_client().send_batch(groups)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Microbenchmark access-token encode/verify: python-jose vs the native HS256 codec.
+
+"cached" is the per-worker verified-claims LRU used by decode_token, i.e. the
+steady state for clients that reuse a token across many requests.
+
+    python scripts/bench_jwt.py --n 20000
+"""
+import argparse
+import time
+
+from app.core.config import settings
+from app.core.tokens import HS256Codec, JoseCodec, VerifiedTokenCache
+
+
+def _rate(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed = time.perf_counter() - start
+    return n / elapsed, elapsed / n * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark JWT codecs")
+    parser.add_argument("--n", type=int, default=20_000)
+    args = parser.parse_args(argv)
+
+    now = int(time.time())
+    claims = {"sub": "42", "role": "store", "store_ids": [1, 2, 3], "session_id": "99", "iat": now, "exp": now + 900}
+    codecs = {"jose": JoseCodec(settings.jwt_secret, "HS256"), "native": HS256Codec(settings.jwt_secret)}
+    token = codecs["jose"].encode(claims)
+
+    print(f"{'codec':8} {'op':7} {'ops/s':>10} {'us/op':>8}")
+    for name, codec in codecs.items():
+        for op, fn in (("encode", lambda: codec.encode(claims)), ("decode", lambda: codec.decode(token))):
+            rate, us = _rate(fn, args.n)
+            print(f"{name:8} {op:7} {rate:>10.0f} {us:>8.2f}")
+
+    cache = VerifiedTokenCache(maxsize=10_000)
+    native = codecs["native"]
+
+    def cached_decode():
+        found = cache.get(token)
+        if found is None:
+            cache.put(token, native.decode(token))
+
+    rate, us = _rate(cached_decode, args.n)
+    print(f"{'cached':8} {'decode':7} {rate:>10.0f} {us:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
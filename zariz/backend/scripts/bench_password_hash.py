@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Report password hashes per second per core for each available scheme.
+
+Each scheme is run on one core and then on ``--procs`` processes at once to
+show how throughput scales (argon2 memory bandwidth often limits it).
+
+    python scripts/bench_password_hash.py --seconds 2 --procs 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _handler(scheme):
+    from app.core import security
+
+    if scheme == "argon2":
+        return security._argon2
+    from passlib.hash import bcrypt
+
+    bcrypt.hash("probe")  # raises if the backend is unusable
+    return bcrypt
+
+
+def _run(scheme, seconds):
+    handler = _handler(scheme)
+    stored = handler.hash("benchmark")
+    hashes = verifies = 0
+    deadline = time.perf_counter() + seconds / 2
+    while time.perf_counter() < deadline:
+        handler.hash("benchmark")
+        hashes += 1
+    deadline = time.perf_counter() + seconds / 2
+    while time.perf_counter() < deadline:
+        handler.verify("benchmark", stored)
+        verifies += 1
+    return hashes / (seconds / 2), verifies / (seconds / 2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark password hashing")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--procs", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    from app.core.security import argon2_params
+
+    print(f"argon2 params: {argon2_params()}")
+    print(f"{'scheme':8} {'procs':>5} {'hash/s/core':>12} {'verify/s/core':>14}")
+    for scheme in ("argon2", "bcrypt"):
+        try:
+            _handler(scheme)
+        except Exception as exc:
+            print(f"{scheme:8} unavailable: {exc}")
+            continue
+        for procs in sorted({1, args.procs}):
+            with ProcessPoolExecutor(max_workers=procs) as pool:
+                results = list(pool.map(_run, [scheme] * procs, [args.seconds] * procs))
+            hash_rate = sum(r[0] for r in results) / procs
+            verify_rate = sum(r[1] for r in results) / procs
+            print(f"{scheme:8} {procs:>5} {hash_rate:>12.1f} {verify_rate:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
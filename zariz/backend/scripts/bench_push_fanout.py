@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Benchmark silent-push fan-out to N devices against a local stub gorush.
+
+Compares the legacy path (one urllib request and connection per token) with
+the batched client (multi-token notifications over keep-alive connections).
+
+    python scripts/bench_push_fanout.py --devices 10000
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests += 1
+        out = b'{"counts":1,"logs":[],"success":"ok"}'
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.requests = 0
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _legacy(url: str, tokens: list[str], data: dict) -> None:
+    for token in tokens:
+        body = json.dumps({"notifications": [{"platform": 1, "tokens": [token], "custom": data}]}).encode()
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            resp.read()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark push fan-out")
+    parser.add_argument("--devices", type=int, default=10_000)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args(argv)
+
+    server = _serve()
+    url = f"http://127.0.0.1:{server.server_port}/api/push"
+    os.environ["GORUSH_URL"] = url
+    from app.worker.push import _PushClient
+
+    tokens = [f"{i:064x}" for i in range(args.devices)]
+    data = {"type": "order.created", "order_id": 1}
+
+    if not args.skip_legacy:
+        start = time.perf_counter()
+        _legacy(url, tokens, data)
+        elapsed = time.perf_counter() - start
+        print(f"legacy   {elapsed:8.3f}s  requests={server.requests}  connections={server.connections}")
+
+    server.requests = server.connections = 0
+    client = _PushClient()
+    start = time.perf_counter()
+    client.send_batch([(data, tokens)])
+    elapsed = time.perf_counter() - start
+    print(f"batched  {elapsed:8.3f}s  requests={server.requests}  connections={server.connections}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Per-request overhead of request logging: BaseHTTPMiddleware vs pure ASGI.
+
+Drives a bare FastAPI app in-process (no network) with a small JSON POST and
+a GET, once without logging middleware, once with the previous
+``@app.middleware("http")`` implementation and once with
+``RequestLogMiddleware``; the difference to the bare app is the overhead.
+
+    PYTHONPATH=. python scripts/bench_request_middleware.py --n 5000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+import httpx
+from fastapi import FastAPI, Request
+
+from app.core.middleware import RequestLogMiddleware
+
+
+def _base_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.post("/echo")
+    async def echo(payload: dict):
+        return payload
+
+    return app
+
+
+def _legacy(app: FastAPI) -> FastAPI:
+    # The former app/main.py middleware, verbatim in behaviour
+    @app.middleware("http")
+    async def add_request_id_and_log(request: Request, call_next):
+        req_id = request.headers.get("X-Request-ID") or str(uuid.uuid4())
+        start = time.perf_counter()
+        body = None
+        if request.method in ["POST", "PUT", "PATCH"]:
+            body = await request.body()
+
+            async def receive():
+                return {"type": "http.request", "body": body}
+
+            request._receive = receive
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = req_id
+        log_data = {
+            "method": request.method,
+            "path": request.url.path,
+            "status_code": response.status_code,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            "request_id": req_id,
+        }
+        if response.status_code >= 400 and body:
+            log_data["request_body"] = body.decode("utf-8")[:500]
+        logging.getLogger("app").info(json.dumps(log_data, ensure_ascii=False))
+        return response
+
+    return app
+
+
+def _asgi(app: FastAPI) -> FastAPI:
+    app.add_middleware(RequestLogMiddleware)
+    return app
+
+
+async def _run(app: FastAPI, n: int) -> float:
+    payload = {"store_id": 1, "items": [{"sku": "x", "qty": 2}] * 10}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(50):  # warm-up
+            await client.post("/echo", json=payload)
+        start = time.perf_counter()
+        for i in range(n):
+            if i % 2:
+                await client.get("/ping")
+            else:
+                await client.post("/echo", json=payload)
+        return (time.perf_counter() - start) / n * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark request logging middleware overhead")
+    parser.add_argument("--n", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    # Measure the middleware, not the log sink
+    logging.getLogger("app").addHandler(logging.NullHandler())
+    logging.getLogger("app").propagate = False
+    logging.getLogger("app").setLevel(logging.INFO)
+
+    variants = {"none": _base_app(), "base-http": _legacy(_base_app()), "pure-asgi": _asgi(_base_app())}
+    results = {name: asyncio.run(_run(app, args.n)) for name, app in variants.items()}
+    print(f"{'middleware':10} {'us/req':>8} {'overhead':>9}")
+    for name, us in results.items():
+        print(f"{name:10} {us:>8.1f} {us - results['none']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
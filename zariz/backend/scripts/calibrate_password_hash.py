@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Pick argon2 parameters for a target hash latency on this host.
+
+Prints the environment to set. Run it once per host class and deploy the
+result to every worker: workers that each picked their own parameters would
+disagree on the cost of new hashes.
+
+    python scripts/calibrate_password_hash.py --target-ms 250
+"""
+import argparse
+import time
+
+from app.core.security import _argon2_default, calibrate_argon2
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate argon2 cost")
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument("--memory-kib", type=int, default=None, help="starting memory cost (default: current)")
+    parser.add_argument("--parallelism", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if _argon2_default is None:
+        raise SystemExit("argon2 backend not available")
+    params = calibrate_argon2(args.target_ms, memory_cost=args.memory_kib, parallelism=args.parallelism)
+    handler = _argon2_default.using(**params)
+    start = time.perf_counter()
+    handler.hash("calibration")
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"# {elapsed:.0f}ms per hash (target {args.target_ms:.0f}ms)")
+    print(f"ARGON2_TIME_COST={params['time_cost']}")
+    print(f"ARGON2_MEMORY_COST={params['memory_cost']}")
+    print(f"ARGON2_PARALLELISM={params['parallelism']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.core.profiling import SamplingProfiler, profile_token, verify_profile_token
+from app.core.security import create_access_token
+
+
+def _admin():
+    return {"Authorization": f"Bearer {create_access_token(sub='1', role='admin')}"}
+
+
+@pytest.fixture()
+def profiling(monkeypatch):
+    monkeypatch.setattr(settings, "profiling_enabled", True)
+
+
+def _spin(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def test_sampling_profiler_collapses_busy_thread():
+    stop = threading.Event()
+    worker = threading.Thread(target=_spin, args=(stop,), name="busy worker")
+    worker.start()
+    profiler = SamplingProfiler(0.002).start()
+    time.sleep(0.2)
+    out = profiler.stop()
+    stop.set()
+    worker.join()
+    assert profiler.samples > 0
+    line = next(l for l in out.splitlines() if l.startswith("busy_worker;"))
+    stack, count = line.rsplit(" ", 1)
+    assert "test_admin_debug._spin" in stack.split(";") and int(count) > 0
+
+
+def test_debug_endpoints_are_off_by_default(client):
+    assert client.get("/v1/admin/debug/cpu?seconds=0.1", headers=_admin()).status_code == 404
+
+
+def test_debug_endpoints_require_admin(client, profiling):
+    courier = {"Authorization": f"Bearer {create_access_token(sub='101', role='courier')}"}
+    assert client.get("/v1/admin/debug/cpu?seconds=0.1", headers=courier).status_code == 403
+
+
+def test_cpu_profile_endpoint(client, profiling):
+    r = client.get("/v1/admin/debug/cpu?seconds=0.1&interval_ms=1", headers=_admin())
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+
+
+def test_memory_snapshots_and_diff(client, profiling):
+    assert client.get("/v1/admin/debug/memory", headers=_admin()).status_code == 409
+    assert client.post("/v1/admin/debug/memory/start", headers=_admin()).json() == {"tracing": True}
+    try:
+        first = client.get("/v1/admin/debug/memory?top=5", headers=_admin()).json()
+        assert first["diff"] is None and len(first["top"]) <= 5
+        second = client.get("/v1/admin/debug/memory?top=5", headers=_admin()).json()
+        assert second["diff"] is not None
+    finally:
+        client.post("/v1/admin/debug/memory/stop", headers=_admin())
+
+
+def test_signed_header_profiles_one_request(client, profiling):
+    token = client.post("/v1/admin/debug/profile-token?ttl=60", headers=_admin()).json()["value"]
+    assert verify_profile_token(token, "1", consume=False)
+    client.get("/v1/couriers", headers={**_admin(), "X-Profile": token, "X-Request-ID": "prof-1"})
+    assert client.get("/v1/admin/debug/profiles/prof-1", headers=_admin()).status_code == 200
+    # Single use
+    client.get("/v1/couriers", headers={**_admin(), "X-Profile": token, "X-Request-ID": "prof-1b"})
+    assert client.get("/v1/admin/debug/profiles/prof-1b", headers=_admin()).status_code == 404
+
+    forged = token.rsplit(".", 1)[0] + "." + "0" * 64
+    assert not verify_profile_token(forged, "1")
+    client.get("/v1/couriers", headers={**_admin(), "X-Profile": forged, "X-Request-ID": "prof-2"})
+    assert client.get("/v1/admin/debug/profiles/prof-2", headers=_admin()).status_code == 404
+
+
+def test_profile_token_is_bound_to_the_admin(client, profiling):
+    token = client.post("/v1/admin/debug/profile-token", headers=_admin()).json()["value"]
+    other = {"Authorization": f"Bearer {create_access_token(sub='2', role='admin')}"}
+    client.get("/v1/couriers", headers={**other, "X-Profile": token, "X-Request-ID": "prof-3"})
+    client.get("/v1/couriers", headers={"X-Profile": token, "X-Request-ID": "prof-4"})
+    assert client.get("/v1/admin/debug/profiles/prof-3", headers=_admin()).status_code == 404
+    assert client.get("/v1/admin/debug/profiles/prof-4", headers=_admin()).status_code == 404
+    # Rejected attempts did not use it up
+    assert verify_profile_token(token, "1")
+
+
+def test_request_profile_time_cap_frees_the_sampler():
+    profiler = SamplingProfiler(0.001, max_seconds=0.05).start()
+    time.sleep(0.2)
+    # The sampler ended on its own, so another profile can start
+    SamplingProfiler(0.001).start().stop()
+    profiler.stop()
+
+
+def test_expired_profile_token_is_rejected():
+    assert not verify_profile_token(profile_token("1", ttl=-10), "1")
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core import hashing
+from app.core.hashing import HashingBusy, PasswordHasher, password_hasher
+from app.core.security import hash_password
+
+
+def test_pool_admits_up_to_cap_then_rejects(monkeypatch):
+    gate = threading.Event()
+    monkeypatch.setattr(hashing, "verify_password", lambda pw, h: gate.wait(5))
+    hasher = PasswordHasher(workers=1, max_pending=2)
+    futures = [hasher._submit("verify", hashing.verify_password, "p", "h") for _ in range(2)]
+    with pytest.raises(HashingBusy):
+        hasher.verify_sync("p", "h")
+    gate.set()
+    assert all(f.result(5) for f in futures)
+    assert hasher.pending == 0
+    hasher.shutdown()
+
+
+def test_async_api_round_trips():
+    hasher = PasswordHasher(workers=2, max_pending=4)
+
+    async def run():
+        h = await hasher.hash("s3cr3t")
+        return await asyncio.gather(hasher.verify("s3cr3t", h), hasher.verify("nope", h))
+
+    assert asyncio.run(run()) == [True, False]
+    hasher.shutdown()
+
+
+def test_login_is_shed_with_503_when_pool_is_full(client, db_session, monkeypatch):
+    from app.db.models.user import User
+
+    db_session.add(User(email="busy@example.com", phone="+1555000222", name="B", role="admin", status="active", password_hash=hash_password("p")))
+    db_session.commit()
+    monkeypatch.setattr(password_hasher, "_max_pending", 0)
+    r = client.post("/v1/auth/login_password", json={"identifier": "busy@example.com", "password": "p"})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
@@ -0,0 +1,76 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app.core.security import create_access_token, hash_password
+from app.db.models.store import Store
+from app.db.models.store_user_membership import StoreUserMembership
+from app.db.models.user import User
+from app.services import memberships
+
+
+@contextmanager
+def _selects(db_session):
+    statements = []
+    engine = db_session.get_bind()
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+
+def _seed(db_session):
+    st = Store(name="Queries Store")
+    u = User(email="queries@example.com", phone="+1555000401", name="Q", role="store", status="active", password_hash=hash_password("p"))
+    db_session.add_all([st, u])
+    db_session.flush()
+    db_session.add(StoreUserMembership(user_id=u.id, store_id=st.id, role_in_store="staff"))
+    db_session.commit()
+    return u, st
+
+
+def test_login_and_refresh_need_one_select_each(client, db_session):
+    u, st = _seed(db_session)
+    memberships.invalidate()
+    # Case-insensitive email and phone both resolve in one query
+    assert client.post("/v1/auth/login_password", json={"identifier": "QUERIES@example.com", "password": "p"}).status_code == 200
+
+    with _selects(db_session) as statements:
+        r = client.post("/v1/auth/login_password", json={"identifier": "+1555000401", "password": "p"})
+    assert r.status_code == 200
+    assert len(statements) == 1 and "FROM users" in statements[0]
+
+    with _selects(db_session) as statements:
+        r2 = client.post("/v1/auth/refresh", json={"refresh_token": r.json()["refresh_token"]})
+    assert r2.status_code == 200
+    assert len(statements) == 1 and "JOIN users" in statements[0]
+
+
+def test_store_credentials_change_invalidates_memberships(client, db_session):
+    u, st = _seed_second(db_session)
+    memberships.invalidate()
+    assert memberships.store_ids_for(db_session, u) == [st.id]
+    admin = create_access_token(sub="1", role="admin")
+    r = client.post(f"/v1/admin/stores/{st.id}/credentials", json={"password": "new"}, headers={"Authorization": f"Bearer {admin}"})
+    assert r.status_code == 200
+    db_session.refresh(u)
+    store_id = db_session.get(Store, st.id).id
+    with _selects(db_session) as statements:
+        assert memberships.store_ids_for(db_session, u) == [store_id]
+    assert len(statements) == 1 and "store_user_memberships" in statements[0]
+
+
+def _seed_second(db_session):
+    st = Store(name="Queries Store 2")
+    u = User(email="queries2@example.com", phone="+1555000402", name="Q2", role="store", status="active", password_hash="!")
+    db_session.add_all([st, u])
+    db_session.flush()
+    db_session.add(StoreUserMembership(user_id=u.id, store_id=st.id, role_in_store="owner", is_primary=True))
+    db_session.commit()
+    return u, st
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+
+from app.core.security import generate_refresh_token, hash_password
+from app.db.models.user import User
+from app.db.models.user_session import UserSession
+
+
+def _login(client, db_session, email):
+    u = User(email=email, phone=f"+1{abs(hash(email)) % 10**9:09d}", name="R", role="admin", status="active", password_hash=hash_password("p"))
+    db_session.add(u)
+    db_session.commit()
+    r = client.post("/v1/auth/login_password", json={"identifier": email, "password": "p"})
+    assert r.status_code == 200
+    return u, r.json()["refresh_token"]
+
+
+def test_refresh_token_is_selector_verifier(client, db_session):
+    _, refresh = _login(client, db_session, "sel@example.com")
+    selector, verifier = refresh.split(".")
+    session = db_session.query(UserSession).filter(UserSession.selector == selector).one()
+    # Only a keyed hash of the verifier is stored
+    assert verifier not in session.refresh_token_hash
+    # Tampered verifier with a valid selector is rejected
+    tampered = ("A" if verifier[0] != "A" else "B") + verifier[1:]
+    assert client.post("/v1/auth/refresh", json={"refresh_token": f"{selector}.{tampered}"}).status_code == 401
+    assert client.post("/v1/auth/logout", json={"refresh_token": refresh}).json() == {"ok": True}
+    db_session.refresh(session)
+    assert session.revoked_at is not None
+    assert client.post("/v1/auth/refresh", json={"refresh_token": refresh}).status_code == 401
+
+
+def test_refresh_cost_does_not_grow_with_sessions(client, db_session):
+    user, refresh = _login(client, db_session, "many@example.com")
+    # Plenty of other active legacy sessions must not be scanned for a new-format token
+    for _ in range(50):
+        db_session.add(
+            UserSession(
+                user_id=user.id,
+                refresh_token_hash=f"sha256${generate_refresh_token()}",
+                expires_at=datetime.now(timezone.utc) + timedelta(days=1),
+            )
+        )
+    db_session.commit()
+    statements = []
+    engine = db_session.get_bind()
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT") and "user_sessions" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        r = client.post("/v1/auth/refresh", json={"refresh_token": refresh})
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert r.status_code == 200
+    # One indexed selector lookup; anything else is a primary-key load, never a scan
+    assert sum("user_sessions.selector = " in s for s in statements) == 1
+    assert all("user_sessions.selector = " in s or "user_sessions.id = " in s for s in statements)
+
+
+def test_legacy_refresh_token_migrates_on_rotation(client, db_session):
+    user, _ = _login(client, db_session, "legacy@example.com")
+    legacy = generate_refresh_token()
+    db_session.add(
+        UserSession(
+            user_id=user.id,
+            refresh_token_hash=hash_password(legacy),
+            expires_at=datetime.now(timezone.utc) + timedelta(days=1),
+        )
+    )
+    db_session.commit()
+    r = client.post("/v1/auth/refresh", json={"refresh_token": legacy})
+    assert r.status_code == 200
+    assert "." in r.json()["refresh_token"]
+    assert client.post("/v1/auth/refresh", json={"refresh_token": legacy}).status_code == 401
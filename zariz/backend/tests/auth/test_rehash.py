@@ -0,0 +1,44 @@
+import hashlib
+
+from passlib.hash import argon2
+
+from app.core import security
+from app.db.models.user import User
+
+
+def _login(client, email):
+    return client.post("/v1/auth/login_password", json={"identifier": email, "password": "p"})
+
+
+def test_outdated_hashes_are_upgraded_on_login(client, db_session):
+    weak = argon2.using(time_cost=1, memory_cost=8192, parallelism=1).hash("p")
+    legacy = "sha256$" + hashlib.sha256(b"p").hexdigest()
+    users = [
+        User(email="weakhash@example.com", phone="+1555000301", name="W", role="admin", status="active", password_hash=weak),
+        User(email="legacyhash@example.com", phone="+1555000302", name="L", role="admin", status="active", password_hash=legacy),
+    ]
+    db_session.add_all(users)
+    db_session.commit()
+    for u in users:
+        assert _login(client, u.email).status_code == 200
+        db_session.refresh(u)
+        assert u.password_hash.startswith("$argon2")
+        assert not security.needs_rehash(u.password_hash)
+        # The upgraded hash still verifies
+        assert _login(client, u.email).status_code == 200
+    assert security.verify_and_update("wrong", users[0].password_hash) == (False, None)
+
+
+def test_calibration_returns_usable_params():
+    params = security.calibrate_argon2(1.0, memory_cost=8192, parallelism=1, max_time_cost=3)
+    assert params["memory_cost"] == 8192 and params["parallelism"] == 1
+    assert 1 <= params["time_cost"] <= 3
+    before = security.argon2_params()
+    try:
+        security.configure_argon2(**params)
+        assert security.argon2_params() == params
+        # Stronger than the floor: kept; weaker: upgraded
+        assert not security.needs_rehash(argon2.using(**{**params, "time_cost": params["time_cost"] + 1}).hash("x"))
+        assert security.needs_rehash(argon2.using(**{**params, "memory_cost": params["memory_cost"] // 2}).hash("x"))
+    finally:
+        security.configure_argon2(**before)
@@ -0,0 +1,45 @@
+import time
+
+from sqlalchemy import event
+
+from app.core.security import hash_password
+from app.db.models.user import User
+from app.services.sessions import SessionCache, session_cache
+
+
+def test_session_validity_is_cached_and_revocation_invalidates(client, db_session):
+    session_cache.clear()
+    db_session.add(User(email="cache@example.com", phone="+1555000111", name="C", role="admin", status="active", password_hash=hash_password("p")))
+    db_session.commit()
+    tokens = client.post("/v1/auth/login_password", json={"identifier": "cache@example.com", "password": "p"}).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    lookups = []
+    engine = db_session.get_bind()
+
+    def count(conn, cursor, statement, *args):
+        if "FROM user_sessions" in statement:
+            lookups.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        for _ in range(5):
+            assert client.get("/v1/orders", headers=headers).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert len(lookups) == 1
+
+    assert client.post("/v1/auth/logout", json={"refresh_token": tokens["refresh_token"]}).status_code == 200
+    assert client.get("/v1/orders", headers=headers).status_code == 401
+
+
+def test_session_cache_ttl_and_lru():
+    cache = SessionCache(ttl=0.05, maxsize=2)
+    cache.put(1, True, None)
+    cache.put(2, True, time.time() - 1)  # session itself expired
+    assert cache.get(2) is False
+    assert cache.get(1) is True
+    cache.put(3, True, None)  # evicts 2, the least recently used
+    assert cache.get(2) is None and cache.get(1) is True
+    time.sleep(0.06)
+    assert cache.get(1) is None
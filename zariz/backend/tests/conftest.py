@@ -1,4 +1,14 @@
 import os
+
+# Background tasks (outbox dispatcher, ...) talk to the real database; tests drive them directly
+os.environ.setdefault("BACKGROUND_TASKS", "0")
+# Rate-limit buckets stay in the test process (the shared backend is tested on its own)
+os.environ.setdefault("RATE_LIMIT_STORAGE", "zariz-local://")
+# Fail any request that looks like an N+1 (see app/db/instrumentation.py)
+os.environ.setdefault("SQL_STRICT", "1")
+os.environ.setdefault("SQL_STATEMENT_BUDGET", "25")
+os.environ.setdefault("SQL_REPEAT_BUDGET", "4")
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -50,6 +60,9 @@ def client(db_session):
 
     # override dependency
     app.dependency_overrides[deps_module.get_db] = override_get_db
+    app.dependency_overrides[deps_module.get_session_factory] = lambda: sessionmaker(
+        bind=db_session.get_bind(), autocommit=False, autoflush=False
+    )
     if not db_session.query(Store).filter(Store.id == 1).first():
         db_session.add(Store(id=1, name="Test Store"))
         db_session.commit()
@@ -4,6 +4,7 @@ import json
 from fastapi.testclient import TestClient
 
 from app.services.events import events_bus
+from app.services.outbox import dispatch_batch
 from app.core.security import create_access_token
 
 
@@ -35,7 +36,7 @@ def test_sse_store_can_connect(client: TestClient, store_token: str):
     assert "text/event-stream" in resp.headers["content-type"]
 
 
-def test_order_created_event_includes_details(client: TestClient, store_token: str):
+def test_order_created_event_includes_details(client: TestClient, db_session, store_token: str):
     """Order creation publishes event with order details."""
     # Subscribe to events
     q = events_bus.subscribe()
@@ -58,9 +59,12 @@ def test_order_created_event_includes_details(client: TestClient, store_token: s
         assert resp.status_code == 200
         order_id = resp.json()["id"]
         
+        # Nothing is published until the outbox is dispatched
+        assert q.empty()
+        dispatch_batch(db_session)
         # Check event was published
-        data = q.get_nowait()
-        event = json.loads(data)
+        events = [json.loads(q.get_nowait()) for _ in range(q.qsize())]
+        event = next(e for e in events if e.get("order_id") == order_id)
         assert event["type"] == "order.created"
         assert event["order_id"] == order_id
         assert event["pickup_address"] == "Warehouse A"
@@ -0,0 +1,40 @@
+import uuid
+
+from app.db.models.device import Device
+from app.db.models.store import Store
+from app.db.models.store_user_membership import StoreUserMembership
+from app.db.models.user import User
+from app.services.audience import audience_tokens
+
+
+def _user(db, role):
+    u = User(phone=f"+{uuid.uuid4().int % 10**12}", name=role, role=role, status="active")
+    db.add(u)
+    db.flush()
+    return u
+
+
+def test_audience_is_courier_store_members_and_admins(db_session):
+    tag = uuid.uuid4().hex[:8]
+    store = Store(name=f"aud-{tag}")
+    other_store = Store(name=f"aud-other-{tag}")
+    db_session.add_all([store, other_store])
+    db_session.flush()
+    courier, other_courier = _user(db_session, "courier"), _user(db_session, "courier")
+    member, outsider, admin = _user(db_session, "store"), _user(db_session, "store"), _user(db_session, "admin")
+    db_session.add_all(
+        [
+            StoreUserMembership(user_id=member.id, store_id=store.id),
+            StoreUserMembership(user_id=outsider.id, store_id=other_store.id),
+        ]
+    )
+    for u in (courier, other_courier, member, outsider, admin):
+        db_session.add(Device(user_id=u.id, platform="ios", token=f"{tag}-{u.id}"))
+    db_session.add(Device(user_id=None, platform="ios", token=f"{tag}-anon"))
+    db_session.commit()
+
+    tokens = {t for t in audience_tokens(db_session, store_id=store.id, courier_id=courier.id) if t.startswith(tag)}
+    assert tokens == {f"{tag}-{courier.id}", f"{tag}-{member.id}", f"{tag}-{admin.id}"}
+
+    tokens = {t for t in audience_tokens(db_session, store_id=store.id, include_admins=False) if t.startswith(tag)}
+    assert tokens == {f"{tag}-{member.id}"}
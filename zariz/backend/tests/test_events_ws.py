@@ -0,0 +1,44 @@
+"""Tests for the WebSocket events endpoint."""
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.services.events import events_bus
+from app.core.security import create_access_token
+
+
+def test_ws_requires_auth(client: TestClient):
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/v1/events/ws") as ws:
+            ws.receive_json()
+    assert exc.value.code == 4401
+
+
+def test_ws_topic_subscription(client: TestClient):
+    token = create_access_token(sub="1", role="admin")
+    with client.websocket_connect(f"/v1/events/ws?token={token}&topics=order:1") as ws:
+        assert ws.receive_json() == {"op": "ready", "topics": ["order:1"]}
+        ws.send_json({"op": "subscribe", "topics": ["store:7"]})
+        assert ws.receive_json() == {"op": "topics", "topics": ["order:1", "store:7"]}
+        ws.send_json({"op": "unsubscribe", "topics": ["order:1"]})
+        assert ws.receive_json() == {"op": "topics", "topics": ["store:7"]}
+
+        # Not matching any subscribed topic: filtered out
+        events_bus.publish({"type": "order.updated", "order_id": 1})
+        events_bus.publish({"type": "order.created", "order_id": 2, "store_id": 7})
+        assert ws.receive_json() == {"type": "order.created", "order_id": 2, "store_id": 7}
+
+        ws.send_json({"op": "ping"})
+        assert ws.receive_json() == {"op": "pong"}
+        ws.send_json({"op": "subscribe", "topics": ["bogus"]})
+        assert ws.receive_json()["op"] == "error"
+
+
+def test_ws_msgpack_framing(client: TestClient, courier_token: str):
+    msgpack = pytest.importorskip("msgpack")
+    with client.websocket_connect(f"/v1/events/ws?token={courier_token}&encoding=msgpack") as ws:
+        assert msgpack.unpackb(ws.receive_bytes()) == {"op": "ready", "topics": None}
+        events_bus.publish({"type": "order.assigned", "order_id": 3, "courier_id": 101})
+        assert msgpack.unpackb(ws.receive_bytes()) == {"type": "order.assigned", "order_id": 3, "courier_id": 101}
+        ws.send_bytes(msgpack.packb({"op": "ping"}))
+        assert msgpack.unpackb(ws.receive_bytes()) == {"op": "pong"}
@@ -0,0 +1,114 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.db.models.idempotency import IdempotencyKey
+from app.services import idempotency
+from app.services.idempotency import response_cache
+
+
+def _sessions(db_session):
+    return sessionmaker(bind=db_session.get_bind(), autoflush=False)
+
+
+def test_concurrent_duplicate_waits_and_replays(db_session):
+    response_cache.clear()
+    Session = _sessions(db_session)
+    first_db, second_db = Session(), Session()
+    first = idempotency.begin(first_db, "dup-1", "POST", "/v1/orders")
+    assert first.replay is None
+
+    result = {}
+
+    def duplicate():
+        result["req"] = idempotency.begin(second_db, "dup-1", "POST", "/v1/orders")
+
+    t = threading.Thread(target=duplicate)
+    t.start()
+    time.sleep(0.2)
+    assert t.is_alive()  # waiting on the in-flight original
+    first.complete(200, {"id": 42})
+    first_db.commit()
+    first.finish()
+    t.join(5)
+    replay = result["req"].replay
+    assert replay is not None and replay.status_code == 200 and replay.body == b'{"id":42}'
+    first_db.close()
+    second_db.close()
+
+
+def test_duplicate_gets_409_while_original_runs(db_session, monkeypatch):
+    response_cache.clear()
+    monkeypatch.setattr(settings, "idempotency_wait_seconds", 0.1)
+    Session = _sessions(db_session)
+    with Session() as a, Session() as b:
+        idempotency.begin(a, "dup-2", "POST", "/v1/orders")
+        with pytest.raises(HTTPException) as exc:
+            idempotency.begin(b, "dup-2", "POST", "/v1/orders")
+        assert exc.value.status_code == 409
+        # A different endpoint is always a conflict
+        with pytest.raises(HTTPException):
+            idempotency.begin(b, "dup-2", "POST", "/v1/orders/1/accept")
+
+
+def test_lapsed_reservation_is_taken_over(db_session):
+    response_cache.clear()
+    db_session.add(
+        IdempotencyKey(
+            key="dup-3",
+            method="POST",
+            path="/v1/orders",
+            state="in_progress",
+            expires_at=datetime.now(timezone.utc) - timedelta(seconds=1),
+        )
+    )
+    db_session.commit()
+    req = idempotency.begin(db_session, "dup-3", "POST", "/v1/orders")
+    assert req.replay is None
+    req.complete(201, b'{"ok":true}')
+    req.finish()
+    rec = db_session.get(IdempotencyKey, "dup-3", populate_existing=True)
+    assert (rec.state, rec.status_code, rec.response_body) == ("completed", 201, b'{"ok":true}')
+
+
+def test_failed_handler_releases_key_and_replays_skip_db(client, db_session, courier_token, store_token):
+    response_cache.clear()
+    headers = {"Authorization": f"Bearer {courier_token}", "Idempotency-Key": "rel-1"}
+    assert client.post("/v1/orders/999999/accept", headers=headers).status_code == 404
+    assert db_session.get(IdempotencyKey, "rel-1") is None
+
+    payload = {
+        "pickup_address": "W",
+        "recipient_first_name": "A",
+        "recipient_last_name": "B",
+        "phone": "+972500000999",
+        "street": "S",
+        "building_no": "1",
+        "boxes_count": 1,
+    }
+    headers = {"Authorization": f"Bearer {store_token}", "Idempotency-Key": "replay-1"}
+    r1 = client.post("/v1/orders", headers=headers, json=payload)
+    assert r1.status_code == 200
+    rec = db_session.get(IdempotencyKey, "replay-1", populate_existing=True)
+    assert rec.state == "completed" and isinstance(rec.response_body, bytes)
+
+    statements = []
+    engine = db_session.get_bind()
+
+    def count(conn, cursor, statement, *args):
+        if "idempotency_keys" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        r2 = client.post("/v1/orders", headers=headers, json=payload)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert r2.json() == r1.json()
+    assert statements == []
@@ -0,0 +1,54 @@
+import io
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+from app.core.logging import AccessLogSampler, DroppingQueueHandler, JSONFormatter
+
+
+def _record(msg="hello", *args, fields=None, exc_info=None):
+    record = logging.LogRecord("app", logging.INFO, __file__, 1, msg, args, exc_info)
+    if fields is not None:
+        record.fields = fields
+    return record
+
+
+def test_formatter_merges_fields():
+    out = json.loads(JSONFormatter().format(_record("n=%d", 3, fields={"status_code": 200, "path": "/x"})))
+    assert out == {"level": "INFO", "msg": "n=3", "logger": "app", "status_code": 200, "path": "/x"}
+
+
+def test_queue_handler_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    for i in range(3):
+        handler.handle(_record("r%d", i))
+    assert handler.queue.qsize() == 1
+    assert handler.queue.get_nowait().msg == "r0"
+
+
+def test_queued_records_are_written_by_listener():
+    stream = io.StringIO()
+    sink = logging.StreamHandler(stream)
+    sink.setFormatter(JSONFormatter())
+    front = DroppingQueueHandler(queue.Queue(100))
+    listener = logging.handlers.QueueListener(front.queue, sink)
+    listener.start()
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        front.handle(_record("failed %s", "op", exc_info=sys.exc_info()))
+    listener.stop()
+    (line,) = stream.getvalue().splitlines()
+    out = json.loads(line)
+    assert out["msg"] == "failed op"
+    assert "ValueError: boom" in out["exc_info"]
+
+
+def test_sampler_keeps_errors_and_plain_records():
+    sampler = AccessLogSampler(0.0)
+    assert not sampler.filter(_record(fields={"status_code": 200}))
+    assert sampler.filter(_record(fields={"status_code": 404}))
+    assert sampler.filter(_record())
+    assert AccessLogSampler(1.0).filter(_record(fields={"status_code": 200}))
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta, timezone
+import time
+
+from sqlalchemy import delete
+
+from app.db.models.idempotency import IdempotencyKey
+from app.db.models.rate_limit import RateLimitBucket
+from app.db.models.user_session import UserSession
+from app.worker import maintenance
+
+
+def _seed(db):
+    db.execute(delete(UserSession))
+    db.execute(delete(IdempotencyKey))
+    db.execute(delete(RateLimitBucket))
+    now = datetime.now(timezone.utc)
+    old, soon = now - timedelta(days=3), now + timedelta(days=3)
+    sessions = {
+        "expired": UserSession(user_id=1, refresh_token_hash="gc-expired", expires_at=old),
+        "revoked": UserSession(user_id=1, refresh_token_hash="gc-revoked", expires_at=soon, revoked_at=old),
+        "just_revoked": UserSession(user_id=1, refresh_token_hash="gc-just-revoked", expires_at=soon, revoked_at=now),
+        "active": UserSession(user_id=1, refresh_token_hash="gc-active", expires_at=soon),
+    }
+    db.add_all(sessions.values())
+    db.add_all(
+        [
+            IdempotencyKey(key="gc-old", method="POST", path="/v1/orders", status_code=200, response_body=b"{}", expires_at=old),
+            IdempotencyKey(key="gc-new", method="POST", path="/v1/orders", status_code=200, response_body=b"{}", expires_at=soon),
+            RateLimitBucket(key="gc-full", capacity=5, rate=1, tokens=5, updated_at=time.time() - 60, expires_at=time.time() - 60),
+            RateLimitBucket(key="gc-used", capacity=5, rate=1, tokens=0, updated_at=time.time(), expires_at=time.time() + 5),
+        ]
+    )
+    db.commit()
+
+
+def test_dry_run_only_counts(db_session):
+    _seed(db_session)
+    assert maintenance.purge(db_session, dry_run=True) == {"user_sessions": 2, "idempotency_keys": 1, "rate_limit_buckets": 1}
+    assert db_session.query(UserSession).count() == 4
+
+
+def test_purge_deletes_dead_rows_in_batches(db_session):
+    _seed(db_session)
+    assert maintenance.purge(db_session, batch_size=1) == {"user_sessions": 2, "idempotency_keys": 1, "rate_limit_buckets": 1}
+    assert sorted(s.refresh_token_hash for s in db_session.query(UserSession)) == ["gc-active", "gc-just-revoked"]
+    assert [k.key for k in db_session.query(IdempotencyKey)] == ["gc-new"]
+    assert [b.key for b in db_session.query(RateLimitBucket)] == ["gc-used"]
+    assert maintenance.purge(db_session) == {"user_sessions": 0, "idempotency_keys": 0, "rate_limit_buckets": 0}
@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.core import metrics
+from app.core.middleware import RequestLogMiddleware
+from app.db.instrumentation import TimedQueuePool, instrument_engine, request_query_stats, QueryStats
+from app.services.events import events_bus
+
+pytestmark = pytest.mark.skipif(not metrics.ENABLED, reason="prometheus_client not installed")
+
+
+def _sample(name, **labels):
+    from prometheus_client import REGISTRY
+
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_metrics_endpoint_exposes_route_templates(client):
+    client.get("/v1/orders/999999", headers={"Authorization": "Bearer nope"})
+    client.get("/no/such/path")
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    body = r.text
+    assert 'route="/v1/orders/{order_id}"' in body
+    assert 'route="unmatched"' in body
+    assert "/v1/orders/999999" not in body
+    assert "events_subscribers" in body
+
+
+def test_metrics_endpoint_requires_configured_token(client, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "metrics_token", "s3cret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
+
+
+def test_sql_statements_counted_per_request(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/m.db")
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int):
+        with engine.connect() as conn:
+            for _ in range(item_id):
+                conn.execute(text("select 1"))
+        return {}
+
+    app.add_middleware(RequestLogMiddleware)
+    labels = {"method": "GET", "route": "/items/{item_id}"}
+    before = _sample("http_request_sql_statements_sum", **labels)
+    TestClient(app).get("/items/3")
+    assert _sample("http_request_sql_statements_sum", **labels) - before == 3
+    assert request_query_stats.get() is None
+
+
+def test_pool_metrics(tmp_path):
+    engine = instrument_engine(create_engine(f"sqlite:///{tmp_path}/p.db", poolclass=TimedQueuePool))
+    waits = _sample("db_pool_wait_seconds_count")
+    with engine.connect():
+        assert _sample("db_pool_checked_out") == 1
+    assert _sample("db_pool_checked_out") == 0
+    assert _sample("db_pool_wait_seconds_count") == waits + 1
+
+
+def test_event_bus_gauges():
+    q = events_bus.subscribe()
+    try:
+        events_bus.publish({"type": "order.created", "order_id": 1})
+        assert _sample("events_subscribers") >= 1
+        assert _sample("events_queued_frames_max") >= 1
+    finally:
+        events_bus.unsubscribe(q)
+
+
+def test_queries_outside_requests_are_not_counted(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/n.db")
+    stats = QueryStats()
+    token = request_query_stats.set(stats)
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("select 1"))
+    finally:
+        request_query_stats.reset(token)
+    with engine.connect() as conn:
+        conn.execute(text("select 1"))
+    assert stats.statements == 1
+
+
+_MULTIPROC_SCRIPT = """
+from app.core import metrics
+from app.services.events import events_bus
+
+events_bus.subscribe(); events_bus.subscribe()
+print(metrics.render()[0].decode())
+"""
+
+
+def test_tracked_gauges_are_written_in_multiprocess_mode(tmp_path):
+    # The multi-process value class is chosen when prometheus_client is imported, hence a subprocess
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    out = subprocess.run([sys.executable, "-c", _MULTIPROC_SCRIPT], env=env, capture_output=True, text=True, check=True)
+    assert "events_subscribers 2.0" in out.stdout.splitlines()
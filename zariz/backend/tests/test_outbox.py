@@ -0,0 +1,71 @@
+import json
+
+from app.db.models.outbox import OutboxEvent
+from app.services import outbox
+from app.services.events import events_bus
+
+
+def auth_header(token: str):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_transition_writes_outbox_in_same_transaction(client, db_session, store_token):
+    outbox.dispatch_batch(db_session, limit=10_000)
+    r = client.post(
+        "/v1/orders",
+        headers=auth_header(store_token),
+        json={
+            "recipient_first_name": "A",
+            "recipient_last_name": "B",
+            "phone": "+1",
+            "street": "S",
+            "building_no": "1",
+            "boxes_count": 2,
+        },
+    )
+    assert r.status_code == 200
+    oid = r.json()["id"]
+    rows = db_session.query(OutboxEvent).all()
+    assert [json.loads(row.event)["order_id"] for row in rows] == [oid]
+    push = json.loads(rows[0].push)
+    assert push["store_id"] == 1 and push["courier_id"] is None
+
+
+def test_dispatch_batch_publishes_and_deletes(db_session):
+    outbox.dispatch_batch(db_session, limit=10_000)
+    outbox.enqueue(db_session, {"type": "order.updated", "order_id": 1})
+    outbox.enqueue(db_session, {"type": "order.updated", "order_id": 2})
+    db_session.commit()
+    q = events_bus.subscribe()
+    try:
+        assert outbox.dispatch_batch(db_session, limit=1) == 1
+        assert outbox.dispatch_batch(db_session) == 1
+        assert outbox.dispatch_batch(db_session) == 0
+        assert [json.loads(q.get_nowait())["order_id"] for _ in range(2)] == [1, 2]
+        assert db_session.query(OutboxEvent).count() == 0
+    finally:
+        events_bus.unsubscribe(q)
+
+
+def test_dispatch_batch_keeps_rows_whose_push_failed(db_session, monkeypatch):
+    outbox.dispatch_batch(db_session, limit=10_000)
+
+    def lookup_fails(db, store_id=None, courier_id=None):
+        raise RuntimeError("audience lookup failed")
+
+    monkeypatch.setattr(outbox, "audience_tokens", lookup_fails)
+    outbox.enqueue(db_session, {"type": "order.updated", "order_id": 7}, push={"store_id": 1, "courier_id": None, "data": {}})
+    db_session.commit()
+    q = events_bus.subscribe()
+    try:
+        assert outbox.dispatch_batch(db_session) == 0
+        assert outbox.dispatch_batch(db_session) == 0
+        # Published once; the push hand-off is retried
+        assert json.loads(q.get_nowait())["order_id"] == 7 and q.empty()
+        row = db_session.query(OutboxEvent).one()
+        assert row.attempts == 2
+        monkeypatch.setattr(outbox, "audience_tokens", lambda db, store_id=None, courier_id=None: [])
+        assert outbox.dispatch_batch(db_session) == 1
+        assert db_session.query(OutboxEvent).count() == 0 and q.empty()
+    finally:
+        events_bus.unsubscribe(q)
@@ -0,0 +1,88 @@
+import threading
+import time
+
+from app.worker.dispatcher import PushDispatcher
+
+
+def test_submit_does_not_block_and_drains_on_stop():
+    sent: list[str] = []
+    gate = threading.Event()
+
+    def slow_send(groups):
+        gate.wait(1)
+        for _, tokens in groups:
+            sent.extend(tokens)
+
+    d = PushDispatcher(maxsize=100, workers=2, send_batch=slow_send)
+    d.start()
+    start = time.perf_counter()
+    for i in range(20):
+        assert d.submit(f"tok{i}", {"type": "x"})
+    assert time.perf_counter() - start < 0.5
+    gate.set()
+    d.stop(timeout=5)
+    assert sorted(sent) == sorted(f"tok{i}" for i in range(20))
+
+
+def test_identical_payloads_are_grouped():
+    calls = []
+    gate = threading.Event()
+
+    def send(groups):
+        gate.wait(5)
+        calls.append(groups)
+
+    d = PushDispatcher(maxsize=100, workers=1, batch_size=100, send_batch=send)
+    d.start()
+    d.submit("warmup", {})  # parks the worker so the rest accumulate
+    time.sleep(0.05)
+    for i in range(10):
+        d.submit(f"a{i}", {"type": "order.created", "order_id": 1})
+        d.submit(f"b{i}", {"order_id": 2, "type": "order.created"})
+    gate.set()
+    d.stop(timeout=5)
+    assert len(calls) == 2
+    groups = {data["order_id"]: tokens for data, tokens in calls[1]}
+    assert groups == {1: [f"a{i}" for i in range(10)], 2: [f"b{i}" for i in range(10)]}
+
+
+def test_full_queue_drops_instead_of_blocking():
+    gate = threading.Event()
+    d = PushDispatcher(maxsize=1, workers=1, batch_size=1, send_batch=lambda groups: gate.wait(5) and [])
+    d.start()
+    results = [d.submit(f"tok{i}", {}) for i in range(5)]
+    assert results.count(False) >= 3
+    gate.set()
+    d.stop(timeout=5)
+
+
+def test_inline_send_when_not_started():
+    sent = []
+    d = PushDispatcher(maxsize=1, workers=1, send_batch=lambda groups: sent.extend(groups))
+    assert d.submit("tok", {"k": 1})
+    assert sent == [({"k": 1}, ["tok"])]
+
+
+def test_burst_for_same_order_coalesces_to_latest():
+    calls = []
+    invalid = []
+    gate = threading.Event()
+
+    def send(groups):
+        gate.wait(5)
+        calls.append(groups)
+        return ["gone"] if any("gone" in tokens for _, tokens in groups) else []
+
+    d = PushDispatcher(maxsize=100, workers=1, batch_size=100, send_batch=send, on_invalid=invalid.extend)
+    d.start()
+    d.submit("warmup", {})
+    time.sleep(0.05)
+    for status in ("created", "accepted", "picked_up"):
+        d.submit("tok", {"type": f"order.{status}", "order_id": 7})
+    d.submit("gone", {"type": "order.created", "order_id": 8})
+    gate.set()
+    d.stop(timeout=5)
+    sent = [(data, tokens) for data, tokens in calls[1]]
+    assert ({"type": "order.picked_up", "order_id": 7}, ["tok"]) in sent
+    assert sum(len(tokens) for _, tokens in sent) == 2
+    assert invalid == ["gone"]
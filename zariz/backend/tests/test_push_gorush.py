@@ -0,0 +1,180 @@
+"""Batched gorush fan-out against a local stub server."""
+import http.client
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.worker import push
+
+
+class _StubGorush(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        self.requests: list[dict] = []
+        self.connections = 0
+        super().__init__(("127.0.0.1", 0), _Handler)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        payload = json.loads(body)
+        self.server.requests.append(payload)
+        logs = [
+            {"type": "failed-push", "platform": "ios", "token": t, "error": "Unregistered"}
+            for n in payload["notifications"]
+            for t in n["tokens"]
+            if t.startswith("dead")
+        ]
+        out = json.dumps({"counts": 1, "logs": logs, "success": "ok"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def gorush(monkeypatch):
+    server = _StubGorush()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("GORUSH_URL", f"http://127.0.0.1:{server.server_port}/api/push")
+    monkeypatch.setenv("GORUSH_MAX_TOKENS", "1000")
+    monkeypatch.setenv("GORUSH_MAX_NOTIFICATIONS", "2")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_tokens_are_chunked_into_few_requests(gorush):
+    client = push._PushClient()
+    tokens = [f"t{i}" for i in range(2500)]
+    client.send_batch([({"type": "order.created", "order_id": 1}, tokens), ({"order_id": 2}, ["x", "y"])])
+
+    # 3 notifications for 2500 tokens + 1 for the second payload, 2 notifications per request
+    assert len(gorush.requests) == 2
+    notifications = [n for r in gorush.requests for n in r["notifications"]]
+    assert [len(n["tokens"]) for n in notifications] == [1000, 1000, 500, 2]
+    assert [t for n in notifications[:3] for t in n["tokens"]] == tokens
+    assert notifications[3]["custom"] == {"order_id": 2}
+
+
+def test_connections_are_reused(gorush):
+    client = push._PushClient()
+    for i in range(5):
+        client.send_silent(f"tok{i}", {"type": "ping"})
+    assert len(gorush.requests) == 5
+    assert gorush.connections == 1
+
+
+class _FakeConn:
+    def __init__(self, error=None):
+        self.error = error
+        self.requests = 0
+
+    def request(self, *args, **kwargs):
+        self.requests += 1
+
+    def getresponse(self):
+        if self.error:
+            raise self.error
+        return _FakeResponse()
+
+    def close(self):
+        pass
+
+
+class _FakeResponse:
+    status = 200
+    will_close = True
+
+    def read(self):
+        return b"{}"
+
+
+def _pool_with(idle, fresh):
+    pool = push._HTTPPool("http://gorush.invalid/api/push", size=2, timeout=1)
+    pool._idle.put_nowait(idle)
+    pool._connect = lambda: fresh
+    return pool
+
+
+def test_stale_keepalive_connection_is_retried():
+    stale, fresh = _FakeConn(http.client.RemoteDisconnected("closed")), _FakeConn()
+    assert _pool_with(stale, fresh).post_json(b"{}") == (200, b"{}")
+    assert (stale.requests, fresh.requests) == (1, 1)
+
+
+def test_timeout_is_not_retried():
+    slow, fresh = _FakeConn(socket.timeout("timed out")), _FakeConn()
+    with pytest.raises(socket.timeout):
+        _pool_with(slow, fresh).post_json(b"{}")
+    # The push may have been delivered: never sent twice
+    assert (slow.requests, fresh.requests) == (1, 0)
+
+
+def test_invalid_tokens_are_reported_and_collapse_id_set(gorush):
+    client = push._PushClient()
+    invalid = client.send_batch([({"type": "order.accepted", "order_id": 9}, ["ok1", "dead1", "ok2"])])
+    assert invalid == ["dead1"]
+    (notification,) = gorush.requests[0]["notifications"]
+    assert notification["collapse_id"] == "order-9"
+
+
+def test_client_is_built_lazily_once(monkeypatch):
+    built = []
+
+    class _Counting(push._PushClient):
+        def __init__(self):
+            built.append(1)
+            super().__init__()
+
+    monkeypatch.delenv("GORUSH_URL", raising=False)
+    monkeypatch.setattr(push, "_client", None)
+    monkeypatch.setattr(push, "_PushClient", _Counting)
+    monkeypatch.setattr(push, "ready", threading.Event())
+    assert not push.ready.is_set()
+    # Unconfigured APNs: sends no-op and the negative result is cached
+    assert push.send_silent_batch([({"order_id": 1}, ["a"])]) == []
+    assert push.send_silent("b", {"order_id": 1}) == []
+    push.warm_up()
+    assert built == [1]
+    assert push.ready.is_set()
+
+
+def test_failed_client_init_is_cached_with_backoff(monkeypatch):
+    attempts = []
+
+    class _Broken(push._PushClient):
+        def __init__(self):
+            attempts.append(1)
+            raise RuntimeError("bad key material")
+
+    clock = [1000.0]
+    monkeypatch.setattr(push, "_client", None)
+    monkeypatch.setattr(push, "_init_error", None)
+    monkeypatch.setattr(push, "_PushClient", _Broken)
+    monkeypatch.setattr(push, "ready", threading.Event())
+    monkeypatch.setattr(push.time, "monotonic", lambda: clock[0])
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            push.send_silent("a", {"order_id": 1})
+    assert attempts == [1] and not push.ready.is_set()
+    clock[0] += push.INIT_RETRY_SECONDS
+    with pytest.raises(RuntimeError):
+        push.send_silent("a", {"order_id": 1})
+    assert attempts == [1, 1]
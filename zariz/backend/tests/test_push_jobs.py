@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete
+
+from app.core.config import settings
+from app.db.models.device import Device
+from app.db.models.push_job import PushJob
+from app.worker import jobs, push
+
+
+def _reset(db):
+    db.execute(delete(PushJob))
+    db.commit()
+
+
+def _make_due(db):
+    for job in db.query(PushJob).all():
+        job.next_attempt_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+
+
+def test_delivered_jobs_are_deleted(db_session):
+    _reset(db_session)
+    jobs.enqueue_jobs(db_session, [({"order_id": 1}, ["a", "b"]), ({"order_id": 2}, ["c"])])
+    db_session.commit()
+    calls = []
+    assert jobs.process_batch(db_session, send_batch=calls.extend) == 3
+    assert sorted((d["order_id"], tuple(t)) for d, t in calls) == [(1, ("a", "b")), (2, ("c",))]
+    assert db_session.query(PushJob).count() == 0
+
+
+def test_failed_tokens_back_off_then_dead_letter(db_session, monkeypatch):
+    _reset(db_session)
+    monkeypatch.setattr(settings, "push_max_attempts", 2)
+    jobs.enqueue_jobs(db_session, [({"order_id": 1}, ["ok", "bad"])])
+    db_session.commit()
+
+    def send(groups):
+        raise push.PushDeliveryError("gorush failed", ["bad"])
+
+    assert jobs.process_batch(db_session, send_batch=send) == 2
+    (job,) = db_session.query(PushJob).all()
+    assert (job.token, job.status, job.attempts) == ("bad", "pending", 1)
+    # Not due until the backoff elapses
+    assert jobs.process_batch(db_session, send_batch=send) == 0
+
+    _make_due(db_session)
+    assert jobs.process_batch(db_session, send_batch=send) == 1
+    db_session.refresh(job)
+    assert (job.status, job.attempts) == ("dead", 2)
+    _make_due(db_session)
+    assert jobs.process_batch(db_session, send_batch=send) == 0
+
+
+def test_retry_delay_grows_exponentially():
+    assert jobs.retry_delay(1) < jobs.retry_delay(3) < jobs.retry_delay(5)
+    assert jobs.retry_delay(50) <= settings.push_retry_max + 1
+
+
+def test_superseded_jobs_are_coalesced(db_session):
+    _reset(db_session)
+    for status in ("created", "accepted", "delivered"):
+        jobs.enqueue_jobs(db_session, [({"type": f"order.{status}", "order_id": 5}, ["tok"])])
+    db_session.commit()
+    calls = []
+    assert jobs.process_batch(db_session, send_batch=calls.extend) == 3
+    assert calls == [({"type": "order.delivered", "order_id": 5}, ["tok"])]
+    assert db_session.query(PushJob).count() == 0
+
+
+def test_invalid_tokens_prune_devices_and_are_not_retried(db_session):
+    _reset(db_session)
+    db_session.execute(delete(Device).where(Device.token.in_(["dead", "live"])))
+    db_session.add_all([Device(user_id=1, platform="ios", token="dead"), Device(user_id=1, platform="ios", token="live")])
+    jobs.enqueue_jobs(db_session, [({"order_id": 1}, ["dead", "live"])])
+    db_session.commit()
+
+    def send(groups):
+        raise push.PushDeliveryError("gorush failed", ["dead", "live"], invalid_tokens=["dead"])
+
+    assert jobs.process_batch(db_session, send_batch=send) == 2
+    assert [j.token for j in db_session.query(PushJob).all()] == ["live"]
+    assert {d.token for d in db_session.query(Device).filter(Device.token.in_(["dead", "live"]))} == {"live"}
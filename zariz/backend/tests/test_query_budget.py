@@ -0,0 +1,95 @@
+import logging
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+from app.core.middleware import RequestLogMiddleware
+from app.core.security import create_access_token
+from app.db.instrumentation import QueryBudgetExceeded, statement_shape
+from app.db.models.order import Order
+from app.db.models.user import User
+
+
+def _loop_app(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/loop.db")
+    app = FastAPI()
+
+    @app.get("/loop/{n}")
+    def loop(n: int):
+        with engine.connect() as conn:
+            for i in range(n):
+                conn.execute(text("select :i"), {"i": i})
+        return {}
+
+    app.add_middleware(RequestLogMiddleware)
+    return app
+
+
+def test_server_timing_and_log_fields(tmp_path, caplog):
+    client = TestClient(_loop_app(tmp_path))
+    with caplog.at_level(logging.INFO, logger="app"):
+        r = client.get("/loop/2")
+    assert r.headers["Server-Timing"].startswith("db;dur=")
+    assert 'desc="2 statements"' in r.headers["Server-Timing"]
+    (record,) = [rec.fields for rec in caplog.records if rec.name == "app"]
+    assert record["db_statements"] == 2 and record["db_ms"] >= 0
+
+
+def test_strict_mode_fails_repeated_statements(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "sql_strict", True)
+    monkeypatch.setattr(settings, "sql_repeat_budget", 3)
+    client = TestClient(_loop_app(tmp_path))
+    assert client.get("/loop/3").status_code == 200
+    with pytest.raises(QueryBudgetExceeded, match="4x the same statement"):
+        client.get("/loop/4")
+
+
+def test_budget_overrun_is_logged_when_not_strict(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "sql_strict", False)
+    monkeypatch.setattr(settings, "sql_statement_budget", 2)
+    monkeypatch.setattr(settings, "sql_repeat_budget", 0)
+    client = TestClient(_loop_app(tmp_path))
+    with caplog.at_level(logging.INFO, logger="app"):
+        assert client.get("/loop/5").status_code == 200
+    (warning,) = [rec for rec in caplog.records if rec.levelno == logging.WARNING]
+    assert warning.fields["route"] == "/loop/{n}"
+    assert warning.fields["problems"] == ["5 statements (budget 2)"]
+
+
+def test_statement_shape_ignores_in_list_length():
+    assert statement_shape("SELECT a FROM t WHERE id IN (?, ?, ?)") == statement_shape("SELECT a FROM t WHERE id IN (?, ?)")
+    assert statement_shape("SELECT a FROM t WHERE id IN (%(id_1)s, %(id_2)s)") == "SELECT a FROM t WHERE id IN (...)"
+
+
+def test_courier_list_is_one_query(client, db_session):
+    # Previously one load query per courier; the strict repeat budget would reject it
+    for i in range(settings.sql_repeat_budget + 3):
+        u = User(role="courier", name=f"c{i}", phone=f"+1{uuid.uuid4().int % 10**9}", password_hash="!", capacity_boxes=8)
+        db_session.add(u)
+        db_session.flush()
+        db_session.add(
+            Order(
+                store_id=1,
+                courier_id=u.id,
+                status="claimed",
+                pickup_address="A",
+                delivery_address="Street 1",
+                recipient_first_name="Test",
+                recipient_last_name="User",
+                phone="000",
+                street="Street",
+                building_no="1",
+                boxes_count=i % 3,
+                boxes_multiplier=1,
+                price_total=35,
+            )
+        )
+    db_session.commit()
+    r = client.get("/v1/couriers", headers={"Authorization": f"Bearer {create_access_token(sub='1', role='admin')}"})
+    assert r.status_code == 200
+    loads = {row["name"]: row["load_boxes"] for row in r.json()}
+    assert loads["c4"] == 1 and loads["c5"] == 2
@@ -0,0 +1,102 @@
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+from sqlalchemy import create_engine
+from starlette.requests import Request
+
+from app.core import limits as limits_module
+from app.core.limits import SharedTokenBucketStorage, TokenBucketStorage, identity_key
+from app.core.security import create_access_token
+from app.db.base import Base
+
+
+def _request(headers=None):
+    raw = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "headers": raw, "client": ("203.0.113.7", 1234)})
+
+
+class _Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+
+def test_identity_key_prefers_token_subject():
+    token = create_access_token(sub="42", role="courier")
+    assert identity_key(_request({"Authorization": f"Bearer {token}"})) == "user:42"
+    assert identity_key(_request({"Authorization": "Bearer not-a-token"})) == "ip:203.0.113.7"
+    assert identity_key(_request()) == "ip:203.0.113.7"
+
+
+def test_storage_schemes_are_registered():
+    assert isinstance(storage_from_string("zariz-local://"), TokenBucketStorage)
+    assert isinstance(storage_from_string("zariz-db://"), SharedTokenBucketStorage)
+
+
+def test_token_bucket_admits_burst_then_refills(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(limits_module, "time", clock)
+    limiter = FixedWindowRateLimiter(TokenBucketStorage())
+    item = parse("3/minute")
+    assert [limiter.hit(item, "user:1") for _ in range(4)] == [True, True, True, False]
+    assert limiter.hit(item, "user:2")
+    # One token every 20 seconds; refused hits consumed nothing
+    clock.now += 19
+    assert not limiter.hit(item, "user:1")
+    clock.now += 1
+    assert limiter.hit(item, "user:1")
+    assert not limiter.hit(item, "user:1")
+    stats = limiter.get_window_stats(item, "user:1")
+    assert stats.remaining == 0 and stats.reset_time == clock.now + 60
+
+
+def _shared(engine):
+    # No sync thread: the tests decide when each worker syncs
+    return SharedTokenBucketStorage(engine=engine, sync_interval=0)
+
+
+def test_shared_buckets_span_workers(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(limits_module, "time", clock)
+    engine = create_engine(f"sqlite:///{tmp_path}/limits.db")
+    Base.metadata.create_all(engine)
+    a, b = FixedWindowRateLimiter(_shared(engine)), FixedWindowRateLimiter(_shared(engine))
+    item = parse("3/minute")
+
+    assert all(a.hit(item, "user:1") for _ in range(3))
+    assert a.storage.sync() == 1
+    # Worker b has never seen the key: it starts full locally, its first sync adopts the shared level
+    assert b.hit(item, "user:1")
+    assert b.storage.sync() == 1
+    assert not b.hit(item, "user:1")
+    # b's extra admit left the shared bucket in debt; a's refused hit makes it sync and see it too
+    assert not a.hit(item, "user:1")
+    assert a.storage.sync() == 1
+    # The debt is paid back before the key admits again (one token per 20s)
+    clock.now += 20
+    assert not a.hit(item, "user:1")
+    assert not b.hit(item, "user:1")
+    clock.now += 20
+    assert b.hit(item, "user:1")
+
+
+def test_shared_sync_failure_keeps_local_limits(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(limits_module, "time", clock)
+    engine = create_engine(f"sqlite:///{tmp_path}/missing-table.db")
+    storage = _shared(engine)
+    limiter = FixedWindowRateLimiter(storage)
+    item = parse("2/minute")
+    assert limiter.hit(item, "ip:1") and limiter.hit(item, "ip:1")
+    assert storage.sync() == 0
+    assert not limiter.hit(item, "ip:1")
+    # Nothing is lost: the consumption is pushed once the table exists
+    Base.metadata.create_all(engine)
+    assert storage.sync() == 1
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT tokens FROM rate_limit_buckets").scalar_one() == 0
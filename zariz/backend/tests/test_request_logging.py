@@ -0,0 +1,76 @@
+import json
+import logging
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.middleware import RequestLogMiddleware
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/whoami")
+    async def whoami(request: Request):
+        return {"request_id": request.state.request_id}
+
+    @app.post("/reject")
+    async def reject(payload: dict):
+        raise HTTPException(status_code=422, detail="nope")
+
+    @app.post("/accept")
+    async def accept(payload: dict):
+        return {"n": len(payload["blob"])}
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for i in range(3):
+                yield f"data: {i}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    app.add_middleware(RequestLogMiddleware)
+    return app
+
+
+def _records(caplog):
+    return [r.fields for r in caplog.records if r.name == "app"]
+
+
+def test_request_id_is_echoed_or_generated(caplog):
+    client = TestClient(_app())
+    with caplog.at_level(logging.INFO, logger="app"):
+        echoed = client.get("/whoami", headers={"X-Request-ID": "abc-123"})
+        generated = client.get("/whoami")
+    assert echoed.headers["X-Request-ID"] == "abc-123"
+    assert echoed.json() == {"request_id": "abc-123"}
+    assert generated.headers["X-Request-ID"] == generated.json()["request_id"]
+    assert [r["request_id"] for r in _records(caplog)] == ["abc-123", generated.headers["X-Request-ID"]]
+
+
+def test_error_logs_truncated_request_body(caplog):
+    client = TestClient(_app())
+    body = json.dumps({"blob": "x" * 2000})
+    with caplog.at_level(logging.INFO, logger="app"):
+        assert client.post("/reject", content=body, headers={"Content-Type": "application/json"}).status_code == 422
+        ok = client.post("/accept", content=body, headers={"Content-Type": "application/json"})
+    # The handler still sees the whole body
+    assert ok.json() == {"n": 2000}
+    failed, succeeded = _records(caplog)
+    assert failed["status_code"] == 422 and failed["method"] == "POST" and failed["path"] == "/reject"
+    assert failed["request_body"] == body[:500]
+    assert succeeded["status_code"] == 200 and "request_body" not in succeeded
+
+
+def test_streaming_response_passes_through(caplog):
+    client = TestClient(_app())
+    with caplog.at_level(logging.INFO, logger="app"):
+        with client.stream("GET", "/stream") as resp:
+            assert resp.headers["content-type"].startswith("text/event-stream")
+            assert "X-Request-ID" in resp.headers
+            chunks = list(resp.iter_text())
+    assert "".join(chunks) == "data: 0\n\ndata: 1\n\ndata: 2\n\n"
+    (record,) = _records(caplog)
+    assert record["path"] == "/stream" and record["status_code"] == 200
@@ -0,0 +1,75 @@
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+from app.core.middleware import RequestLogMiddleware
+from app.db.slow_queries import fingerprint, normalize, parameter_shape, plan_capture, scrub_plan
+
+
+def test_normalize_and_fingerprint():
+    a = normalize("SELECT * FROM orders WHERE id IN (?, ?, ?) AND status = 'new'  LIMIT 10")
+    b = normalize("SELECT * FROM orders WHERE id IN (?, ?) AND status = 'claimed' LIMIT 50")
+    assert a == b == "SELECT * FROM orders WHERE id IN (...) AND status = ? LIMIT ?"
+    assert fingerprint(a) == fingerprint(b)
+    assert normalize("SELECT coalesce_1 FROM t WHERE x = %(x_1)s") == "SELECT coalesce_1 FROM t WHERE x = %(x_1)s"
+
+
+def test_parameter_shape_hides_values():
+    assert parameter_shape({"email": "a@b.c", "id": 3}, False) == {"email": "str", "id": "int"}
+    assert parameter_shape([(1, "x"), (2, "y")], True) == {"rows": 2, "row": ["int", "str"]}
+
+
+def test_plan_literals_are_scrubbed():
+    # psycopg2 inlines bound values, so Postgres plans quote them back in their conditions
+    plan = [{"Plan": {
+        "Node Type": "Index Scan",
+        "Index Name": "ix_users_email_lower",
+        "Index Cond": "(lower((email)::text) = 'alice@example.com'::text)",
+        "Filter": "((phone)::text = ANY ('{+15550001,+15550002}'::text[]) AND (id > 42))",
+        "Total Cost": 8.3,
+    }}]
+    node = scrub_plan(plan)[0]["Plan"]
+    assert node["Index Cond"] == "(lower((email)::text) = ?::text)"
+    assert node["Filter"] == "((phone)::text = ANY (?::text[]) AND (id > ?))"
+    assert node["Index Name"] == "ix_users_email_lower" and node["Total Cost"] == 8.3
+
+
+def test_slow_statement_logged_with_route_and_plan(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "slow_query_ms", 0.000001)
+    engine = create_engine(f"sqlite:///{tmp_path}/slow.db")
+    with engine.begin() as conn:
+        conn.execute(text("create table items (id integer primary key, name text)"))
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int):
+        with engine.connect() as conn:
+            for _ in range(2):
+                conn.execute(text("select name from items where id = :id"), {"id": item_id})
+        return {}
+
+    app.add_middleware(RequestLogMiddleware)
+    with caplog.at_level(logging.INFO, logger="app.slow_query"):
+        TestClient(app).get("/items/7")
+        plan_capture.join()
+    slow = [r.fields for r in caplog.records if r.getMessage() == "slow query" and "from items" in r.fields["sql"]]
+    assert len(slow) == 2
+    assert slow[0]["route"] == "/items/{item_id}"
+    assert slow[0]["params"] == ["int"]
+    # The plan is captured once per fingerprint
+    assert slow[0]["plan_queued"] is True and slow[1]["plan_queued"] is False
+    plans = [r.fields for r in caplog.records if r.getMessage() == "slow query plan" and r.fields["fingerprint"] == slow[0]["fingerprint"]]
+    assert len(plans) == 1
+    assert any("items" in step for step in plans[0]["plan"])
+
+
+def test_fast_statements_are_not_logged(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "slow_query_ms", 10_000)
+    engine = create_engine(f"sqlite:///{tmp_path}/fast.db")
+    with caplog.at_level(logging.INFO, logger="app.slow_query"):
+        with engine.connect() as conn:
+            conn.execute(text("select 1"))
+    assert not [r for r in caplog.records if r.name == "app.slow_query"]
@@ -0,0 +1,66 @@
+"""SSE connect-time snapshot and reconnect-storm behaviour."""
+import asyncio
+import json
+import re
+
+import httpx
+from sqlalchemy import event
+
+from app.main import app
+from app.core.security import create_access_token
+from app.services.snapshots import snapshot_cache
+
+
+def _snapshot_from(body: str) -> dict:
+    m = re.search(r"event: snapshot\ndata: (.*)\n\n", body)
+    assert m, body
+    return json.loads(m.group(1))
+
+
+def test_sse_snapshot_and_retry_hint(client, seeded_order):
+    snapshot_cache.clear()
+    token = create_access_token(sub="1", role="admin")
+    r = client.get(f"/v1/events/sse?once=1&snapshot=1&token={token}")
+    assert r.status_code == 200
+    body = r.content.decode()
+    retry = int(re.search(r"^retry: (\d+)$", body, re.M).group(1))
+    assert 3000 <= retry <= 10000
+    assert ":ok" in body
+    assert seeded_order in [o["id"] for o in _snapshot_from(body)["orders"]]
+
+
+def test_sse_snapshot_is_role_scoped(client, seeded_order, courier_token):
+    snapshot_cache.clear()
+    r = client.get(f"/v1/events/sse?once=1&snapshot=1&token={courier_token}")
+    assert _snapshot_from(r.content.decode())["orders"] == []
+
+
+def test_reconnect_storm_queries_once_per_scope(client, db_session, seeded_order):
+    """1,000 simultaneous reconnects in one scope cost a single snapshot query."""
+    snapshot_cache.clear()
+    token = create_access_token(sub="1", role="admin")
+    statements: list[str] = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", count)
+
+    async def storm() -> list[httpx.Response]:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            return await asyncio.gather(
+                *[ac.get(f"/v1/events/sse?once=1&snapshot=1&token={token}") for _ in range(1000)]
+            )
+
+    try:
+        responses = asyncio.run(storm())
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert all(r.status_code == 200 for r in responses)
+    assert len({_snapshot_from(r.text)["orders"][-1]["id"] for r in responses}) == 1
+    assert len(statements) == 1
+    # Reconnect hints are jittered rather than identical
+    assert len({re.search(r"retry: (\d+)", r.text).group(1) for r in responses}) > 1
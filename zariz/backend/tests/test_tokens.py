@@ -0,0 +1,48 @@
+import time
+
+import pytest
+from jose import jwt
+
+from app.core.config import settings
+from app.core.tokens import HS256Codec, JoseCodec, TokenError, VerifiedTokenCache, decode_token
+
+
+def _claims(**extra):
+    now = int(time.time())
+    return {"sub": "7", "role": "courier", "iat": now, "exp": now + 60, **extra}
+
+
+def test_native_codec_interoperates_with_jose():
+    native = HS256Codec(settings.jwt_secret)
+    claims = _claims(store_ids=[1, 2], session_id="5")
+    assert jwt.decode(native.encode(claims), settings.jwt_secret, algorithms=["HS256"]) == claims
+    assert native.decode(jwt.encode(claims, settings.jwt_secret, algorithm="HS256")) == claims
+    assert JoseCodec(settings.jwt_secret, "HS256").decode(native.encode(claims)) == claims
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "garbage",
+        HS256Codec("other-secret").encode(_claims()),
+        HS256Codec(settings.jwt_secret).encode(_claims(exp=int(time.time()) - 1)),
+        # alg=none with the signature stripped
+        jwt.encode(_claims(), settings.jwt_secret, algorithm="HS256").rsplit(".", 1)[0] + ".",
+        jwt.encode(_claims(), settings.jwt_secret, algorithm="HS384"),
+    ],
+)
+def test_native_codec_rejects_bad_tokens(token):
+    with pytest.raises(TokenError):
+        HS256Codec(settings.jwt_secret).decode(token)
+
+
+def test_verified_claims_are_cached_until_exp():
+    token = HS256Codec(settings.jwt_secret).encode(_claims())
+    assert decode_token(token) is decode_token(token)
+
+    cache = VerifiedTokenCache(maxsize=2)
+    cache.put("a", {"exp": time.time() + 60})
+    cache.put("b", {"exp": time.time() - 1})
+    cache.put("c", {"sub": "no exp"})
+    assert cache.get("a") is not None
+    assert cache.get("b") is None and cache.get("c") is None
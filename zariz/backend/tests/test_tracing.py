@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("opentelemetry.trace")
+from opentelemetry.trace import StatusCode
+
+from app.core import tracing
+from app.core.tracing import TailSamplingProcessor
+
+
+class _Collect:
+    def __init__(self):
+        self.spans = []
+
+    def on_end(self, span):
+        self.spans.append(span)
+
+
+def _span(trace_id, name, parent=True, ms=1, error=False):
+    return SimpleNamespace(
+        name=name,
+        context=SimpleNamespace(trace_id=trace_id),
+        parent=SimpleNamespace(is_remote=False) if parent else None,
+        status=SimpleNamespace(status_code=StatusCode.ERROR if error else StatusCode.UNSET),
+        start_time=0,
+        end_time=ms * 1_000_000,
+    )
+
+
+def _run(processor, trace_id, **root):
+    processor.on_end(_span(trace_id, "db.query"))
+    processor.on_end(_span(trace_id, "events.publish", error=root.pop("child_error", False)))
+    processor.on_end(_span(trace_id, "GET /x", parent=False, **root))
+
+
+def test_tail_sampler_keeps_slow_and_failed_traces():
+    sink = _Collect()
+    processor = TailSamplingProcessor(sink, slow_ms=100, sample_rate=0.0)
+    _run(processor, 1, ms=5)
+    assert sink.spans == []
+    _run(processor, 2, ms=250)
+    _run(processor, 3, ms=5, child_error=True)
+    assert [(s.context.trace_id, s.name) for s in sink.spans] == [
+        (2, "db.query"), (2, "events.publish"), (2, "GET /x"),
+        (3, "db.query"), (3, "events.publish"), (3, "GET /x"),
+    ]
+    assert processor._traces == {}
+
+
+def test_tail_sampler_samples_fast_traces_and_bounds_buffer():
+    sink = _Collect()
+    processor = TailSamplingProcessor(sink, slow_ms=100, sample_rate=1.0, max_traces=2)
+    _run(processor, 1, ms=5)
+    assert len(sink.spans) == 3
+    for trace_id in range(10, 15):  # children whose root never ends here
+        processor.on_end(_span(trace_id, "orphan"))
+    assert list(processor._traces) == [13, 14]
+
+
+def test_span_is_noop_when_disabled():
+    assert tracing._tracer is None
+    assert tracing.span("x") is tracing.span("y")
+    assert tracing.start_span("x") is None
+
+
+def test_request_spans_with_memory_exporter(client, monkeypatch):
+    pytest.importorskip("opentelemetry.sdk")
+    monkeypatch.setattr(tracing.settings, "otel_enabled", True)
+    monkeypatch.setattr(tracing.settings, "otel_exporter", "memory")
+    monkeypatch.setattr(tracing.settings, "otel_slow_ms", 0)
+    monkeypatch.setattr(tracing, "_tracer", None)
+    assert tracing.setup_tracing()
+    try:
+        client.get("/v1/orders", headers={"Authorization": "Bearer invalid"})
+        spans = tracing.memory_exporter.get_finished_spans()
+        server = [s for s in spans if s.name == "GET /v1/orders"]
+        assert server and server[0].attributes["http.response.status_code"] == 401
+    finally:
+        tracing._tracer = None